@@ -6,12 +6,125 @@ MODEL_BASE_DIR = "models"
 # Path to the Sentence Transformer model
 SENTENCE_TRANSFORMER_MODEL_PATH = os.path.join(MODEL_BASE_DIR, "sentence_transformers", "all-MiniLM-L6-v2")
 
-# Thresholds and parameters for PDF parsing
+# Embedding backend: "torch" runs the SentenceTransformer above (the reference),
+# "onnx" runs the int8-quantized ONNX export created by scripts/export_onnx.py
+EMBEDDING_BACKEND = "torch"
+ONNX_MODEL_DIR = os.path.join(MODEL_BASE_DIR, "onnx", "all-MiniLM-L6-v2")
+ONNX_MODEL_PATH = os.path.join(ONNX_MODEL_DIR, "model_int8.onnx")
+
+# Encode scheduling: texts are sorted by estimated token length and batched so that no
+# batch exceeds ENCODE_TOKEN_BUDGET padded tokens or ENCODE_MAX_ITEMS_PER_BATCH texts.
+# Texts longer than the model's token window are cut before tokenization ("truncate")
+# or split into window-sized chunks whose embeddings are mean-pooled ("chunk"). "chunk"
+# changes the vectors of long texts, so caches and indexes are kept apart per mode.
+ENCODE_TOKEN_BUDGET = 1024
+ENCODE_MAX_ITEMS_PER_BATCH = 64
+LONG_TEXT_MODE = "truncate"
+
+# Encoder processes: with ENCODER_WORKERS > 1, encode requests are split across that many
+# worker processes running ENCODER_THREADS intra-op threads each (0 divides the CPU cores
+# evenly). The workers are forked after the model is loaded and share its weights. Shards
+# hold at least ENCODER_MIN_TEXTS_PER_SHARD texts, so small requests use fewer workers.
+# With 0 or 1 worker the model runs in-process, on ENCODER_THREADS threads if positive
+# (0 keeps the library default). `benchmarks/tune_encoder.py` finds the best split.
+ENCODER_WORKERS = 0
+ENCODER_THREADS = 0
+ENCODER_MIN_TEXTS_PER_SHARD = 16
+
+# Thresholds and parameters for PDF parsing. Headings are short bold spans at least as
+# large as the body text of their document, capped at MIN_HEADING_FONT_SIZE
 MIN_WORDS_FOR_SUBSECTION = 10
 MIN_HEADING_FONT_SIZE = 12
 HEADING_MAX_WORDS = 20
 OCR_RESOLUTION_DPI = 300
 
+# Adaptive OCR of pages without a text layer: every page is first recognized at
+# OCR_FIRST_PASS_DPI and only re-rendered at OCR_RESOLUTION_DPI when the mean word
+# confidence (0-100) stays below OCR_MIN_CONFIDENCE. With OCR_WORKERS > 1, that many
+# processes share the scanned pages of a document when extraction itself runs serially
+# (0 or 1 runs OCR in-process; parallel extraction always uses its own pool).
+OCR_FIRST_PASS_DPI = 150
+OCR_MIN_CONFIDENCE = 70
+OCR_WORKERS = 0
+
+# Parallel extraction: number of worker processes (0 or 1 parses serially) and the
+# maximum number of pages of a single PDF handled by one worker task
+EXTRACTION_WORKERS = 0
+PAGES_PER_EXTRACTION_TASK = 50
+
+# Version of the section extraction logic. Bump it whenever the parser output changes
+# so that stale entries in the extraction cache are no longer used.
+PARSER_VERSION = 3
+
+# Persistent cache of parsed sections, keyed by PDF content hash and parser settings
+EXTRACTION_CACHE_DIR = os.path.join(".cache", "extraction")
+EXTRACTION_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Persistent cache of OCR results, keyed by the hash of the rendered page image and the OCR settings
+OCR_CACHE_DIR = os.path.join(".cache", "ocr")
+OCR_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Persistent cache of text embeddings, keyed by text hash and model identity.
+# Vectors are stored memory-mapped as 'float32' or 'float16'.
+EMBEDDING_CACHE_DIR = os.path.join(".cache", "embeddings")
+EMBEDDING_CACHE_MAX_ENTRIES = 200000
+EMBEDDING_CACHE_DTYPE = "float32"
+
+# Persistent corpus vector index (run.py --index_dir). Rows of removed or replaced
+# documents are reclaimed once they exceed INDEX_MAX_DEAD_FRACTION of the matrix. After
+# `scripts/corpus_index.py train` has partitioned the index into IVF lists (k-means with
+# IVF_ITERATIONS rounds), queries score only the IVF_PROBE lists nearest to the query.
+CORPUS_INDEX_DIR = os.path.join(".cache", "index")
+INDEX_MAX_DEAD_FRACTION = 0.5
+IVF_PROBE = 8
+IVF_ITERATIONS = 10
+
+# Ranking: number of results returned, size of the candidate pool that MMR
+# re-ranks, and the MMR trade-off between diversity (0.0) and relevance (1.0)
+TOP_K = 5
+CANDIDATE_POOL_SIZE = 25
+MMR_LAMBDA = 0.7
+
+# Optional lexical first stage: when LEXICAL_CANDIDATES is positive, only the top
+# LEXICAL_CANDIDATES sections and subsections by BM25 (plus texts whose embeddings are
+# already cached) are embedded and scored densely. 0 scores the whole corpus densely.
+LEXICAL_CANDIDATES = 0
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Optional hierarchical ranking: when HIERARCHICAL_SECTIONS is positive, sections are
+# scored first and only the subsections of the top HIERARCHICAL_SECTIONS sections are
+# embedded and ranked. 0 embeds every subsection (flat ranking).
+HIERARCHICAL_SECTIONS = 0
+
+# Optional near-duplicate removal before embedding: sections, then subsections, whose word
+# shingles overlap by an estimated Jaccard similarity of at least NEAR_DUPLICATE_THRESHOLD
+# are collapsed into their first occurrence, which lists the documents and pages of the
+# removed copies. Texts are compared by MinHash signatures of MINHASH_PERMUTATIONS hashes
+# over SHINGLE_WORDS-word shingles, and LSH banding limits the comparisons to likely
+# pairs. 0 keeps every passage.
+NEAR_DUPLICATE_THRESHOLD = 0.0
+MINHASH_PERMUTATIONS = 128
+SHINGLE_WORDS = 3
+
+# Streaming pipeline: texts per encode batch while parsing continues, and the number
+# of parsed documents that may wait for the encoder before parsing is paused
+STREAM_BATCH_SIZE = 256
+STREAM_MAX_QUEUED_DOCUMENTS = 4
+
+# Ranking service: bind address, directory the payload document names are relative to,
+# and the cross-request micro-batching of encode work (maximum texts per batch, maximum
+# wait for a batch to fill, and maximum queued chunks before requests are rejected)
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8080
+SERVICE_DOCUMENTS_DIR = os.path.join("data", "input")
+ENCODE_MAX_BATCH_SIZE = 64
+ENCODE_MAX_WAIT_MS = 10
+ENCODE_MAX_QUEUE_SIZE = 1024
+
+# Parsed documents kept in memory between requests (least recently used ones are dropped first)
+DOCUMENT_STORE_MAX_DOCUMENTS = 256
+
 # Default Persona and Job-to-be-done for testing
 DEFAULT_PERSONA_ROLE = "Financial Analyst"
 DEFAULT_JOB_TASK = "Extract key financial indicators and market trends."
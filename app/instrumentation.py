@@ -0,0 +1,175 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+# Common time base, so that spans recorded by different recorders of a process line up in a trace
+_ORIGIN = time.perf_counter()
+
+class Instrumentation:
+    """
+    Collects timed spans, counters and observed values for one run.
+
+    Spans accumulate into per-name timers and are kept as trace events, which
+    `write_trace` saves as a Chrome trace (loadable in chrome://tracing or Perfetto) or as
+    JSON lines. `summary` condenses everything into the `metadata.performance` block.
+    Recording is thread-safe.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.events = []
+        self.timers = defaultdict(float)
+        self.timer_calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.observations = defaultdict(list)
+
+    def add_span(self, name, start, seconds, **args):
+        """Records a span that started at `start` (a `time.perf_counter` value) and took `seconds`."""
+        event = {
+            "name": name, "ph": "X", "ts": round((start - _ORIGIN) * 1e6, 1), "dur": round(seconds * 1e6, 1),
+            "pid": os.getpid(), "tid": threading.get_ident(),
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            self.events.append(event)
+            self.timers[name] += seconds
+            self.timer_calls[name] += 1
+
+    @contextmanager
+    def span(self, name, **args):
+        """Times the enclosed block as a span called `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, time.perf_counter() - start, **args)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def observe(self, name, value):
+        """Records one value of a distribution, such as an encode batch size."""
+        with self._lock:
+            self.observations[name].append(value)
+
+    def export(self):
+        """Returns the timers, counters and observations as plain dicts, e.g. to send them between processes."""
+        with self._lock:
+            return {
+                "timers": dict(self.timers),
+                "timer_calls": dict(self.timer_calls),
+                "counters": dict(self.counters),
+                "observations": {name: list(values) for name, values in self.observations.items()},
+            }
+
+    def merge(self, exported, events=()):
+        """Adds the exported state of another recorder, and optionally its trace events, to this one."""
+        with self._lock:
+            for name, seconds in exported.get("timers", {}).items():
+                self.timers[name] += seconds
+            for name, calls in exported.get("timer_calls", {}).items():
+                self.timer_calls[name] += calls
+            for name, amount in exported.get("counters", {}).items():
+                self.counters[name] += amount
+            for name, values in exported.get("observations", {}).items():
+                self.observations[name].extend(values)
+            self.events.extend(events)
+
+    def summary(self):
+        """Returns the timers, counters and distribution statistics for the output metadata."""
+        exported = self.export()
+        distributions = {
+            name: {
+                "count": len(values),
+                "min": min(values),
+                "mean": round(sum(values) / len(values), 2),
+                "max": max(values),
+                "total": sum(values),
+            }
+            for name, values in exported["observations"].items() if values
+        }
+        return {
+            "timers": {
+                name: {"seconds": round(seconds, 4), "calls": exported["timer_calls"].get(name, 0)}
+                for name, seconds in sorted(exported["timers"].items())
+            },
+            "counters": dict(sorted(exported["counters"].items())),
+            "distributions": dict(sorted(distributions.items())),
+        }
+
+    def write_trace(self, trace_file):
+        """
+        Writes the recorded spans, followed by the final counter values. A `.jsonl` file
+        gets one event per line; anything else a Chrome trace JSON document.
+        """
+        with self._lock:
+            events = sorted(self.events, key=lambda event: event["ts"])
+            counters = dict(self.counters)
+        end = round((time.perf_counter() - _ORIGIN) * 1e6, 1)
+        events += [
+            {"name": name, "ph": "C", "ts": end, "pid": os.getpid(), "tid": 0, "args": {"value": value}}
+            for name, value in sorted(counters.items())
+        ]
+
+        trace_dir = os.path.dirname(trace_file)
+        if trace_dir:
+            os.makedirs(trace_dir, exist_ok=True)
+        with open(trace_file, 'w', encoding='utf-8') as f:
+            if trace_file.endswith(".jsonl"):
+                for event in events:
+                    f.write(json.dumps(event, ensure_ascii=False) + "\n")
+            else:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+# The recorder of the current run. Instrumentation calls are no-ops while none is active.
+# It is a context variable, so that runs on different threads, such as concurrent
+# requests of the HTTP service, each record into their own recorder. New threads start
+# without one; threads working for a run are started through `in_current_context`.
+_active = contextvars.ContextVar("instrumentation_recorder", default=None)
+
+@contextmanager
+def recording(instrumentation):
+    """Makes `instrumentation` the active recorder of the current thread for the enclosed block."""
+    token = _active.set(instrumentation)
+    try:
+        yield instrumentation
+    finally:
+        _active.reset(token)
+
+def active():
+    """Returns the active recorder, or None."""
+    return _active.get()
+
+def in_current_context(target):
+    """Wraps a thread target so that it records into the recorder active where it was wrapped."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(target, *args, **kwargs)
+
+def span(name, **args):
+    recorder = _active.get()
+    return recorder.span(name, **args) if recorder is not None else nullcontext()
+
+def add_span(name, start, seconds, **args):
+    recorder = _active.get()
+    if recorder is not None:
+        recorder.add_span(name, start, seconds, **args)
+
+def increment(name, amount=1):
+    recorder = _active.get()
+    if recorder is not None:
+        recorder.increment(name, amount)
+
+def observe(name, value):
+    recorder = _active.get()
+    if recorder is not None:
+        recorder.observe(name, value)
+
+def merge(exported):
+    recorder = _active.get()
+    if recorder is not None:
+        recorder.merge(exported)
@@ -1,15 +1,17 @@
 
 import datetime
+from app.config import TOP_K
 
-def format_output(documents_metadata, persona_role, job_task, processing_time, ranked_sections, ranked_subsections):
+def format_output(documents_metadata, persona_role, job_task, processing_time, ranked_sections, ranked_subsections, top_k=TOP_K, performance=None):
     """
-    Formats the final results into the required JSON structure, limited to the top 5
-    most relevant sections and subsections.
+    Formats the final results into the required JSON structure, limited to the top `top_k`
+    (5 by default) most relevant sections and subsections. An optional `performance`
+    dict is added to the metadata as is.
     """
     
-    # --- NEW: Take only the top 5 from the pre-ranked lists ---
-    top_5_sections = ranked_sections[:5]
-    top_5_subsections = ranked_subsections[:5]
+    # --- NEW: Take only the top k from the pre-ranked lists ---
+    top_5_sections = ranked_sections[:top_k]
+    top_5_subsections = ranked_subsections[:top_k]
 
     # Filter out internal scores before creating the final output
     final_sections = [
@@ -32,4 +34,6 @@ def format_output(documents_metadata, persona_role, job_task, processing_time, r
         "extracted_sections": final_sections,
         "subsection_analysis": final_subsections
     }
+    if performance is not None:
+        output_data["metadata"]["performance"] = performance
     return output_data
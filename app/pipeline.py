@@ -0,0 +1,381 @@
+import os
+import re
+import json
+import time
+import queue
+import threading
+from contextlib import closing
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from app import instrumentation
+from app.processing.pdf_parser import extract_documents, iter_documents
+from app.processing.corpus import Corpus
+from app.ranking.streaming import StreamingRanker
+from app.io.formatter import format_output
+from app.config import (
+    EXTRACTION_WORKERS, TOP_K, CANDIDATE_POOL_SIZE, MMR_LAMBDA, STREAM_BATCH_SIZE, STREAM_MAX_QUEUED_DOCUMENTS,
+    DOCUMENT_STORE_MAX_DOCUMENTS,
+)
+
+def parse_request(input_data, input_dir):
+    """
+    Reads the persona, task and documents of one request.
+
+    Returns:
+        A tuple of (persona_role, job_task, documents_metadata, pdf_paths). PDF paths are
+        resolved relative to `input_dir`.
+    """
+    persona_role = input_data['persona']['role']
+    job_task = input_data['job_to_be_done']['task']
+    documents_metadata = input_data['documents']
+    pdf_paths = [os.path.join(input_dir, doc['filename']) for doc in documents_metadata]
+    return persona_role, job_task, documents_metadata, pdf_paths
+
+def _unique_request_id(request_id, seen):
+    """Turns a request id into a file name safe to put in the output directory, unique within the batch."""
+    request_id = re.sub(r'[^A-Za-z0-9._-]+', '_', request_id).strip('._') or "request"
+    unique, n = request_id, 1
+    while unique in seen:
+        n += 1
+        unique = f"{request_id}-{n}"
+    seen.add(unique)
+    return unique
+
+def load_requests(batch_path):
+    """
+    Loads the requests of a batch.
+
+    Args:
+        batch_path: Either a directory of input JSON files or a JSONL file with one input
+            JSON object per line. PDFs are looked up next to the JSON file (or the JSONL file).
+
+    Returns:
+        A list of (request_id, input_data, input_dir) tuples. The request id is the file name
+        for directories, and the object's `request_id` field or its line number for JSONL.
+        Ids are reduced to file-name characters and made unique (`id`, `id-2`, ...), as
+        they name the output files. Files and lines that are not valid JSON are returned
+        with `input_data` set to None.
+    """
+    requests, seen = [], set()
+    if os.path.isdir(batch_path):
+        for name in sorted(os.listdir(batch_path)):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(batch_path, name), 'r', encoding='utf-8') as f:
+                    input_data = json.load(f)
+            except (OSError, UnicodeDecodeError, json.JSONDecodeError):
+                input_data = None
+            requests.append((_unique_request_id(os.path.splitext(name)[0], seen), input_data, batch_path))
+        return requests
+
+    input_dir = os.path.dirname(batch_path)
+    with open(batch_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                input_data = json.loads(line)
+            except json.JSONDecodeError:
+                input_data = None
+            request_id = f"line{line_number:04d}"
+            if isinstance(input_data, dict) and input_data.get('request_id'):
+                request_id = str(input_data['request_id'])
+            requests.append((_unique_request_id(request_id, seen), input_data, input_dir))
+    return requests
+
+def _file_signature(path):
+    """Returns the (size, modification time) of a file, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+class DocumentStore:
+    """
+    Keeps parsed documents in memory as columnar `Corpus` objects so that requests
+    referencing the same PDFs share one extraction. Documents are keyed by their
+    absolute path and validated by file size and modification time, so a replaced PDF
+    is parsed again. At most `max_documents` are kept, least recently used first out.
+
+    The store is safe to share between threads: documents are parsed outside its lock,
+    and a document requested while another thread parses it is waited for, not parsed twice.
+    """
+    def __init__(self, workers: int = EXTRACTION_WORKERS, cache=None, ocr_cache=None, lexical_index: bool = False,
+                 max_documents: int = DOCUMENT_STORE_MAX_DOCUMENTS):
+        """
+        Initializes the DocumentStore.
+
+        Args:
+            workers: Number of extraction worker processes, see `extract_all_documents`.
+            cache: Optional persistent `ExtractionCache` consulted for documents not yet in memory.
+            ocr_cache: Optional persistent `OcrCache` for pages without a text layer.
+            lexical_index: Build the BM25 index of every document as soon as it is parsed,
+                for engines with a lexical first stage.
+            max_documents: Maximum number of parsed documents kept in memory.
+        """
+        self.workers = workers
+        self.cache = cache
+        self.ocr_cache = ocr_cache
+        self.lexical_index = lexical_index
+        self.max_documents = max_documents
+        self.documents = OrderedDict()  # absolute path -> (file signature, corpus)
+        self._pending = {}  # absolute path -> (file signature, future corpus) of documents being parsed
+        self._lock = threading.Lock()
+
+    def get_corpus(self, pdf_paths):
+        """Returns a `Corpus` of the given PDFs in order, parsing only documents not seen before or changed since."""
+        keys = [os.path.abspath(path) for path in pdf_paths]
+        corpora, waiting, claimed = {}, {}, {}
+        with self._lock:
+            for key, path in dict(zip(keys, pdf_paths)).items():
+                signature = _file_signature(path)
+                entry = self.documents.get(key)
+                pending = self._pending.get(key)
+                if entry is not None and entry[0] == signature:
+                    self.documents.move_to_end(key)
+                    corpora[key] = entry[1]
+                elif pending is not None and pending[0] == signature:
+                    waiting[key] = pending[1]
+                else:
+                    claimed[key] = (path, signature, Future())
+                    self._pending[key] = (signature, claimed[key][2])
+        if corpora:
+            print(f" -> Reusing {len(corpora)} already parsed document(s).")
+
+        if claimed:
+            try:
+                parsed = dict(extract_documents([path for path, _, _ in claimed.values()], workers=self.workers,
+                                                cache=self.cache, ocr_cache=self.ocr_cache))
+                for key, (path, signature, future) in claimed.items():
+                    corpus = None
+                    if path in parsed:
+                        corpus = Corpus.from_sections(parsed[path])
+                        if self.lexical_index:
+                            corpus.ensure_lexical_index()
+                    future.set_result(corpus)
+            except BaseException as e:
+                for _, _, future in claimed.values():
+                    if not future.done():
+                        future.set_exception(e)
+                raise
+            finally:
+                with self._lock:
+                    for key, (_, signature, future) in claimed.items():
+                        if self._pending.get(key, (None, None))[1] is future:
+                            del self._pending[key]
+                        if future.exception() is None and future.result() is not None:
+                            self.documents[key] = (signature, future.result())
+                            self.documents.move_to_end(key)
+                    while len(self.documents) > self.max_documents:
+                        self.documents.popitem(last=False)
+            corpora.update((key, future.result()) for key, (_, _, future) in claimed.items())
+
+        corpora.update((key, future.result()) for key, future in waiting.items())
+        return Corpus.concatenate(corpora[key] for key in keys if corpora.get(key) is not None)
+
+def process_request(input_data, input_dir, ranking_engine, document_store,
+                    top_k=TOP_K, pool_size=CANDIDATE_POOL_SIZE, lambda_val=MMR_LAMBDA, start_time=None,
+                    performance=False):
+    """
+    Runs extraction, ranking and formatting for one request.
+
+    Args:
+        input_data: The parsed input JSON.
+        input_dir: Directory the document file names are relative to.
+        ranking_engine: A (possibly already warm) `RankingEngine`.
+        document_store: The `DocumentStore` providing the parsed corpus.
+        top_k, pool_size, lambda_val: Ranking parameters, see `RankingEngine.rank`.
+        start_time: Optional start timestamp included in the reported processing time.
+        performance: Whether to add the timers and counters of the active recorder (see
+            `app.instrumentation`) to the output metadata.
+
+    Returns:
+        A tuple of the formatted output (None if no content could be extracted) and a dict
+        of stage timings in seconds.
+    """
+    start_time = time.time() if start_time is None else start_time
+    persona_role, job_task, documents_metadata, pdf_paths = parse_request(input_data, input_dir)
+
+    # Extract content from the specified list of documents
+    print(f"📄 Extracting content from {len(pdf_paths)} PDF(s)...")
+    extraction_start = time.time()
+    with instrumentation.span("extraction", documents=len(pdf_paths)):
+        corpus = document_store.get_corpus(pdf_paths)
+    timings = {"extraction_seconds": time.time() - extraction_start}
+    if not corpus.num_sections:
+        return None, timings
+
+    # Perform the ranking
+    print("🧠 Ranking sections and subsections...")
+    ranking_start = time.time()
+    query = f"{persona_role}. {job_task}"
+    with instrumentation.span("ranking"):
+        ranked_sections, ranked_subsections = ranking_engine.rank(
+            query, corpus, top_k=top_k, pool_size=pool_size, lambda_val=lambda_val
+        )
+    timings["ranking_seconds"] = time.time() - ranking_start
+
+    processing_time = time.time() - start_time
+    timings["total_seconds"] = processing_time
+    final_output = format_output(
+        documents_metadata, persona_role, job_task,
+        processing_time, ranked_sections, ranked_subsections, top_k=top_k,
+        performance=_performance_block(timings) if performance else None,
+    )
+    return final_output, timings
+
+def process_request_group(requests, ranking_engine, document_store,
+                          top_k=TOP_K, pool_size=CANDIDATE_POOL_SIZE, lambda_val=MMR_LAMBDA, performance=False):
+    """
+    Runs requests over the same documents together: the corpus is extracted and embedded
+    once and all persona/task queries are scored in one pass with `RankingEngine.rank_many`.
+
+    Args:
+        requests: A list of (input_data, input_dir) pairs whose documents resolve to the same PDFs.
+        ranking_engine, document_store, top_k, pool_size, lambda_val, performance: See `process_request`.
+
+    Returns:
+        One (formatted output, timings) tuple per request, in order. The output is None if
+        no content could be extracted. Extraction and ranking timings cover the whole group.
+    """
+    start_time = time.time()
+    parsed = [parse_request(input_data, input_dir) for input_data, input_dir in requests]
+    pdf_paths = parsed[0][3]
+
+    print(f"📄 Extracting content from {len(pdf_paths)} PDF(s) for {len(requests)} request(s)...")
+    extraction_start = time.time()
+    with instrumentation.span("extraction", documents=len(pdf_paths)):
+        corpus = document_store.get_corpus(pdf_paths)
+    timings = {"extraction_seconds": time.time() - extraction_start}
+    if not corpus.num_sections:
+        return [(None, dict(timings)) for _ in requests]
+
+    print(f"🧠 Ranking sections and subsections for {len(requests)} queries...")
+    ranking_start = time.time()
+    queries = [f"{persona_role}. {job_task}" for persona_role, job_task, _, _ in parsed]
+    with instrumentation.span("ranking", queries=len(queries)):
+        rankings = ranking_engine.rank_many(queries, corpus, top_k=top_k, pool_size=pool_size, lambda_val=lambda_val)
+    timings["ranking_seconds"] = time.time() - ranking_start
+    timings["total_seconds"] = time.time() - start_time
+
+    results = []
+    for (persona_role, job_task, documents_metadata, _), (ranked_sections, ranked_subsections) in zip(parsed, rankings):
+        final_output = format_output(
+            documents_metadata, persona_role, job_task,
+            timings["total_seconds"], ranked_sections, ranked_subsections, top_k=top_k,
+            performance=_performance_block(timings) if performance else None,
+        )
+        results.append((final_output, dict(timings)))
+    return results
+
+def _performance_block(timings):
+    """Combines the stage timings of a request with the timers and counters of the active recorder."""
+    recorder = instrumentation.active()
+    block = recorder.summary() if recorder is not None else {}
+    block["stages_seconds"] = {name.replace("_seconds", ""): round(seconds, 4) for name, seconds in timings.items()}
+    return block
+
+_END_OF_STREAM = object()
+
+def iter_in_background(iterable, max_queued):
+    """
+    Consumes an iterable on a background thread and yields its items through a bounded
+    queue, so that producing the next items overlaps with processing the current one.
+    Exceptions raised by the producer are re-raised in the consumer. If the consumer
+    stops early (or raises), the producer stops at its next item and closes the
+    iterable, so e.g. an extraction generator shuts its worker pool down.
+    """
+    items = queue.Queue(maxsize=max_queued)
+    stopped = threading.Event()
+
+    def put(entry):
+        """Queues an entry, giving up once the consumer has stopped. Returns whether it was queued."""
+        while not stopped.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put((item, None)):
+                    break
+        except BaseException as e:
+            put((None, e))
+        finally:
+            close = getattr(iterator, "close", None)
+            if stopped.is_set() and close is not None:
+                close()
+            put((_END_OF_STREAM, None))
+
+    threading.Thread(target=instrumentation.in_current_context(produce), name="document-producer", daemon=True).start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is _END_OF_STREAM:
+                return
+            yield item
+    finally:
+        stopped.set()
+
+def process_request_streaming(input_data, input_dir, ranking_engine, workers=EXTRACTION_WORKERS, cache=None, ocr_cache=None,
+                              top_k=TOP_K, pool_size=CANDIDATE_POOL_SIZE, lambda_val=MMR_LAMBDA,
+                              batch_size=STREAM_BATCH_SIZE, start_time=None, performance=False):
+    """
+    Runs a request as a streaming pipeline: documents are parsed on a background thread
+    (and worker processes) while the sections parsed so far are encoded in fixed-size
+    batches and folded into a bounded pool of top candidates. End-to-end latency is then
+    close to the slower of parsing and encoding instead of their sum, and the full corpus
+    is never held in memory.
+
+    Takes the same arguments as `process_request`, with `workers`, `cache` and `ocr_cache` configuring
+    extraction and `batch_size` the number of texts per encode call.
+
+    Returns:
+        A tuple of the formatted output (None if no content could be extracted) and a dict
+        of timings in seconds.
+    """
+    start_time = time.time() if start_time is None else start_time
+    persona_role, job_task, documents_metadata, pdf_paths = parse_request(input_data, input_dir)
+
+    print(f"📄 Streaming {len(pdf_paths)} PDF(s) through extraction and ranking...")
+    pipeline_start = time.time()
+    query = f"{persona_role}. {job_task}"
+    ranker = StreamingRanker(ranking_engine, query, pool_size=pool_size, batch_size=batch_size)
+    documents = iter_documents(pdf_paths, workers=workers, cache=cache, ocr_cache=ocr_cache)
+    # Closing the stream stops the producer should ranking fail
+    with instrumentation.span("pipeline", documents=len(pdf_paths)), \
+            closing(iter_in_background(documents, STREAM_MAX_QUEUED_DOCUMENTS)) as stream:
+        for _, sections in stream:
+            ranker.add(sections)
+        ranked_sections, ranked_subsections = ranker.finish(top_k=top_k, lambda_val=lambda_val)
+    timings = {"pipeline_seconds": time.time() - pipeline_start}
+    if not ranker.sections_seen and not ranker.subsections_seen:
+        return None, timings
+
+    processing_time = time.time() - start_time
+    timings["total_seconds"] = processing_time
+    final_output = format_output(
+        documents_metadata, persona_role, job_task,
+        processing_time, ranked_sections, ranked_subsections, top_k=top_k,
+        performance=_performance_block(timings) if performance else None,
+    )
+    return final_output, timings
+
+def write_json(data, output_file):
+    """Writes a JSON document, creating the parent directory if needed."""
+    output_dir = os.path.dirname(output_file)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
@@ -0,0 +1,209 @@
+import os
+import hashlib
+import pickle
+import tempfile
+import zlib
+from app.config import (
+    MIN_WORDS_FOR_SUBSECTION, MIN_HEADING_FONT_SIZE, HEADING_MAX_WORDS, OCR_RESOLUTION_DPI,
+    OCR_FIRST_PASS_DPI, OCR_MIN_CONFIDENCE, PARSER_VERSION, EXTRACTION_CACHE_DIR,
+    EXTRACTION_CACHE_MAX_BYTES, OCR_CACHE_DIR, OCR_CACHE_MAX_BYTES,
+)
+
+CACHE_FILE_SUFFIX = ".sections"
+OCR_CACHE_FILE_SUFFIX = ".ocr"
+
+def file_content_hash(path, chunk_size=1 << 20):
+    """Returns the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def parser_settings_fingerprint():
+    """Summarizes every parser setting that influences the extracted sections."""
+    settings = (
+        PARSER_VERSION, MIN_HEADING_FONT_SIZE, HEADING_MAX_WORDS,
+        MIN_WORDS_FOR_SUBSECTION, ocr_settings_fingerprint(),
+    )
+    return hashlib.sha256(repr(settings).encode('utf-8')).hexdigest()[:16]
+
+def ocr_settings_fingerprint():
+    """Summarizes every OCR setting that influences the recognized text of a page."""
+    settings = (OCR_FIRST_PASS_DPI, OCR_RESOLUTION_DPI, OCR_MIN_CONFIDENCE)
+    return hashlib.sha256(repr(settings).encode('utf-8')).hexdigest()[:16]
+
+def _write_atomically(path, payload):
+    """Writes a cache entry through a temporary file so readers never see a partial entry."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _touch(path):
+    """Refreshes the modification time of a cache entry, which orders the LRU eviction."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass  # Evicted by another process in the meantime
+
+def _discard(path):
+    """Deletes an unreadable cache entry, so it is not read again on every lookup."""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def _evict_least_recently_used(cache_dir, suffix, max_bytes):
+    """Removes the oldest entries ending in `suffix` until their total size fits within `max_bytes`."""
+    entries = []
+    with os.scandir(cache_dir) as it:
+        for entry in it:
+            if entry.name.endswith(suffix):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total_size -= size
+        except OSError:
+            pass
+
+class ExtractionCache:
+    """
+    A content-addressed on-disk cache of extracted sections.
+
+    Entries are keyed by the SHA-256 of the PDF bytes plus a fingerprint of the parser
+    settings, so renamed or copied files still hit while any change to the parsing
+    thresholds invalidates old entries. Sections are stored as zlib-compressed pickles.
+    The total size is capped; when it is exceeded the least recently used entries
+    (tracked through the file modification time, refreshed on every hit) are evicted.
+    """
+    def __init__(self, cache_dir: str = EXTRACTION_CACHE_DIR, max_bytes: int = EXTRACTION_CACHE_MAX_BYTES):
+        """
+        Initializes the ExtractionCache.
+
+        Args:
+            cache_dir: Directory in which cache entries are stored. Created if missing.
+            max_bytes: Upper bound on the total size of all entries.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.settings_fingerprint = parser_settings_fingerprint()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key_for(self, pdf_path):
+        """Returns the cache key for a PDF file."""
+        return f"{file_content_hash(pdf_path)}-{self.settings_fingerprint}"
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key + CACHE_FILE_SUFFIX)
+
+    def get(self, key, filename):
+        """
+        Loads cached sections for a key.
+
+        Args:
+            key: The key returned by `key_for`.
+            filename: The file name to report in the sections. Entries are content-addressed,
+                so the same bytes may have been cached under a different name.
+
+        Returns:
+            The list of sections, or None on a cache miss. Entries that cannot be read back,
+            such as truncated files or pickles of older record layouts, count as misses and
+            are deleted.
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                payload = f.read()
+        except OSError:
+            return None
+        try:
+            sections = pickle.loads(zlib.decompress(payload))
+            for section in sections:
+                section["filename"] = filename
+                for sub in section.get("subsections", []):
+                    sub["filename"] = filename
+        except Exception:
+            _discard(path)
+            return None
+        _touch(path)  # Mark the entry as recently used
+        return sections
+
+    def put(self, key, sections):
+        """Stores the sections of one document and enforces the size cap."""
+        payload = zlib.compress(pickle.dumps(sections, protocol=pickle.HIGHEST_PROTOCOL))
+        try:
+            _write_atomically(self._entry_path(key), payload)
+        except OSError as e:
+            print(f"Warning: Could not write extraction cache entry: {e}")
+            return
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits within `max_bytes`."""
+        _evict_least_recently_used(self.cache_dir, CACHE_FILE_SUFFIX, self.max_bytes)
+
+class OcrCache:
+    """
+    An on-disk cache of OCR results for single pages.
+
+    Entries are keyed by the hash of the rendered page image plus a fingerprint of the
+    OCR settings, so a page is recognized once no matter which file or position it
+    appears in. The text is stored zlib-compressed; size capping and LRU eviction work
+    as in `ExtractionCache`.
+    """
+    def __init__(self, cache_dir: str = OCR_CACHE_DIR, max_bytes: int = OCR_CACHE_MAX_BYTES):
+        """
+        Initializes the OcrCache.
+
+        Args:
+            cache_dir: Directory in which cache entries are stored. Created if missing.
+            max_bytes: Upper bound on the total size of all entries.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.settings_fingerprint = ocr_settings_fingerprint()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key_for(self, image_hash):
+        """Returns the cache key for a page image hash."""
+        return f"{image_hash}-{self.settings_fingerprint}"
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key + OCR_CACHE_FILE_SUFFIX)
+
+    def get(self, key):
+        """Returns the cached text for a key, or None on a cache miss. Unreadable entries are deleted."""
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                payload = f.read()
+        except OSError:
+            return None
+        try:
+            text = zlib.decompress(payload).decode('utf-8')
+        except Exception:
+            _discard(path)
+            return None
+        _touch(path)  # Mark the entry as recently used
+        return text
+
+    def put(self, key, text):
+        """Stores the text of one page and enforces the size cap."""
+        try:
+            _write_atomically(self._entry_path(key), zlib.compress(text.encode('utf-8')))
+        except OSError as e:
+            print(f"Warning: Could not write OCR cache entry: {e}")
+            return
+        _evict_least_recently_used(self.cache_dir, OCR_CACHE_FILE_SUFFIX, self.max_bytes)
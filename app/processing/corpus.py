@@ -0,0 +1,184 @@
+import numpy as np
+
+from app.ranking.lexical import LexicalIndex
+
+class SectionRecord:
+    """
+    A single section of a `Corpus`, materialized only for the sections that are returned.
+    `duplicates` lists the (document, page number) of near-duplicate copies it stands for.
+    """
+    __slots__ = ("document", "page_number", "section_title", "text", "duplicates")
+
+    def __init__(self, document, page_number, section_title, text, duplicates=()):
+        self.document = document
+        self.page_number = page_number
+        self.section_title = section_title
+        self.text = text
+        self.duplicates = duplicates
+
+class SubsectionRecord:
+    """A single subsection of a `Corpus` with the offset of its parent section, see `SectionRecord`."""
+    __slots__ = ("document", "page_number", "text", "section", "duplicates")
+
+    def __init__(self, document, page_number, text, section, duplicates=()):
+        self.document = document
+        self.page_number = page_number
+        self.text = text
+        self.section = section
+        self.duplicates = duplicates
+
+class Corpus:
+    """
+    A columnar store of extracted sections and subsections.
+
+    Instead of one dict per section and per subsection, every field is kept in its own
+    column: integer arrays for pages and for ids into interned `documents` and `titles`
+    tables, plain lists for the texts, and for each subsection the integer offset of its
+    parent section. Ranking works on these columns and on contiguous embedding matrices
+    indexed the same way, and only builds `SectionRecord`/`SubsectionRecord` objects for
+    the few results it returns.
+
+    A BM25 `LexicalIndex` of the texts is built on demand by `ensure_lexical_index`;
+    concatenating corpora that all have one merges their indexes.
+
+    After near-duplicate removal (`app.processing.dedup`), `section_duplicates` and
+    `subsection_duplicates` map the offset of a representative to the (document, page
+    number) references of the copies it replaced.
+    """
+    def __init__(self, documents=None, titles=None, section_document=None, section_title=None,
+                 section_page=None, section_text=None, subsection_section=None, subsection_page=None,
+                 subsection_text=None):
+        self.documents = documents or []
+        self.titles = titles or []
+        self.section_document = _int_column(section_document)
+        self.section_title = _int_column(section_title)
+        self.section_page = _int_column(section_page)
+        self.section_text = section_text or []
+        self.subsection_section = _int_column(subsection_section)
+        self.subsection_page = _int_column(subsection_page)
+        self.subsection_text = subsection_text or []
+        self.lexical_index = None
+        self.section_duplicates = {}
+        self.subsection_duplicates = {}
+
+    @classmethod
+    def from_sections(cls, sections):
+        """
+        Builds a corpus from the section dicts produced by `extract_all_documents`.
+        Subsections without text are dropped; a subsection's document is its parent's.
+        """
+        documents, titles = {}, {}
+        section_document, section_title, section_page, section_text = [], [], [], []
+        subsection_section, subsection_page, subsection_text = [], [], []
+
+        for offset, section in enumerate(sections):
+            section_document.append(documents.setdefault(section.get('filename'), len(documents)))
+            section_title.append(titles.setdefault(section.get('section_title', ''), len(titles)))
+            section_page.append(section.get('page_number', 0))
+            section_text.append(section.get('text', ''))
+            for sub in section.get('subsections', []):
+                if sub.get('text'):
+                    subsection_section.append(offset)
+                    subsection_page.append(sub.get('page_number', 0))
+                    subsection_text.append(sub['text'])
+
+        return cls(
+            list(documents), list(titles), section_document, section_title, section_page, section_text,
+            subsection_section, subsection_page, subsection_text,
+        )
+
+    @classmethod
+    def concatenate(cls, corpora):
+        """Joins several corpora into a new one, re-interning their document and title tables."""
+        corpora = list(corpora)
+        documents, titles = {}, {}
+        section_document, section_title, subsection_section = [], [], []
+        section_offset = 0
+        for corpus in corpora:
+            document_ids = np.array([documents.setdefault(d, len(documents)) for d in corpus.documents], dtype=np.int32)
+            title_ids = np.array([titles.setdefault(t, len(titles)) for t in corpus.titles], dtype=np.int32)
+            section_document.append(document_ids[corpus.section_document])
+            section_title.append(title_ids[corpus.section_title])
+            subsection_section.append(corpus.subsection_section + section_offset)
+            section_offset += corpus.num_sections
+
+        corpus = cls(
+            list(documents), list(titles),
+            _concat(section_document), _concat(section_title), _concat([c.section_page for c in corpora]),
+            [text for c in corpora for text in c.section_text],
+            _concat(subsection_section), _concat([c.subsection_page for c in corpora]),
+            [text for c in corpora for text in c.subsection_text],
+        )
+        if corpora and all(c.lexical_index is not None for c in corpora):
+            corpus.lexical_index = LexicalIndex.concatenate(c.lexical_index for c in corpora)
+        return corpus
+
+    def subset(self, section_ids, subsection_ids):
+        """
+        Returns a corpus of the given sections and subsections, both as ascending offsets.
+        The parent section of every given subsection must be among the sections.
+        """
+        section_ids = np.asarray(section_ids, dtype=np.int64)
+        subsection_ids = np.asarray(subsection_ids, dtype=np.int64)
+        corpus = type(self)(
+            self.documents, self.titles, self.section_document[section_ids], self.section_title[section_ids],
+            self.section_page[section_ids], [self.section_text[i] for i in section_ids],
+            np.searchsorted(section_ids, self.subsection_section[subsection_ids]), self.subsection_page[subsection_ids],
+            [self.subsection_text[j] for j in subsection_ids],
+        )
+        if self.lexical_index is not None:
+            corpus.lexical_index = self.lexical_index.subset(section_ids, subsection_ids)
+        corpus.section_duplicates = _subset_references(self.section_duplicates, section_ids)
+        corpus.subsection_duplicates = _subset_references(self.subsection_duplicates, subsection_ids)
+        return corpus
+
+    @property
+    def num_sections(self):
+        return len(self.section_text)
+
+    @property
+    def num_subsections(self):
+        return len(self.subsection_text)
+
+    def __len__(self):
+        return self.num_sections
+
+    def ensure_lexical_index(self):
+        """Returns the lexical index of the corpus, building it first if necessary."""
+        if self.lexical_index is None:
+            self.lexical_index = LexicalIndex.from_corpus(self)
+        return self.lexical_index
+
+    def section_titles(self, section_ids):
+        """Returns the titles of the given sections."""
+        return [self.titles[t] for t in self.section_title[section_ids]]
+
+    def sections_with_text(self):
+        """Returns the offsets of the sections that have body text and can be ranked."""
+        return np.array([i for i, text in enumerate(self.section_text) if text], dtype=np.int64)
+
+    def section(self, i):
+        i = int(i)
+        return SectionRecord(
+            self.documents[self.section_document[i]], int(self.section_page[i]),
+            self.titles[self.section_title[i]], self.section_text[i], self.section_duplicates.get(i, ()),
+        )
+
+    def subsection(self, j):
+        j = int(j)
+        parent = int(self.subsection_section[j])
+        return SubsectionRecord(
+            self.documents[self.section_document[parent]], int(self.subsection_page[j]),
+            self.subsection_text[j], parent, self.subsection_duplicates.get(j, ()),
+        )
+
+def _subset_references(references, ids):
+    """Re-keys duplicate references by the new offsets of the kept rows."""
+    positions = {int(old): new for new, old in enumerate(ids)}
+    return {positions[old]: refs for old, refs in references.items() if old in positions}
+
+def _int_column(values):
+    return np.asarray(values if values is not None else [], dtype=np.int32)
+
+def _concat(columns):
+    return np.concatenate(columns).astype(np.int32, copy=False) if columns else _int_column(None)
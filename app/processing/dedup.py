@@ -0,0 +1,183 @@
+import logging
+import zlib
+
+import numpy as np
+
+from app import instrumentation
+from app.ranking.lexical import tokenize
+from app.validators import near_duplicate_threshold
+from app.config import NEAR_DUPLICATE_THRESHOLD, MINHASH_PERMUTATIONS, SHINGLE_WORDS
+
+# MinHash permutations are drawn from the universal hash family h(x) = (a * x + b) mod p
+# over the Mersenne prime p = 2^31 - 1, so that a * x + b never overflows 64 bits
+MERSENNE_PRIME = (1 << 31) - 1
+
+def shingle_hashes(text: str, words: int = SHINGLE_WORDS) -> np.ndarray:
+    """
+    Returns the distinct hashes of the overlapping `words`-word shingles of a text (one
+    shingle for shorter texts, none for texts without words).
+    """
+    tokens = tokenize(text)
+    if not tokens:
+        return np.empty(0, dtype=np.uint64)
+    shingles = {" ".join(tokens[i:i + words]) for i in range(max(len(tokens) - words + 1, 1))}
+    return np.fromiter((zlib.crc32(s.encode('utf-8')) % MERSENNE_PRIME for s in shingles), dtype=np.uint64, count=len(shingles))
+
+def lsh_bands(threshold: float, permutations: int):
+    """
+    Chooses how a signature is split into LSH bands, returning (bands, rows per band).
+
+    Two texts become candidates when all rows of at least one band agree, which happens
+    with a probability that rises steeply around a similarity of (1 / bands) ^ (1 / rows).
+    The layout whose rise is the highest not above `threshold` is used, so that pairs at
+    the threshold are found with high probability; candidates are verified anyway.
+    """
+    layouts = [(bands, permutations // bands) for bands in range(1, permutations + 1) if permutations % bands == 0]
+    below = [layout for layout in layouts if (1 / layout[0]) ** (1 / layout[1]) <= threshold]
+    if not below:
+        return max(layouts, key=lambda layout: layout[0])
+    return max(below, key=lambda layout: (1 / layout[0]) ** (1 / layout[1]))
+
+class MinHasher:
+    """Computes MinHash signatures whose agreement estimates the Jaccard similarity of shingle sets."""
+    def __init__(self, permutations: int = MINHASH_PERMUTATIONS, shingle_words: int = SHINGLE_WORDS, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, MERSENNE_PRIME, size=permutations, dtype=np.uint64)
+        self.b = rng.integers(0, MERSENNE_PRIME, size=permutations, dtype=np.uint64)
+        self.shingle_words = shingle_words
+
+    @property
+    def permutations(self):
+        return len(self.a)
+
+    def signatures(self, texts) -> np.ndarray:
+        """Returns one signature row per text; every text must contain at least one word."""
+        signatures = np.empty((len(texts), self.permutations), dtype=np.uint32)
+        for i, text in enumerate(texts):
+            hashes = shingle_hashes(text, self.shingle_words)
+            signatures[i] = ((np.outer(self.a, hashes) + self.b[:, None]) % MERSENNE_PRIME).min(axis=1)
+        return signatures
+
+def near_duplicate_owners(texts, threshold: float, hasher: MinHasher = None) -> np.ndarray:
+    """
+    Finds near-duplicate texts.
+
+    Texts sharing an LSH bucket are candidates, and a candidate is a duplicate when the
+    signatures estimate a Jaccard similarity of at least `threshold`. Texts are visited in
+    order: the first text of a group represents it and claims every later, unclaimed text
+    similar to itself, so each duplicate is within the threshold of its representative.
+    Texts without any word have nothing to compare and are always kept.
+
+    Returns:
+        For every text the offset of the representative it duplicates, or -1 if it is kept.
+    """
+    owners = np.full(len(texts), -1, dtype=np.int64)
+    worded = np.array([i for i, text in enumerate(texts) if tokenize(text)], dtype=np.int64)
+    if len(worded) < 2:
+        return owners
+    hasher = hasher or MinHasher()
+    signatures = hasher.signatures([texts[i] for i in worded])
+    bands, rows = lsh_bands(threshold, hasher.permutations)
+
+    candidates = {}
+    for band in range(bands):
+        buckets = {}
+        for i, key in enumerate(signatures[:, band * rows:(band + 1) * rows]):
+            buckets.setdefault(key.tobytes(), []).append(i)
+        for bucket in buckets.values():
+            for i in bucket[:-1]:
+                candidates.setdefault(i, set()).update(bucket)
+
+    # Offsets below are among the worded texts
+    worded_owners = np.full(len(worded), -1, dtype=np.int64)
+    for i in sorted(candidates):
+        if worded_owners[i] >= 0:
+            continue
+        later = np.array(sorted(j for j in candidates[i] if j > i and worded_owners[j] < 0), dtype=np.int64)
+        if not len(later):
+            continue
+        similarities = (signatures[later] == signatures[i]).mean(axis=1)
+        worded_owners[later[similarities >= threshold]] = i
+
+    duplicates = worded_owners >= 0
+    owners[worded[duplicates]] = worded[worded_owners[duplicates]]
+    return owners
+
+def _add_reference(duplicates, representative, location, copy_location):
+    """Records the (document, page) of a copy under its representative, unless it is the representative's own."""
+    references = duplicates.setdefault(representative, [])
+    if copy_location != location and copy_location not in references:
+        references.append(copy_location)
+
+def remove_near_duplicates(corpus, threshold: float = NEAR_DUPLICATE_THRESHOLD, hasher: MinHasher = None):
+    """
+    Collapses near-duplicate passages of a corpus, e.g. boilerplate repeated across PDFs.
+
+    Sections are compared by their body text first; a duplicate section is removed together
+    with its subsections. Subsections are then compared among themselves, and every group
+    of near-duplicates is kept once, as its first member whose section was kept.
+    Every representative keeps the (document, page number) references of the copies it
+    replaces in the corpus' `section_duplicates` and `subsection_duplicates`.
+
+    Args:
+        corpus: The `Corpus` (or `IndexedCorpus`) to deduplicate.
+        threshold: Minimum estimated Jaccard similarity of the word shingles of two
+            passages for them to count as duplicates.
+        hasher: Optional `MinHasher`; one with the configured settings by default.
+
+    Returns:
+        The corpus without the duplicates, or the given corpus if it has none.
+    """
+    threshold = near_duplicate_threshold(threshold)
+    hasher = hasher or MinHasher()
+    section_ids = corpus.sections_with_text()
+    section_owners = near_duplicate_owners([corpus.section_text[i] for i in section_ids], threshold, hasher)
+    keep_sections = np.ones(corpus.num_sections, dtype=bool)
+    keep_sections[section_ids[section_owners >= 0]] = False
+
+    # Subsections of removed sections go with them, but still count as copies of the ones kept
+    subsection_owners = near_duplicate_owners(corpus.subsection_text, threshold, hasher)
+    keep_subsections = keep_sections[corpus.subsection_section]
+    groups = {}
+    for j in np.flatnonzero(subsection_owners >= 0):
+        groups.setdefault(int(subsection_owners[j]), [int(subsection_owners[j])]).append(int(j))
+    subsection_copies = {}
+    for members in groups.values():
+        kept = [j for j in members if keep_subsections[j]]
+        if kept:
+            keep_subsections[kept[1:]] = False
+            subsection_copies[kept[0]] = [j for j in members if j != kept[0]]
+
+    removed_sections = int((section_owners >= 0).sum())
+    removed_subsections = corpus.num_subsections - int(keep_subsections.sum())
+    instrumentation.increment("near_duplicate_sections_removed", removed_sections)
+    instrumentation.increment("near_duplicate_subsections_removed", removed_subsections)
+    if not removed_sections and not removed_subsections:
+        return corpus
+    logging.info(
+        f"Near-duplicate removal dropped {removed_sections} of {len(section_ids)} sections and "
+        f"{removed_subsections} of {corpus.num_subsections} subsections."
+    )
+
+    def section_location(i):
+        return corpus.documents[corpus.section_document[i]], int(corpus.section_page[i])
+
+    def subsection_location(j):
+        return corpus.documents[corpus.section_document[corpus.subsection_section[j]]], int(corpus.subsection_page[j])
+
+    kept_section_ids = np.flatnonzero(keep_sections)
+    kept_subsection_ids = np.flatnonzero(keep_subsections)
+    deduplicated = corpus.subset(kept_section_ids, kept_subsection_ids)
+
+    section_positions = {int(i): n for n, i in enumerate(kept_section_ids)}
+    for k in np.flatnonzero(section_owners >= 0):
+        representative = int(section_ids[section_owners[k]])
+        _add_reference(deduplicated.section_duplicates, section_positions[representative],
+                       section_location(representative), section_location(section_ids[k]))
+
+    subsection_positions = {int(j): n for n, j in enumerate(kept_subsection_ids)}
+    for representative, copies in sorted(subsection_copies.items()):
+        for j in copies:
+            _add_reference(deduplicated.subsection_duplicates, subsection_positions[representative],
+                           subsection_location(representative), subsection_location(j))
+    return deduplicated
@@ -0,0 +1,71 @@
+import hashlib
+
+from app import instrumentation
+from app.config import OCR_FIRST_PASS_DPI, OCR_RESOLUTION_DPI, OCR_MIN_CONFIDENCE
+
+def page_image_hash(pix):
+    """Returns a digest of a rendered page image, used as its OCR cache key."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{pix.width}x{pix.height}x{pix.n}".encode('ascii'))
+    digest.update(pix.samples)
+    return digest.hexdigest()
+
+def _ocr_image(pix):
+    """
+    Runs Tesseract on a rendered page.
+
+    Returns:
+        A tuple of the recognized text, with lines joined by newlines and paragraphs
+        separated by blank lines, and the mean word confidence (0-100).
+    """
+    # OCR is rare, so its libraries are only imported when a page needs it
+    from PIL import Image
+    import pytesseract
+
+    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+    data = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT)
+
+    paragraphs, confidences = {}, []
+    for i, word in enumerate(data["text"]):
+        confidence = float(data["conf"][i])
+        if confidence < 0 or not word.strip():
+            continue
+        confidences.append(confidence)
+        paragraph = paragraphs.setdefault((data["block_num"][i], data["par_num"][i]), {})
+        paragraph.setdefault(data["line_num"][i], []).append(word)
+
+    text = "\n\n".join(
+        "\n".join(" ".join(words) for words in lines.values()) for lines in paragraphs.values()
+    )
+    return text, (sum(confidences) / len(confidences) if confidences else 0.0)
+
+def ocr_page(page, cache=None):
+    """
+    OCRs one PDF page with adaptive resolution.
+
+    The page is first recognized at `OCR_FIRST_PASS_DPI`. Only if the mean word
+    confidence stays below `OCR_MIN_CONFIDENCE` is it rendered again at
+    `OCR_RESOLUTION_DPI`, keeping the more confident result. Results are stored in the
+    optional `OcrCache` under the hash of the first-pass image, so identical pages
+    (repeated scans, copies of a file) are recognized only once.
+    """
+    pix = page.get_pixmap(dpi=OCR_FIRST_PASS_DPI)
+    key = cache.key_for(page_image_hash(pix)) if cache is not None else None
+    if key is not None:
+        text = cache.get(key)
+        if text is not None:
+            instrumentation.increment("ocr_cache_hits")
+            return text
+
+    instrumentation.increment("pages_ocr")
+    with instrumentation.span("ocr_page", page=page.number + 1):
+        text, confidence = _ocr_image(pix)
+        if confidence < OCR_MIN_CONFIDENCE and OCR_RESOLUTION_DPI > OCR_FIRST_PASS_DPI:
+            instrumentation.increment("pages_ocr_second_pass")
+            second_text, second_confidence = _ocr_image(page.get_pixmap(dpi=OCR_RESOLUTION_DPI))
+            if second_confidence >= confidence:
+                text = second_text
+
+    if key is not None:
+        cache.put(key, text)
+    return text
@@ -2,129 +2,475 @@
 import os
 import re
 import fitz  # PyMuPDF
-from PIL import Image
-import pytesseract
-from app.config import MIN_WORDS_FOR_SUBSECTION, MIN_HEADING_FONT_SIZE, HEADING_MAX_WORDS, OCR_RESOLUTION_DPI
+import itertools
+from collections import deque
+import time
+from concurrent.futures import ProcessPoolExecutor
+from app import instrumentation
+from app.processing.ocr import ocr_page
+from app.config import (
+    MIN_WORDS_FOR_SUBSECTION, MIN_HEADING_FONT_SIZE, HEADING_MAX_WORDS,
+    EXTRACTION_WORKERS, PAGES_PER_EXTRACTION_TASK, OCR_WORKERS,
+)
+
+_CONTROL_CHARACTERS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]')
 
 def clean_text(text):
     """Cleans whitespace and removes non-printable characters from a string."""
     if not isinstance(text, str):
         return ""
     text = re.sub(r'\s+', ' ', text).strip()
-    text = re.sub(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]', '', text)
+    text = _CONTROL_CHARACTERS.sub('', text)
     return text
 
-def extract_text_with_ocr_fallback(doc, page_num):
+def _ocr_page_safely(page, ocr_cache=None):
+    """OCRs a page, reporting failures (e.g. a missing Tesseract binary) as an empty text."""
+    try:
+        return ocr_page(page, ocr_cache)
+    except Exception as e:
+        print(f"     OCR failed for page {page.number + 1}: {e}")
+        return ""
+
+def extract_text_with_ocr_fallback(doc, page_num, ocr_cache=None):
     """Extracts text from a page, falling back to OCR if the text layer is empty."""
     page = doc.load_page(page_num)
     text = page.get_text().strip()
     if not text:
         print(f"  -> No text layer on page {page_num + 1}. Attempting OCR...")
-        try:
-            pix = page.get_pixmap(dpi=OCR_RESOLUTION_DPI)
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            text = pytesseract.image_to_string(img)
-        except Exception as e:
-            print(f"     OCR failed for page {page_num + 1}: {e}")
-            text = ""
+        text = _ocr_page_safely(page, ocr_cache)
     return clean_text(text)
 
-def is_heading(span):
-    """Determines if a text span is likely a heading based on font properties."""
-    text = span.get("text", "").strip()
-    if not text:
-        return False
-    
-    font_size = span.get("size", 0)
-    is_bold = "bold" in span.get("font", "").lower()
-    word_count = len(text.split())
+def _ocr_pages_from_file(pdf_path, page_numbers, ocr_cache=None):
+    """OCRs the given (1-based) pages of a PDF and returns their raw texts by page number."""
+    texts = {}
+    with fitz.open(pdf_path) as doc:
+        for page_number in page_numbers:
+            texts[page_number] = _ocr_page_safely(doc.load_page(page_number - 1), ocr_cache)
+    return texts
 
-    return font_size >= MIN_HEADING_FONT_SIZE and is_bold and word_count <= HEADING_MAX_WORDS
+# Text blocks only: images are neither needed nor decoded (`page.get_images()` still
+# detects scanned pages)
+TEXT_EXTRACTION_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
 
-def extract_sections_from_file(pdf_path):
+def heading_font_threshold(font_sizes):
     """
-    Extracts sections from a PDF using a stateful approach that tracks sections across pages.
+    Returns the minimum heading font size of a document from its font statistics.
+
+    Headings must be set at least as large as the body text, i.e. the font size that
+    carries most characters of the document, but never need to exceed `MIN_HEADING_FONT_SIZE`.
+    The threshold is therefore never above the fixed `MIN_HEADING_FONT_SIZE` rule, so every
+    heading that rule accepted is still accepted. Documents with a body font smaller than
+    `MIN_HEADING_FONT_SIZE` additionally get headings from their short bold lead-ins set
+    in body-sized or larger text.
+
+    Args:
+        font_sizes: Number of characters per font size (rounded to 0.1 pt).
+    """
+    if not font_sizes:
+        return MIN_HEADING_FONT_SIZE
+    body_size = max(font_sizes, key=lambda size: (font_sizes[size], -size))
+    return min(body_size, MIN_HEADING_FONT_SIZE)
+
+def _collect_page_blocks(pdf_path, start_page=0, end_page=None):
+    """
+    Reads the text blocks of a range of pages and tags each one as a heading candidate or
+    body text.
+
+    Returns a list of (page_number, heading, text) tuples in reading order and the number
+    of characters per font size of the range. `heading` is False for body text and a
+    (font_size, title) pair for blocks starting with a short bold span, which
+    `_resolve_headings` turns into headings or body text once the font statistics of the
+    whole document are known. Blocks are kept flat so that page ranges parsed by different
+    workers can be stitched back together. A page that has images but no text layer is
+    represented by a single (page_number, None, None) placeholder, which
+    `_ocr_missing_pages` replaces.
+    """
+    page_blocks = []
+    font_sizes = {}
+    doc = fitz.open(pdf_path)
+    try:
+        end_page = doc.page_count if end_page is None else min(end_page, doc.page_count)
+        instrumentation.increment("pages_parsed", max(end_page - start_page, 0))
+        for page_num in range(start_page, end_page):
+            page = doc.load_page(page_num)
+            blocks = page.get_text("dict", flags=TEXT_EXTRACTION_FLAGS).get("blocks", [])
+            blocks_before = len(page_blocks)
+            for b in blocks:
+                if b['type'] != 0:
+                    continue
+                # Same result as joining the `clean_text` of every span, with one
+                # control-character pass per block instead of two regex passes per span
+                parts = []
+                for l in b['lines']:
+                    for s in l['spans']:
+                        words = s['text'].split()
+                        parts.append(" ".join(words))
+                        size = round(s['size'], 1)
+                        font_sizes[size] = font_sizes.get(size, 0) + len(s['text'])
+                block_text = _CONTROL_CHARACTERS.sub('', "".join(parts))
+                if not block_text:
+                    continue
+
+                first_span = b["lines"][0]["spans"][0]
+                if parts[0] and parts[0].count(" ") < HEADING_MAX_WORDS and "bold" in first_span.get("font", "").lower():
+                    title = _CONTROL_CHARACTERS.sub('', parts[0])
+                    page_blocks.append((page_num + 1, (round(first_span.get("size", 0), 1), title), block_text))
+                else:
+                    page_blocks.append((page_num + 1, False, block_text))
+            if len(page_blocks) == blocks_before and page.get_images():
+                page_blocks.append((page_num + 1, None, None))
+    finally:
+        doc.close()
+    return page_blocks, font_sizes
+
+def _resolve_headings(page_blocks, font_sizes):
+    """
+    Decides which heading candidates of `_collect_page_blocks` are headings, using the font
+    statistics of the whole document (see `heading_font_threshold`).
+
+    Returns:
+        The blocks as (page_number, is_heading, text) tuples. Headings carry their title.
+    """
+    threshold = heading_font_threshold(font_sizes)
+    resolved = []
+    for page_number, heading, text in page_blocks:
+        if heading:
+            font_size, title = heading
+            if font_size >= threshold:
+                resolved.append((page_number, True, title))
+                continue
+            heading = False
+        resolved.append((page_number, heading, text))
+    return resolved
+
+def _ocr_paragraphs(text):
+    """Splits OCR output into cleaned body blocks, one per paragraph."""
+    return [p for p in (clean_text(p) for p in re.split(r'\n\s*\n', text)) if p]
+
+def _ocr_missing_pages(pdf_path, page_blocks, ocr_cache=None, executor=None, workers=None):
+    """
+    OCRs the pages that `_collect_page_blocks` found without a text layer and splices
+    their paragraphs into the block list as body text.
+
+    The pages are spread over `executor` when one is given (the pool of the parallel
+    extraction), otherwise over a pool of `workers` processes (default `OCR_WORKERS`) if
+    there is more than one page to recognize. Either way they are submitted as at most
+    `workers` batches of consecutive pages, so every task opens the PDF once.
+
+    Returns:
+        The completed block list and the raw OCR texts by page number, which the
+        page-based fallback reuses instead of recognizing the pages again.
+    """
+    scanned_pages = [page_number for page_number, heading, _ in page_blocks if heading is None]
+    if not scanned_pages:
+        return page_blocks, {}
+
+    print(f"  -> {len(scanned_pages)} page(s) without a text layer in {os.path.basename(pdf_path)}. Running OCR...")
+    workers = OCR_WORKERS if workers is None else workers
+    ocr_texts = {}
+    if executor is None and (not workers or workers <= 1 or len(scanned_pages) == 1):
+        ocr_texts = _ocr_pages_from_file(pdf_path, scanned_pages, ocr_cache)
+    else:
+        pool = None
+        if executor is None:
+            executor = pool = ProcessPoolExecutor(max_workers=min(workers, len(scanned_pages)))
+        try:
+            batch_size = -(-len(scanned_pages) // max(workers, 1))
+            futures = [
+                executor.submit(_safe_ocr_pages, pdf_path, scanned_pages[i:i + batch_size], ocr_cache)
+                for i in range(0, len(scanned_pages), batch_size)
+            ]
+            for future in futures:
+                texts, error, stats = future.result()
+                instrumentation.merge(stats)
+                if error:
+                    print(f"     OCR failed in {os.path.basename(pdf_path)}: {error}")
+                    continue
+                ocr_texts.update(texts)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    filled_blocks = []
+    for page_number, heading, text in page_blocks:
+        if heading is None:
+            filled_blocks.extend((page_number, False, p) for p in _ocr_paragraphs(ocr_texts.get(page_number, "")))
+        else:
+            filled_blocks.append((page_number, heading, text))
+    return filled_blocks, ocr_texts
+
+def _close_section(section):
+    """Joins the collected content blocks of a section and derives its subsections."""
+    content_blocks = section.pop("content_blocks")
+    section["text"] = "\n\n".join(content_blocks)
+    section["subsections"] = [{"text": p, "page_number": section["page_number"], "filename": section["filename"]} for p in content_blocks if len(p.split()) >= MIN_WORDS_FOR_SUBSECTION]
+    return section
+
+def _build_sections(filename, page_blocks):
+    """
+    Assembles tagged page blocks into sections using a stateful approach that tracks sections across pages.
     """
     all_sections = []
     current_section = None
 
+    for page_number, heading, text in page_blocks:
+        if heading:
+            if current_section:
+                all_sections.append(_close_section(current_section))
+
+            current_section = {
+                "filename": filename,
+                "page_number": page_number,
+                "section_title": text,
+                "content_blocks": [],
+            }
+        elif current_section:
+            current_section["content_blocks"].append(text)
+
+    if current_section:
+        all_sections.append(_close_section(current_section))
+    return all_sections
+
+def _extract_page_sections(pdf_path, ocr_texts=None, ocr_cache=None):
+    """
+    Builds one section per page, used when no headings could be detected in a document.
+    Pages found in `ocr_texts` (raw OCR output by page number) are not recognized again.
+    """
+    all_sections = []
+    filename = os.path.basename(pdf_path)
+    ocr_texts = ocr_texts or {}
+    doc = fitz.open(pdf_path)
     try:
-        doc = fitz.open(pdf_path)
-        for page_num, page in enumerate(doc):
-            blocks = page.get_text("dict").get("blocks", [])
-            for b in blocks:
-                if b['type'] == 0:
-                    block_text = "".join([clean_text(s['text']) for l in b['lines'] for s in l['spans']])
-                    if not block_text:
-                        continue
-
-                    first_span = b["lines"][0]["spans"][0]
-                    if is_heading(first_span):
-                        if current_section:
-                            full_text = "\n\n".join(current_section["content_blocks"])
-                            subsections = [{"text": p, "page_number": current_section["page_number"], "filename": current_section["filename"]} for p in current_section["content_blocks"] if len(p.split()) >= MIN_WORDS_FOR_SUBSECTION]
-                            
-                            current_section["text"] = full_text
-                            current_section["subsections"] = subsections
-                            del current_section["content_blocks"]
-                            all_sections.append(current_section)
-
-                        current_section = {
-                            "filename": os.path.basename(pdf_path),
-                            "page_number": page_num + 1,
-                            "section_title": clean_text(first_span['text']),
-                            "content_blocks": [],
-                        }
-                    elif current_section:
-                        current_section["content_blocks"].append(block_text)
-
-        if current_section:
-            full_text = "\n\n".join(current_section["content_blocks"])
-            subsections = [{"text": p, "page_number": current_section["page_number"], "filename": current_section["filename"]} for p in current_section["content_blocks"] if len(p.split()) >= MIN_WORDS_FOR_SUBSECTION]
-            current_section["text"] = full_text
-            current_section["subsections"] = subsections
-            del current_section["content_blocks"]
-            all_sections.append(current_section)
+        for i in range(doc.page_count):
+            if i + 1 in ocr_texts:
+                page_text = clean_text(ocr_texts[i + 1])
+            else:
+                page_text = extract_text_with_ocr_fallback(doc, i, ocr_cache)
+            if page_text:
+                subsections = [{"text": page_text, "page_number": i + 1, "filename": filename}]
+                all_sections.append({
+                    "filename": filename,
+                    "page_number": i + 1,
+                    "section_title": f"Page {i + 1} Content",
+                    "text": page_text,
+                    "subsections": subsections
+                })
+    finally:
+        doc.close()
+    return all_sections
 
+def extract_sections_from_file(pdf_path, ocr_cache=None):
+    """
+    Extracts sections from a PDF using a stateful approach that tracks sections across pages.
+    Pages without a text layer are OCRed; `ocr_cache` is an optional `OcrCache`.
+    """
+    filename = os.path.basename(pdf_path)
+    try:
+        page_blocks, ocr_texts = _ocr_missing_pages(pdf_path, _resolve_headings(*_collect_page_blocks(pdf_path)), ocr_cache)
+        all_sections = _build_sections(filename, page_blocks)
         if not all_sections:
-            print(f"  -> No structured sections found in {os.path.basename(pdf_path)}. Falling back to page-based extraction.")
-            for i in range(doc.page_count):
-                page_text = extract_text_with_ocr_fallback(doc, i)
-                if page_text:
-                    subsections = [{"text": page_text, "page_number": i + 1, "filename": os.path.basename(pdf_path)}]
-                    all_sections.append({
-                        "filename": os.path.basename(pdf_path),
-                        "page_number": i + 1,
-                        "section_title": f"Page {i + 1} Content",
-                        "text": page_text,
-                        "subsections": subsections
-                    })
-        doc.close()
+            print(f"  -> No structured sections found in {filename}. Falling back to page-based extraction.")
+            all_sections = _extract_page_sections(pdf_path, ocr_texts, ocr_cache)
     except Exception as e:
-        print(f"Error processing {os.path.basename(pdf_path)}: {e}")
-    
+        print(f"Error processing {filename}: {e}")
+        return []
+
     return all_sections
 
-def extract_all_documents(pdf_paths: list):
+def _run_in_worker(fn, *args):
     """
-    Loops through a given list of PDF paths and extracts their content.
+    Runs a parsing function in a worker process, reporting failures instead of raising
+    them. Returns its result, the error message (or None) and the counters it recorded.
     """
-    all_extracted_data = []
+    recorder = instrumentation.Instrumentation()
+    with instrumentation.recording(recorder):
+        try:
+            result, error = fn(*args), None
+        except Exception as e:
+            result, error = [], str(e)
+    return result, error, recorder.export()
 
-    # --- CHANGED: The function now iterates over the provided list of file paths ---
-    if not pdf_paths:
-        print("Warning: No PDF document paths were provided for processing.")
-        return []
+def _safe_collect_page_blocks(pdf_path, start_page, end_page):
+    """Worker entry point: collects page blocks, reporting failures instead of raising them."""
+    return _run_in_worker(_collect_page_blocks, pdf_path, start_page, end_page)
+
+def _safe_extract_page_sections(pdf_path, ocr_texts=None, ocr_cache=None):
+    """Worker entry point for the page-based fallback extraction."""
+    return _run_in_worker(_extract_page_sections, pdf_path, ocr_texts, ocr_cache)
+
+def _safe_ocr_pages(pdf_path, page_numbers, ocr_cache=None):
+    """Worker entry point: OCRs pages of a PDF, reporting failures instead of raising them."""
+    return _run_in_worker(_ocr_pages_from_file, pdf_path, page_numbers, ocr_cache)
+
+def _plan_page_ranges(pdf_path, pages_per_task):
+    """Splits a document into contiguous page ranges of at most `pages_per_task` pages."""
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+    if page_count <= pages_per_task:
+        return [(0, page_count)]
+    return [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+
+def _iter_documents_parallel(doc_paths, workers, pages_per_task, ocr_cache=None):
+    """
+    Extracts documents on a pool of worker processes, yielding (pdf_path, sections) per
+    document in input order as soon as it is complete.
+
+    Every document is split into page-range tasks, so large files are spread over several
+    workers as well. The tagged blocks of each range are stitched back in page order before
+    sections are assembled, and their font statistics are merged before headings are
+    resolved, which keeps the output identical to the serial path. Only a window of
+    `2 * workers` documents is in flight at a time, so a slow consumer bounds how far
+    parsing runs ahead. Pages without a text layer are OCRed on the same pool.
+    """
+    window = max(2 * workers, 2)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+
+        def submit(doc_path):
+            try:
+                page_ranges = _plan_page_ranges(doc_path, pages_per_task)
+            except Exception as e:
+                print(f"Error processing {os.path.basename(doc_path)}: {e}")
+                page_ranges = []
+            futures = [executor.submit(_safe_collect_page_blocks, doc_path, start, end) for start, end in page_ranges]
+            pending.append((doc_path, futures, time.perf_counter()))
+
+        remaining = iter(doc_paths)
+        for doc_path in itertools.islice(remaining, window):
+            submit(doc_path)
+
+        while pending:
+            doc_path, futures, submitted = pending.popleft()
+            next_path = next(remaining, None)
+            if next_path is not None:
+                submit(next_path)
+
+            filename = os.path.basename(doc_path)
+            print(f" -> Processing: {filename}")
+            page_blocks, font_sizes, errors = [], {}, []
+            for future in futures:
+                result, error, stats = future.result()
+                instrumentation.merge(stats)
+                if error:
+                    errors.append(error)
+                    continue
+                blocks, range_font_sizes = result
+                page_blocks.extend(blocks)
+                for size, characters in range_font_sizes.items():
+                    font_sizes[size] = font_sizes.get(size, 0) + characters
+            if errors or not futures:
+                if errors:
+                    print(f"Error processing {filename}: {errors[0]}")
+                instrumentation.add_span("parse_file", submitted, time.perf_counter() - submitted, file=filename)
+                yield doc_path, []
+                continue
+
+            page_blocks, ocr_texts = _ocr_missing_pages(doc_path, _resolve_headings(page_blocks, font_sizes), ocr_cache,
+                                                     executor=executor, workers=workers)
+            sections = _build_sections(filename, page_blocks)
+            if not sections:
+                print(f"  -> No structured sections found in {filename}. Falling back to page-based extraction.")
+                sections, error, stats = executor.submit(_safe_extract_page_sections, doc_path, ocr_texts, ocr_cache).result()
+                instrumentation.merge(stats)
+                if error:
+                    print(f"Error processing {filename}: {error}")
+            # In parallel mode the span runs from submitting the document's first task to its completion
+            instrumentation.add_span("parse_file", submitted, time.perf_counter() - submitted, file=filename)
+            yield doc_path, sections
+
+def _extract_serially(doc_path, ocr_cache=None):
+    filename = os.path.basename(doc_path)
+    print(f" -> Processing: {filename}")
+    with instrumentation.span("parse_file", file=filename):
+        return extract_sections_from_file(doc_path, ocr_cache)
+
+def _count_sections(sections):
+    instrumentation.increment("sections_extracted", len(sections))
+    instrumentation.increment("subsections_extracted", sum(len(s.get("subsections", [])) for s in sections))
+
+def iter_documents(pdf_paths: list, workers: int = EXTRACTION_WORKERS, pages_per_task: int = PAGES_PER_EXTRACTION_TASK, cache=None, ocr_cache=None):
+    """
+    Extracts the sections of each existing PDF, yielding them per document as soon as each
+    document is done. Missing files are reported and skipped.
+
+    Takes the same arguments as `extract_all_documents`.
 
+    Yields:
+        (pdf_path, sections) pairs in input order.
+    """
+    doc_paths = []
     for doc_path in pdf_paths:
         if not os.path.exists(doc_path):
             print(f"Warning: File not found at {doc_path}. Skipping.")
             continue
-        
-        filename = os.path.basename(doc_path)
-        print(f" -> Processing: {filename}")
-        file_data = extract_sections_from_file(doc_path)
-        all_extracted_data.extend(file_data)
-        
+        doc_paths.append(doc_path)
+
+    cached_sections = [None] * len(doc_paths)
+    cache_keys = [None] * len(doc_paths)
+    if cache is not None:
+        for i, doc_path in enumerate(doc_paths):
+            try:
+                cache_keys[i] = cache.key_for(doc_path)
+            except OSError as e:
+                print(f"Warning: Could not hash {os.path.basename(doc_path)} for the extraction cache: {e}")
+                continue
+            cached_sections[i] = cache.get(cache_keys[i], os.path.basename(doc_path))
+
+    pending_paths = [path for path, sections in zip(doc_paths, cached_sections) if sections is None]
+    if workers and workers > 1 and pending_paths:
+        extracted = _iter_documents_parallel(pending_paths, workers, pages_per_task, ocr_cache)
+    else:
+        extracted = ((path, _extract_serially(path, ocr_cache)) for path in pending_paths)
+
+    for i, doc_path in enumerate(doc_paths):
+        if cached_sections[i] is not None:
+            print(f" -> Loaded from cache: {os.path.basename(doc_path)}")
+            instrumentation.increment("documents_from_cache")
+            _count_sections(cached_sections[i])
+            yield doc_path, cached_sections[i]
+            continue
+
+        _, file_data = next(extracted)
+        instrumentation.increment("documents_parsed")
+        _count_sections(file_data)
+        # Empty results usually mean a parsing error, so they are retried on the next run
+        if cache is not None and cache_keys[i] is not None and file_data:
+            cache.put(cache_keys[i], file_data)
+        yield doc_path, file_data
+
+def extract_documents(pdf_paths: list, workers: int = EXTRACTION_WORKERS, pages_per_task: int = PAGES_PER_EXTRACTION_TASK, cache=None, ocr_cache=None):
+    """
+    Extracts the sections of each existing PDF and keeps them grouped per document.
+
+    Takes the same arguments as `extract_all_documents`. Missing files are reported and skipped.
+
+    Returns:
+        A list of (pdf_path, sections) pairs in input order.
+    """
+    return list(iter_documents(pdf_paths, workers=workers, pages_per_task=pages_per_task, cache=cache, ocr_cache=ocr_cache))
+
+def extract_all_documents(pdf_paths: list, workers: int = EXTRACTION_WORKERS, pages_per_task: int = PAGES_PER_EXTRACTION_TASK, cache=None, ocr_cache=None):
+    """
+    Loops through a given list of PDF paths and extracts their content.
+
+    Args:
+        pdf_paths: The PDF files to process.
+        workers: Number of worker processes. With 0 or 1 the documents are parsed serially
+            in this process; otherwise files and page ranges are spread over a process pool.
+        pages_per_task: Maximum number of pages of one file handled by a single worker task.
+        cache: Optional `ExtractionCache`. Documents found in it are not parsed again and
+            newly parsed documents are added to it.
+        ocr_cache: Optional `OcrCache` for the OCR results of pages without a text layer.
+
+    Returns:
+        The extracted sections, in the same document and page order for every worker count.
+    """
+    # --- CHANGED: The function now iterates over the provided list of file paths ---
+    if not pdf_paths:
+        print("Warning: No PDF document paths were provided for processing.")
+        return []
+
+    documents = extract_documents(pdf_paths, workers=workers, pages_per_task=pages_per_task, cache=cache, ocr_cache=ocr_cache)
+
     # --- CHANGED: The function now returns only the extracted data ---
-    return all_extracted_data
\ No newline at end of file
+    return [section for _, file_data in documents for section in file_data]
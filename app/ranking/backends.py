@@ -0,0 +1,124 @@
+import os
+import json
+import logging
+import numpy as np
+from typing import List
+
+# Embedding backends selectable through EMBEDDING_BACKEND in app/config.py:
+#   "torch" - the reference SentenceTransformer running on PyTorch
+#   "onnx"  - an exported, int8-quantized copy of the same model running on ONNX Runtime
+BACKENDS = ("torch", "onnx")
+
+def read_max_seq_length(model_path: str, default: int = 256) -> int:
+    """Reads the maximum sequence length from a sentence-transformer model directory."""
+    config_path = os.path.join(model_path, "sentence_bert_config.json")
+    if os.path.exists(config_path):
+        with open(config_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get("max_seq_length", default)
+    return default
+
+def model_max_seq_length(model, model_path: str) -> int:
+    """Returns the token window of a loaded encoder, falling back to its model directory."""
+    max_seq_length = getattr(model, "max_seq_length", None)
+    if not isinstance(max_seq_length, int):
+        max_seq_length = read_max_seq_length(model_path)
+    return max_seq_length
+
+def set_torch_threads(threads: int):
+    """Pins the PyTorch intra-op thread count of this process (0 keeps the default)."""
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+
+class OnnxSentenceEncoder:
+    """
+    Encodes sentences with an ONNX export of a sentence-transformer model.
+
+    The ONNX graph contains only the transformer. Tokenization uses the model's fast
+    tokenizer (`tokenizer.json`), and mean pooling and normalization are done in NumPy,
+    matching the all-MiniLM-L6-v2 pipeline. `encode` mirrors `SentenceTransformer.encode`
+    so that `EmbeddingModel` can use either interchangeably.
+    """
+    def __init__(self, onnx_model_path: str, tokenizer_path: str, max_seq_length: int = 256, intra_op_threads: int = 0):
+        """
+        Initializes the OnnxSentenceEncoder.
+
+        Args:
+            onnx_model_path: Path of the (quantized) ONNX model produced by `scripts/export_onnx.py`.
+            tokenizer_path: Path of the model's `tokenizer.json`.
+            max_seq_length: Token window of the model; longer inputs are truncated.
+            intra_op_threads: ONNX Runtime intra-op thread count (0 lets the runtime decide).
+        """
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        if not os.path.exists(onnx_model_path):
+            raise FileNotFoundError(
+                f"ONNX model not found at path: {onnx_model_path}. Run 'python scripts/export_onnx.py' first."
+            )
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(onnx_model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_seq_length)
+        self.tokenizer.enable_padding()
+        self.max_seq_length = max_seq_length
+
+    @classmethod
+    def from_model_dir(cls, model_path: str, onnx_model_path: str, intra_op_threads: int = 0):
+        """Creates an encoder using the tokenizer and sequence length of a sentence-transformer directory."""
+        return cls(
+            onnx_model_path, os.path.join(model_path, "tokenizer.json"),
+            max_seq_length=read_max_seq_length(model_path), intra_op_threads=intra_op_threads,
+        )
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+        # Mean pooling over the real (non-padding) tokens
+        mask = attention_mask[:, :, None].astype(np.float32)
+        return (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, texts: List[str], batch_size: int = 32, convert_to_numpy: bool = True,
+               show_progress_bar: bool = False, normalize_embeddings: bool = False) -> np.ndarray:
+        """Encodes texts in batches and returns a float32 matrix, optionally L2-normalized."""
+        if isinstance(texts, str):
+            texts = [texts]
+        # Sorting by length keeps padding within each batch small
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        embeddings = np.empty((len(texts), 0), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            batch_indices = order[start:start + batch_size]
+            batch = self._encode_batch([texts[i] for i in batch_indices])
+            if embeddings.shape[1] == 0:
+                embeddings = np.empty((len(texts), batch.shape[1]), dtype=np.float32)
+            embeddings[batch_indices] = batch
+
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings /= np.clip(norms, 1e-12, None)
+        return embeddings
+
+def load_backend(backend: str, model_path: str, onnx_model_path: str = None, threads: int = 0):
+    """
+    Loads the encoder for a backend. The returned object exposes a
+    `SentenceTransformer.encode`-compatible `encode` method. A positive `threads` pins
+    the intra-op thread count (process-wide for PyTorch, per session for ONNX Runtime).
+    """
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        set_torch_threads(threads)
+        return SentenceTransformer(model_path)
+    if backend == "onnx":
+        logging.info(f"Using ONNX Runtime backend with '{onnx_model_path}'.")
+        return OnnxSentenceEncoder.from_model_dir(model_path, onnx_model_path, intra_op_threads=threads)
+    raise ValueError(f"Unknown embedding backend '{backend}'. Expected one of: {', '.join(BACKENDS)}")
@@ -0,0 +1,290 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import numpy as np
+from typing import List, Optional
+
+from app.config import (
+    EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_CACHE_DTYPE, EMBEDDING_BACKEND, ONNX_MODEL_PATH,
+    LONG_TEXT_MODE,
+)
+
+INDEX_FILENAME = "index.json"
+JOURNAL_FILENAME = "journal.jsonl"
+VECTORS_FILENAME = "vectors.bin"
+WEIGHT_FILENAMES = ("model.safetensors", "pytorch_model.bin")
+
+def text_key(text: str) -> str:
+    """Returns a compact, stable hash of a text used as its cache key."""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+def model_identity(model_path: str, backend: str = "torch", onnx_model_path: str = None,
+                   long_text_mode: str = "truncate") -> str:
+    """
+    Derives an identifier for a model from its directory name, configuration files and the
+    size and modification time of its weights, so that vectors produced by different
+    models (or by the same model fine-tuned again) never share a cache. Vectors of the
+    quantized ONNX backend differ slightly from the reference, so the backend and the
+    size and modification time of the ONNX file are part of the identity as well, and so is a long text mode
+    other than truncation.
+    """
+    digest = hashlib.sha256(os.path.basename(os.path.normpath(model_path)).encode('utf-8'))
+    for name in ("config.json", "sentence_bert_config.json", "modules.json"):
+        path = os.path.join(model_path, name)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    for name in WEIGHT_FILENAMES:
+        path = os.path.join(model_path, name)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8'))
+    if backend != "torch":
+        digest.update(backend.encode('utf-8'))
+        if onnx_model_path and os.path.exists(onnx_model_path):
+            stat = os.stat(onnx_model_path)
+            digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8'))
+    if long_text_mode != "truncate":
+        digest.update(long_text_mode.encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+class EmbeddingCache:
+    """
+    A persistent cache of text embeddings stored as a memory-mapped matrix.
+
+    Vectors live in a flat binary file of shape (capacity, dim) that is memory-mapped
+    on open; an index maps text hashes to row numbers and keeps a last-used tick for
+    every entry. The index is a snapshot file plus an append-only journal of the entries
+    added or used since, so a flush costs time in proportion to the changes, not to the
+    cache size. The snapshot is rewritten once the journal outgrows it. When the number
+    of entries exceeds `max_entries`, the least recently used ones are dropped and the
+    matrix is compacted into a new file. The cache is meant to be used by a single
+    process at a time.
+    """
+    def __init__(self, model_path: str, cache_dir: str = EMBEDDING_CACHE_DIR,
+                 max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES, dtype: str = EMBEDDING_CACHE_DTYPE,
+                 backend: str = EMBEDDING_BACKEND, onnx_model_path: str = ONNX_MODEL_PATH,
+                 long_text_mode: str = LONG_TEXT_MODE):
+        """
+        Initializes the EmbeddingCache.
+
+        Args:
+            model_path: Path of the model whose embeddings are cached.
+            cache_dir: Root directory of the cache. Each model gets its own subdirectory.
+            max_entries: Maximum number of vectors kept after eviction.
+            dtype: Storage type of the vectors, 'float32' or 'float16'.
+            backend, onnx_model_path: The embedding backend producing the vectors.
+            long_text_mode: How the vectors of texts beyond the token window were produced.
+        """
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported embedding cache dtype: {dtype}")
+        self.directory = os.path.join(cache_dir, model_identity(model_path, backend, onnx_model_path, long_text_mode))
+        self.max_entries = max_entries
+        self.dtype = np.dtype(dtype)
+        self.dim: Optional[int] = None
+        self.entries = {}  # text key -> [row, last_used]
+        self.rows = 0
+        self.clock = 0
+        self.vectors: Optional[np.memmap] = None
+        self.generation = 0  # Incremented with every snapshot; older journal lines are ignored
+        self._changed = set()  # Keys added or used since the last flush
+        self._journal_entries = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+
+    @property
+    def index_path(self):
+        return os.path.join(self.directory, INDEX_FILENAME)
+
+    @property
+    def journal_path(self):
+        return os.path.join(self.directory, JOURNAL_FILENAME)
+
+    @property
+    def vectors_path(self):
+        return os.path.join(self.directory, VECTORS_FILENAME)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _load(self):
+        """Opens an existing cache, discarding it if it is unreadable or was written with another dtype."""
+        if not os.path.exists(self.index_path) or not os.path.exists(self.vectors_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index["dtype"] != self.dtype.name:
+                logging.info("Embedding cache dtype changed. Starting with an empty cache.")
+                return
+            self.dim = index["dim"]
+            self.rows = index["rows"]
+            self.clock = index["clock"]
+            self.entries = index["entries"]
+            self.generation = index.get("generation", 0)
+            self._replay_journal()
+            self._map_vectors()
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Ignoring unreadable embedding cache at {self.directory}: {e}")
+            self.dim, self.rows, self.clock, self.entries, self.vectors = None, 0, 0, {}, None
+
+    def _replay_journal(self):
+        """Applies the journal lines written since the snapshot, stopping at a torn last line."""
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    change = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if change["generation"] != self.generation:
+                    continue
+                self.entries.update(change["entries"])
+                self.rows = max(self.rows, change["rows"])
+                self.clock = max(self.clock, change["clock"])
+                self._journal_entries += len(change["entries"])
+
+    def _map_vectors(self):
+        """Memory-maps the vector file using its current size as capacity."""
+        capacity = os.path.getsize(self.vectors_path) // (self.dim * self.dtype.itemsize)
+        self.vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode='r+', shape=(capacity, self.dim)) if capacity else None
+
+    def _capacity(self):
+        return 0 if self.vectors is None else self.vectors.shape[0]
+
+    def _reserve(self, rows_needed):
+        """Grows the vector file geometrically so appends stay amortized O(1)."""
+        if rows_needed <= self._capacity():
+            return
+        new_capacity = max(rows_needed, 2 * self._capacity(), 1024)
+        if self.vectors is not None:
+            self.vectors.flush()
+        with open(self.vectors_path, 'ab') as f:
+            f.truncate(new_capacity * self.dim * self.dtype.itemsize)
+        self._map_vectors()
+
+    def lookup(self, keys: List[str]) -> np.ndarray:
+        """
+        Resolves keys to rows of the vector matrix and marks the hits as recently used.
+
+        Returns:
+            An integer array holding the row of every key, or -1 for a miss.
+        """
+        self.clock += 1
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        for i, key in enumerate(keys):
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry[1] = self.clock
+                rows[i] = entry[0]
+                self._changed.add(key)
+        return rows
+
+    def get(self, rows: np.ndarray) -> np.ndarray:
+        """
+        Returns the vectors stored in the given rows.
+
+        When the rows form one ascending run of a float32 cache, the result is a view
+        of the memory-mapped matrix and no data is copied. Otherwise the rows are gathered
+        into a new float32 array.
+        """
+        if len(rows) and self.dtype == np.float32 and np.all(np.diff(rows) == 1):
+            view = self.vectors[rows[0]:rows[-1] + 1]
+            view.flags.writeable = False  # Callers must not modify the cache through the view
+            return view
+        return np.asarray(self.vectors[rows], dtype=np.float32)
+
+    def add(self, keys: List[str], vectors: np.ndarray):
+        """Appends vectors for new keys, evicting and compacting if the cache grows too large."""
+        if not keys:
+            return
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self._changed.update(self.entries)  # The first flush writes a snapshot
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the cache dimension {self.dim}")
+
+        self._reserve(self.rows + len(keys))
+        self.vectors[self.rows:self.rows + len(keys)] = vectors.astype(self.dtype, copy=False)
+        for offset, key in enumerate(keys):
+            self.entries[key] = [self.rows + offset, self.clock]
+        self._changed.update(keys)
+        self.rows += len(keys)
+
+        if len(self.entries) > self.max_entries:
+            self.evict()
+        self.flush()
+
+    def evict(self):
+        """Keeps the `max_entries` most recently used vectors and compacts the matrix."""
+        keep = sorted(self.entries.items(), key=lambda item: item[1][1], reverse=True)[:self.max_entries]
+        keep.sort(key=lambda item: item[1][0])  # Preserve the original row order for locality
+        self.compact([key for key, _ in keep])
+
+    def compact(self, keys: Optional[List[str]] = None):
+        """
+        Rewrites the vector file so that it holds only the given keys (all live keys by
+        default) in consecutive rows. The new file replaces the old one atomically, so
+        views handed out earlier stay readable.
+        """
+        if keys is None:
+            keys = sorted(self.entries, key=lambda key: self.entries[key][0])
+        old_rows = np.array([self.entries[key][0] for key in keys], dtype=np.int64)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        if len(keys):
+            compacted = np.memmap(tmp_path, dtype=self.dtype, mode='w+', shape=(len(keys), self.dim))
+            compacted[:] = self.vectors[old_rows]
+            compacted.flush()
+            del compacted
+        os.replace(tmp_path, self.vectors_path)
+
+        self.entries = {key: [row, self.entries[key][1]] for row, key in enumerate(keys)}
+        self.rows = len(keys)
+        self._map_vectors()
+        self._write_snapshot()
+
+    def flush(self):
+        """
+        Writes pending vectors and the index changes (new entries and last-used ticks) to
+        disk, appending them to the journal, or rewriting the snapshot once the journal
+        holds more entries than the cache.
+        """
+        if not self._changed or self.dim is None:
+            return
+        if self.vectors is not None:
+            self.vectors.flush()
+        if self._journal_entries + len(self._changed) > len(self.entries) or not os.path.exists(self.index_path):
+            self._write_snapshot()
+            return
+        change = {
+            "generation": self.generation, "rows": self.rows, "clock": self.clock,
+            "entries": {key: self.entries[key] for key in self._changed if key in self.entries},
+        }
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(change) + "\n")
+        self._journal_entries += len(change["entries"])
+        self._changed.clear()
+
+    def _write_snapshot(self):
+        """Writes the whole index and starts a new, empty journal."""
+        if self.vectors is not None:
+            self.vectors.flush()
+        self.generation += 1
+        index = {
+            "dim": self.dim, "dtype": self.dtype.name, "rows": self.rows,
+            "clock": self.clock, "entries": self.entries, "generation": self.generation,
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+        # Lines of the previous generation would be skipped anyway; dropping them keeps the file short
+        with open(self.journal_path, 'w', encoding='utf-8'):
+            pass
+        self._journal_entries = 0
+        self._changed.clear()
@@ -1,9 +1,15 @@
 
 import os
 import logging
+import threading
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from typing import List, Union
+from typing import List, Optional, Union
+from .cache import EmbeddingCache, text_key
+from .backends import BACKENDS, load_backend, model_max_seq_length
+from .scheduling import EncodeScheduler, LONG_TEXT_MODES
+from .sharding import ShardedEncoder
+from app import instrumentation
+from app.config import EMBEDDING_BACKEND, ONNX_MODEL_PATH, LONG_TEXT_MODE, ENCODER_WORKERS, ENCODER_THREADS
 
 # Set up a logger for cleaner, more controllable status messages
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -12,47 +18,112 @@ class EmbeddingModel:
     """
     A robust wrapper for SentenceTransformer models that includes lazy loading,
     type hinting, logging, and performance optimizations via normalization.
+
+    The model runs on a pluggable backend: the reference PyTorch SentenceTransformer
+    ("torch") or a quantized ONNX Runtime export of it ("onnx"). Texts are fed to it in
+    length-sorted, token-budgeted batches by an `EncodeScheduler`. With more than one
+    encoder worker, the model runs in worker processes instead, see `ShardedEncoder`.
     """
-    def __init__(self, model_path: str):
+    def __init__(self, model_path: str, cache: Optional[EmbeddingCache] = None,
+                 backend: str = EMBEDDING_BACKEND, onnx_model_path: str = ONNX_MODEL_PATH,
+                 long_text_mode: str = LONG_TEXT_MODE, encoder_workers: int = ENCODER_WORKERS,
+                 encoder_threads: int = ENCODER_THREADS):
         """
         Initializes the EmbeddingModel.
 
         Args:
             model_path: The local file path to the sentence-transformer model directory.
+            cache: Optional persistent embedding cache. Only texts missing from it are encoded.
+            backend: The inference backend, "torch" or "onnx".
+            onnx_model_path: The ONNX model used by the "onnx" backend.
+            long_text_mode: "truncate" or "chunk" for texts beyond the model's token
+                window, see `EncodeScheduler`.
+            encoder_workers: Number of encoder worker processes (0 or 1 encodes in-process).
+            encoder_threads: Intra-op threads of the model, per worker with several workers
+                (0 keeps the library default in-process and divides the cores between workers).
         """
         if not os.path.exists(model_path):
             raise FileNotFoundError(f"Model directory not found at path: {model_path}")
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend '{backend}'. Expected one of: {', '.join(BACKENDS)}")
+        if long_text_mode not in LONG_TEXT_MODES:
+            raise ValueError(f"Unknown long text mode '{long_text_mode}'. Expected one of: {', '.join(LONG_TEXT_MODES)}")
+        if backend == "onnx" and not os.path.exists(onnx_model_path):
+            raise FileNotFoundError(
+                f"ONNX model not found at path: {onnx_model_path}. Run 'python scripts/export_onnx.py' first."
+            )
         self.model_path = model_path
-        self.model: SentenceTransformer = None # Model is loaded on first use (lazy loading)
+        self.backend = backend
+        self.onnx_model_path = onnx_model_path
+        self.long_text_mode = long_text_mode
+        self.encoder_workers = encoder_workers
+        self.encoder_threads = encoder_threads
+        self.model = None # Model is loaded on first use (lazy loading) or by `warm_up`
+        self.scheduler = None
+        self.cache = cache
+        self._load_lock = threading.Lock()
 
     def _load_model(self):
         """
         Private method to load the SentenceTransformer model into memory.
-        This is called automatically only when embeddings are first requested.
+        This is called automatically only when embeddings are first requested, unless
+        `warm_up` already loaded it. Concurrent callers wait for a single load.
+        """
+        with self._load_lock:
+            if self.model is not None:
+                return
+            logging.info(f"Loading sentence-transformer model from '{self.model_path}' into memory...")
+            try:
+                with instrumentation.span("model_load", backend=self.backend, workers=self.encoder_workers):
+                    # The backends import their heavy libraries (torch, onnxruntime) only here
+                    if self.encoder_workers and self.encoder_workers > 1:
+                        self.model = ShardedEncoder(
+                            self.backend, self.model_path, self.onnx_model_path, workers=self.encoder_workers,
+                            threads=self.encoder_threads, long_text_mode=self.long_text_mode,
+                        )
+                    else:
+                        self.model = load_backend(self.backend, self.model_path, self.onnx_model_path, threads=self.encoder_threads)
+                logging.info("Model loaded successfully.")
+            except Exception as e:
+                logging.error(f"Fatal: Error loading embedding model from {self.model_path}: {e}")
+                raise
+
+    def warm_up(self) -> Optional[threading.Thread]:
         """
-        logging.info(f"Loading sentence-transformer model from '{self.model_path}' into memory...")
-        try:
-            self.model = SentenceTransformer(self.model_path)
-            logging.info("Model loaded successfully.")
-        except Exception as e:
-            logging.error(f"Fatal: Error loading embedding model from {self.model_path}: {e}")
-            raise
-
-    def get_embeddings(self, texts: Union[str, List[str]]) -> np.ndarray:
+        Starts loading the model on a background thread, so that it overlaps with other
+        work such as PDF extraction. The first `get_embeddings` call waits for the load to
+        finish; if it failed, that call retries it and raises the error.
+
+        Encoder workers are started right here instead, on the calling thread, and None is
+        returned: they are forked, and forking while another thread of this process may be
+        forking extraction or OCR pools is not safe.
+        """
+        def load():
+            try:
+                self._load_model()
+            except Exception:
+                pass  # Logged by _load_model and raised again by the first encode
+
+        if self.encoder_workers and self.encoder_workers > 1:
+            load()
+            return None
+        thread = threading.Thread(target=instrumentation.in_current_context(load), name="model-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def get_embeddings(self, texts: Union[str, List[str]], use_cache: bool = True) -> np.ndarray:
         """
         Generates normalized embeddings for a list of texts.
         If the model is not loaded, it will be loaded automatically.
 
         Args:
             texts: A single string or a list of strings to embed.
+            use_cache: Whether to look up and store the embeddings in the persistent
+                cache. Turn it off for throwaway texts, such as warm-up inputs.
 
         Returns:
             A numpy array of normalized embeddings (unit vectors).
         """
-        # Lazy loading: the model is only loaded into memory when it's actually needed.
-        if self.model is None:
-            self._load_model()
-
         # Ensure input is always a list for the encoder
         if isinstance(texts, str):
             texts = [texts]
@@ -60,12 +131,67 @@ class EmbeddingModel:
         if not texts:
             return np.array([])
 
+        if self.cache is not None and use_cache:
+            return self._get_cached_embeddings(texts)
+        return self._encode(texts)
+
+    def cached_mask(self, texts: List[str]) -> np.ndarray:
+        """Returns a boolean mask of the texts whose embeddings are already cached, without encoding anything."""
+        if self.cache is None or not texts:
+            return np.zeros(len(texts), dtype=bool)
+        return self.cache.lookup([text_key(text) for text in texts]) >= 0
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """Runs the model on a list of texts, loading it first if necessary."""
+        # Lazy loading: the model is only loaded into memory when it's actually needed.
+        if self.model is None:
+            self._load_model()
+        instrumentation.increment("texts_encoded", len(texts))
+        if isinstance(self.model, ShardedEncoder):
+            # Every worker schedules its own shard
+            with instrumentation.span("encode", texts=len(texts)):
+                return self.model.encode(texts)
+        if self.scheduler is None:
+            # The scheduler needs the token window of the loaded model
+            self.scheduler = EncodeScheduler(model_max_seq_length(self.model, self.model_path), long_text_mode=self.long_text_mode)
+
         # Encode the texts. Normalizing embeddings to unit vectors is crucial.
         # It allows for using a faster dot product for cosine similarity calculations.
-        embeddings = self.model.encode(
-            texts,
-            convert_to_numpy=True,
-            show_progress_bar=False,
-            normalize_embeddings=True 
-        )
-        return embeddings
\ No newline at end of file
+        with instrumentation.span("encode", texts=len(texts)):
+            embeddings = self.scheduler.encode(self.model, texts)
+        return embeddings
+
+    def close(self):
+        """Stops the encoder worker processes, if any. The model is loaded again on next use."""
+        with self._load_lock:
+            if isinstance(self.model, ShardedEncoder):
+                self.model.close()
+                self.model = None
+
+    def _get_cached_embeddings(self, texts: List[str]) -> np.ndarray:
+        """
+        Serves embeddings from the cache and encodes only the misses, each distinct text once.
+        """
+        keys = [text_key(text) for text in texts]
+        rows = self.cache.lookup(keys)
+        hit_mask = rows >= 0
+        instrumentation.increment("embedding_cache_hits", int(hit_mask.sum()))
+        if hit_mask.all():
+            self.cache.flush()  # Persists the last-used ticks of the hits
+            return self.cache.get(rows)
+
+        missing = {}
+        for i in np.flatnonzero(~hit_mask):
+            missing.setdefault(keys[i], texts[i])
+        logging.info(f"Embedding cache: {int(hit_mask.sum())} hit(s), encoding {len(missing)} new text(s).")
+        encoded = self._encode(list(missing.values()))
+
+        # Gather the hits before adding, since adding may evict and compact the cache
+        embeddings = np.empty((len(texts), encoded.shape[1]), dtype=np.float32)
+        if hit_mask.any():
+            embeddings[hit_mask] = self.cache.get(rows[hit_mask])
+        positions = {key: j for j, key in enumerate(missing)}
+        embeddings[~hit_mask] = encoded[[positions[keys[i]] for i in np.flatnonzero(~hit_mask)]]
+
+        self.cache.add(list(missing), encoded)
+        return embeddings
@@ -1,140 +1,485 @@
 
-from sklearn.metrics.pairwise import cosine_similarity
+import logging
 import numpy as np
 from .embedding import EmbeddingModel
+from app import instrumentation
+from app.processing.corpus import Corpus
+from app.processing.dedup import remove_near_duplicates
+from app.validators import near_duplicate_threshold as parse_near_duplicate_threshold
+from .index import IndexedCorpus
+from app.config import (
+    TOP_K, CANDIDATE_POOL_SIZE, MMR_LAMBDA, EMBEDDING_BACKEND, LEXICAL_CANDIDATES, HIERARCHICAL_SECTIONS,
+    LONG_TEXT_MODE, ENCODER_WORKERS, ENCODER_THREADS, NEAR_DUPLICATE_THRESHOLD,
+)
+
+# Weights of the title and content similarities in a section's score
+TITLE_WEIGHT, CONTENT_WEIGHT = 0.6, 0.4
+
+def _normalize_text(text):
+    """Collapses whitespace so that texts differing only in spacing share one embedding."""
+    return " ".join(text.split())
+
+def _normalize_rows(matrix):
+    """Scales every row of a matrix to unit length, leaving all-zero rows untouched."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def _query_similarities(query_embedding, embeddings):
+    """Returns the cosine similarity of every row of `embeddings` to the query embedding."""
+    query_unit = _normalize_rows(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+    return _normalize_rows(np.asarray(embeddings, dtype=np.float32)) @ query_unit
+
+def _similarity_matrix(query_embeddings, embeddings):
+    """Returns the cosine similarities of the rows of `embeddings` to several queries, one column per query."""
+    return _normalize_rows(np.asarray(embeddings, dtype=np.float32)) @ _normalize_rows(query_embeddings).T
+
+def _duplicate_sources(record):
+    """Returns the output field listing the near-duplicate copies a result stands for, if it has any."""
+    if not record.duplicates:
+        return {}
+    return {"duplicate_sources": [{"document": document, "page_number": page} for document, page in record.duplicates]}
 
 class RankingEngine:
     """
     Ranks text using a weighted score and then re-ranks using Maximal Marginal Relevance (MMR)
     to ensure relevance and diversity in the final output.
+
+    Unless `warm_up` is False, the embedding model starts loading on a background thread
+    as soon as the engine is created, so the load overlaps with PDF extraction (encoder
+    worker processes are started before the constructor returns, see `EmbeddingModel.warm_up`).
+
+    With a positive `lexical_candidates`, a BM25 first stage limits dense scoring to the
+    best lexical candidates, see `_lexical_prefilter`. With a positive
+    `hierarchical_sections`, only the subsections of the best sections are embedded, see
+    `_score_hierarchically`. With a positive `near_duplicate_threshold`, near-duplicate
+    passages are collapsed before anything is embedded, see `remove_near_duplicates`.
     """
-    def __init__(self, model_path: str):
-        self.embedding_model = EmbeddingModel(model_path)
+    def __init__(self, model_path: str, embedding_cache=None, backend: str = EMBEDDING_BACKEND, warm_up: bool = True,
+                 lexical_candidates: int = LEXICAL_CANDIDATES, hierarchical_sections: int = HIERARCHICAL_SECTIONS,
+                 long_text_mode: str = LONG_TEXT_MODE, encoder_workers: int = ENCODER_WORKERS, encoder_threads: int = ENCODER_THREADS,
+                 near_duplicate_threshold: float = NEAR_DUPLICATE_THRESHOLD):
+        self.embedding_model = EmbeddingModel(
+            model_path, cache=embedding_cache, backend=backend, long_text_mode=long_text_mode,
+            encoder_workers=encoder_workers, encoder_threads=encoder_threads,
+        )
+        self.lexical_candidates = lexical_candidates
+        self.hierarchical_sections = hierarchical_sections
+        self.near_duplicate_threshold = parse_near_duplicate_threshold(near_duplicate_threshold)
+        self.last_dedup_stats = None
+        self.last_hierarchical_stats = None
+        if warm_up:
+            self.embedding_model.warm_up()
 
-    def _apply_mmr(self, query_embedding, doc_embeddings, docs, top_k=5, lambda_val=0.7):
+    def _apply_mmr(self, query_embedding, doc_embeddings, docs, top_k=TOP_K, lambda_val=MMR_LAMBDA):
         """
         Applies Maximal Marginal Relevance to a list of documents.
 
+        The relevance of every candidate is computed once with a single matrix-vector
+        product. A running vector holds each candidate's maximum similarity to the
+        documents selected so far; after every selection it is updated with one more
+        matrix-vector product, so each step is a constant number of vectorized operations.
+
         Args:
             query_embedding: The embedding of the user's query.
             doc_embeddings: Embeddings of the candidate documents.
-            docs: The list of candidate document dictionaries.
+            docs: The candidates, e.g. their row offsets in the corpus.
             top_k: The number of documents to return.
             lambda_val: Controls diversity (0.0) vs. relevance (1.0).
 
         Returns:
             A re-ranked list of documents based on MMR.
         """
-        if not docs or len(docs) <= top_k:
+        if len(docs) <= top_k:
             return docs
 
+        # Work on unit vectors so that dot products are cosine similarities
+        doc_unit = _normalize_rows(np.asarray(doc_embeddings, dtype=np.float32))
+        query_unit = _normalize_rows(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+
         # Calculate initial relevance scores
-        relevance_scores = cosine_similarity(query_embedding, doc_embeddings)[0]
-        
-        selected_indices = []
-        remaining_indices = list(range(len(docs)))
+        relevance_scores = doc_unit @ query_unit
+        weighted_relevance = lambda_val * relevance_scores
+
+        available = np.ones(len(docs), dtype=bool)
+        max_similarity = np.full(len(docs), -np.inf, dtype=np.float32)
 
         # Select the most relevant document first
-        first_selection_idx = np.argmax(relevance_scores)
-        selected_indices.append(first_selection_idx)
-        remaining_indices.remove(first_selection_idx)
+        selected_indices = [int(np.argmax(relevance_scores))]
+        available[selected_indices[0]] = False
 
         # Iteratively select the rest based on MMR
-        while len(selected_indices) < top_k and remaining_indices:
-            mmr_scores = {}
-            selected_embeddings = doc_embeddings[selected_indices]
-
-            for idx in remaining_indices:
-                relevance = relevance_scores[idx]
-                # Calculate max similarity to already selected items
-                similarity_to_selected = cosine_similarity(doc_embeddings[idx].reshape(1, -1), selected_embeddings)
-                max_sim = np.max(similarity_to_selected) if similarity_to_selected.size > 0 else 0
-                
-                # MMR Formula
-                mmr_score = lambda_val * relevance - (1 - lambda_val) * max_sim
-                mmr_scores[idx] = mmr_score
-            
-            # Select the best candidate
-            best_idx = max(mmr_scores, key=mmr_scores.get)
+        while len(selected_indices) < top_k:
+            # Only the similarities to the newest selection can raise the running maximum
+            np.maximum(max_similarity, doc_unit @ doc_unit[selected_indices[-1]], out=max_similarity)
+
+            # MMR Formula
+            mmr_scores = weighted_relevance - (1 - lambda_val) * max_similarity
+            mmr_scores[~available] = -np.inf
+
+            best_idx = int(np.argmax(mmr_scores))
             selected_indices.append(best_idx)
-            remaining_indices.remove(best_idx)
-            
+            available[best_idx] = False
+
         return [docs[i] for i in selected_indices]
 
 
-    def rank(self, query: str, extracted_data: list):
-        if not extracted_data:
-            return [], []
+    def _embed_groups(self, *groups, known=None):
+        """
+        Embeds several lists of texts with a single encode call over their distinct texts.
 
-        query_embedding = self.embedding_model.get_embeddings(query)
+        Texts are compared after whitespace normalization, so a section body and its only
+        subsection, or headings repeated across documents, are encoded once and their
+        vector is scattered back to every occurrence. The share of redundant texts is
+        logged and kept in `last_dedup_stats`.
 
-        sections = [d for d in extracted_data if d.get('text')]
-        subsections = [sub for d in extracted_data for sub in d.get('subsections', []) if sub.get('text')]
-
-        # --- Initial Ranking (Weighted for Sections) ---
-        # This part remains the same to get a good candidate pool.
-        if sections:
-            title_weight, content_weight = 0.6, 0.4
-            section_titles = [s.get('section_title', '') for s in sections]
-            section_contents = [s['text'] for s in sections]
-            title_embeddings = self.embedding_model.get_embeddings(section_titles)
-            content_embeddings = self.embedding_model.get_embeddings(section_contents)
-            title_sims = cosine_similarity(query_embedding, title_embeddings)[0]
-            content_sims = cosine_similarity(query_embedding, content_embeddings)[0]
-            for i, section in enumerate(sections):
-                section['score'] = (title_sims[i] * title_weight) + (content_sims[i] * content_weight)
-                section['embedding'] = content_embeddings[i] # Store embedding for MMR
-            ranked_sections_sorted = sorted(sections, key=lambda x: x['score'], reverse=True)
-        else:
-            ranked_sections_sorted = []
-        
-        # --- Subsection Initial Ranking ---
-        if subsections:
-            subsection_texts = [s['text'] for s in subsections]
-            subsection_embeddings = self.embedding_model.get_embeddings(subsection_texts)
-            subsection_sims = cosine_similarity(query_embedding, subsection_embeddings)[0]
-            for i, sub in enumerate(subsections):
-                sub['similarity'] = subsection_sims[i]
-                sub['embedding'] = subsection_embeddings[i] # Store embedding for MMR
-            ranked_subsections_sorted = sorted(subsections, key=lambda x: x['similarity'], reverse=True)
-        else:
-            ranked_subsections_sorted = []
-        
-        # --- NEW: Re-rank the top candidates using MMR for diversity ---
-        # We take a larger pool of candidates (e.g., top 25) for MMR to choose from.
-        candidate_sections = ranked_sections_sorted[:25]
-        candidate_subsections = ranked_subsections_sorted[:25]
-
-        # Apply MMR to sections
-        if candidate_sections:
-            section_embeddings_pool = np.array([s['embedding'] for s in candidate_sections])
-            diversified_sections = self._apply_mmr(query_embedding, section_embeddings_pool, candidate_sections)
+        Args:
+            groups: Lists of texts.
+            known: Optional dict of embeddings by normalized text, e.g. from an earlier
+                call; these texts are not encoded again.
+
+        Returns:
+            One embedding matrix per group, aligned with the group's texts.
+        """
+        known = known or {}
+        unique_positions = {}
+        inverse = np.empty(sum(len(group) for group in groups), dtype=np.int64)
+        position = 0
+        for group in groups:
+            for text in group:
+                inverse[position] = unique_positions.setdefault(_normalize_text(text), len(unique_positions))
+                position += 1
+
+        total = len(inverse)
+        unique = sum(1 for text in unique_positions if text not in known) if known else len(unique_positions)
+        instrumentation.increment("texts_ranked", total)
+        instrumentation.increment("texts_deduplicated", total - unique)
+        self.last_dedup_stats = {
+            "texts": total,
+            "unique_texts": unique,
+            "dedup_ratio": round(1 - unique / total, 4) if total else 0.0,
+        }
+        if not total:
+            return [np.empty((0, 0), dtype=np.float32) for _ in groups]
+        logging.info(f"Encoding {unique} unique of {total} texts ({self.last_dedup_stats['dedup_ratio']:.1%} duplicates skipped).")
+
+        if unique == len(unique_positions):
+            unique_embeddings = np.asarray(self.embedding_model.get_embeddings(list(unique_positions)))
         else:
-            diversified_sections = []
+            # Stack the new embeddings above the known ones and map every distinct text to its row
+            to_encode = [text for text in unique_positions if text not in known]
+            reused = [text for text in unique_positions if text in known]
+            rows = {text: i for i, text in enumerate(to_encode + reused)}
+            stacked = np.asarray([known[text] for text in reused])
+            if to_encode:
+                stacked = np.vstack([np.asarray(self.embedding_model.get_embeddings(to_encode)), stacked])
+            unique_embeddings = stacked[[rows[text] for text in unique_positions]]
+        embeddings, start = [], 0
+        for group in groups:
+            embeddings.append(unique_embeddings[inverse[start:start + len(group)]])
+            start += len(group)
+        return embeddings
+
+    def _cached_mask(self, texts):
+        """Returns which texts already have a cached embedding; none when the model has no cache."""
+        cached_mask = getattr(self.embedding_model, "cached_mask", None)
+        if cached_mask is None:
+            return np.zeros(len(texts), dtype=bool)
+        return cached_mask([_normalize_text(text) for text in texts])
+
+    def _lexical_prefilter(self, query, corpus, candidates):
+        """
+        Selects the sections and subsections worth scoring densely: the `candidates` best
+        of each by BM25 over the corpus' lexical index, plus every one whose embeddings are
+        already cached, since scoring those costs no encoding.
+
+        Returns:
+            A tuple of the selected rankable section offsets and subsection offsets, both in
+            corpus order so that score ties break as in a full ranking.
+        """
+        index = corpus.ensure_lexical_index()
+        section_ids = corpus.sections_with_text()
+        subsection_ids = np.arange(corpus.num_subsections)
+
+        # Only sections with body text compete for the lexical candidate slots
+        section_mask = np.zeros(len(section_ids), dtype=bool)
+        section_mask[np.argsort(-index.sections.scores(query)[section_ids], kind="stable")[:candidates]] = True
+        section_mask |= self._cached_mask(corpus.section_titles(section_ids)) & \
+            self._cached_mask([corpus.section_text[i] for i in section_ids])
+        selected_sections = section_ids[section_mask]
+
+        subsection_mask = np.zeros(corpus.num_subsections, dtype=bool)
+        subsection_mask[index.subsections.top(query, candidates)] = True
+        subsection_mask |= self._cached_mask(corpus.subsection_text)
+        selected_subsections = subsection_ids[subsection_mask]
+
+        instrumentation.increment("lexical_sections_skipped", len(section_ids) - len(selected_sections))
+        instrumentation.increment("lexical_subsections_skipped", corpus.num_subsections - len(selected_subsections))
+        logging.info(
+            f"Lexical prefilter kept {len(selected_sections)} of {len(section_ids)} sections and "
+            f"{len(selected_subsections)} of {corpus.num_subsections} subsections."
+        )
+        return selected_sections, selected_subsections
+
+    def _score_corpus(self, query_embedding, corpus, section_ids=None, subsection_ids=None):
+        """
+        Encodes and scores the rankable sections and subsections of a corpus.
+
+        Args:
+            query_embedding: The embedding of the query.
+            corpus: The `Corpus` to score.
+            section_ids, subsection_ids: Optional offsets restricting scoring to these
+                sections and subsections. By default everything rankable is scored, or
+                for an `IndexedCorpus` everything in the probed IVF partitions.
+
+        Returns:
+            A tuple of the offsets of the scored sections, their weighted title/content
+            scores, their content embeddings, the offsets of the scored subsections, their
+            scores and their embeddings. Score and embedding rows are aligned with the offsets.
+        """
+        if isinstance(corpus, IndexedCorpus):
+            # Passages are already embedded: score them straight from the index matrix
+            if section_ids is None and subsection_ids is None:
+                section_ids, subsection_ids = corpus.probe(query_embedding)
+            title_sims, content_sims, content_embeddings, subsection_scores, subsection_embeddings = \
+                corpus.similarities(query_embedding, section_ids, subsection_ids)
+            section_scores = (title_sims * TITLE_WEIGHT) + (content_sims * CONTENT_WEIGHT)
+            return section_ids, section_scores, content_embeddings, subsection_ids, subsection_scores, subsection_embeddings
+
+        section_ids = corpus.sections_with_text() if section_ids is None else section_ids
+        subsection_ids = np.arange(corpus.num_subsections) if subsection_ids is None else subsection_ids
+        title_embeddings, content_embeddings, subsection_embeddings = self._embed_groups(
+            corpus.section_titles(section_ids),
+            [corpus.section_text[i] for i in section_ids],
+            [corpus.subsection_text[j] for j in subsection_ids],
+        )
+
+        section_scores = np.empty(0, dtype=np.float32)
+        if len(section_ids):
+            title_sims = _query_similarities(query_embedding, title_embeddings)
+            content_sims = _query_similarities(query_embedding, content_embeddings)
+            section_scores = (title_sims * TITLE_WEIGHT) + (content_sims * CONTENT_WEIGHT)
+        subsection_scores = np.empty(0, dtype=np.float32)
+        if len(subsection_ids):
+            subsection_scores = _query_similarities(query_embedding, subsection_embeddings)
+        return section_ids, section_scores, content_embeddings, subsection_ids, subsection_scores, subsection_embeddings
+
+    def _score_hierarchically(self, query_embedding, corpus, top_sections, section_ids=None, subsection_ids=None):
+        """
+        Scores the sections first and then only the subsections of the `top_sections` best
+        sections, so the subsections of low-scoring sections are never embedded. Texts
+        already embedded as a title or section body are reused for the subsections.
+
+        The number of subsections skipped and of texts that a flat ranking would have
+        encoded additionally are logged and kept in `last_hierarchical_stats`.
+
+        Takes the same arguments as `_score_corpus` and returns the same tuple.
+        """
+        section_ids = corpus.sections_with_text() if section_ids is None else section_ids
+        subsection_ids = np.arange(corpus.num_subsections) if subsection_ids is None else subsection_ids
+        titles = corpus.section_titles(section_ids)
+        contents = [corpus.section_text[i] for i in section_ids]
+        title_embeddings, content_embeddings = self._embed_groups(titles, contents)
+        section_stats = self.last_dedup_stats
+
+        section_scores = np.empty(0, dtype=np.float32)
+        if len(section_ids):
+            title_sims = _query_similarities(query_embedding, title_embeddings)
+            content_sims = _query_similarities(query_embedding, content_embeddings)
+            section_scores = (title_sims * TITLE_WEIGHT) + (content_sims * CONTENT_WEIGHT)
+
+        # Only the subsections of the best sections compete, ties kept in corpus order
+        expanded = section_ids[np.argsort(-section_scores, kind="stable")[:top_sections]]
+        candidate_ids = subsection_ids
+        subsection_ids = candidate_ids[np.isin(corpus.subsection_section[candidate_ids], expanded)]
+        subsection_texts = [corpus.subsection_text[j] for j in subsection_ids]
+        known = {}
+        if len(section_ids):
+            known = dict(zip((_normalize_text(text) for text in titles), title_embeddings))
+            known.update(zip((_normalize_text(text) for text in contents), content_embeddings))
+        (subsection_embeddings,) = self._embed_groups(subsection_texts, known=known)
+        subsection_stats = self.last_dedup_stats
+
+        subsection_scores = np.empty(0, dtype=np.float32)
+        if len(subsection_ids):
+            subsection_scores = _query_similarities(query_embedding, subsection_embeddings)
+
+        texts = section_stats["texts"] + subsection_stats["texts"]
+        encoded = section_stats["unique_texts"] + subsection_stats["unique_texts"]
+        self.last_dedup_stats = {
+            "texts": texts,
+            "unique_texts": encoded,
+            "dedup_ratio": round(1 - encoded / texts, 4) if texts else 0.0,
+        }
+        # A flat ranking encodes every distinct title, body and candidate subsection once
+        flat_texts = set(known) | {_normalize_text(corpus.subsection_text[j]) for j in candidate_ids}
+        self.last_hierarchical_stats = {
+            "sections_expanded": len(expanded),
+            "subsections_embedded": len(subsection_ids),
+            "subsections_skipped": len(candidate_ids) - len(subsection_ids),
+            "encodes_saved": max(len(flat_texts) - encoded, 0),
+        }
+        instrumentation.increment("hierarchical_subsections_skipped", self.last_hierarchical_stats["subsections_skipped"])
+        instrumentation.increment("hierarchical_encodes_saved", self.last_hierarchical_stats["encodes_saved"])
+        logging.info(
+            f"Hierarchical ranking embedded the subsections of {len(expanded)} of {len(section_ids)} sections "
+            f"({len(subsection_ids)} of {len(candidate_ids)} subsections, {self.last_hierarchical_stats['encodes_saved']} encodes saved)."
+        )
+        return section_ids, section_scores, content_embeddings, subsection_ids, subsection_scores, subsection_embeddings
+
+    def rank(self, query: str, extracted_data, top_k: int = TOP_K, pool_size: int = CANDIDATE_POOL_SIZE, lambda_val: float = MMR_LAMBDA,
+             lexical_candidates: int = None, hierarchical_sections: int = None, near_duplicate_threshold: float = None):
+        """
+        Ranks the sections and subsections of the extracted documents against a query.
+
+        Args:
+            query: The persona and task description.
+            extracted_data: A `Corpus`, or the sections produced by `extract_all_documents`.
+            top_k: Number of sections and subsections to return.
+            pool_size: Number of top-scoring candidates that MMR chooses from.
+            lambda_val: MMR trade-off between diversity (0.0) and relevance (1.0).
+            lexical_candidates: Size of the BM25 first stage; 0 scores the whole corpus
+                densely. Defaults to the engine's `lexical_candidates`.
+            hierarchical_sections: Number of top sections whose subsections are embedded
+                and ranked; 0 ranks every subsection. Defaults to the engine's
+                `hierarchical_sections`.
+            near_duplicate_threshold: Shingle similarity above which passages are collapsed
+                before ranking; 0 keeps them all. Defaults to the engine's
+                `near_duplicate_threshold`.
+
+        Returns:
+            A tuple of the ranked sections and the ranked subsections.
+        """
+        corpus = extracted_data if isinstance(extracted_data, Corpus) else Corpus.from_sections(extracted_data)
+        self.last_hierarchical_stats = None
+        if not corpus.num_sections:
+            return [], []
+        corpus = self._remove_near_duplicates(corpus, near_duplicate_threshold)
 
-        # Apply MMR to subsections
-        if candidate_subsections:
-            subsection_embeddings_pool = np.array([s['embedding'] for s in candidate_subsections])
-            diversified_subsections = self._apply_mmr(query_embedding, subsection_embeddings_pool, candidate_subsections)
+        lexical_candidates = self.lexical_candidates if lexical_candidates is None else lexical_candidates
+        section_ids = subsection_ids = None
+        # Indexed passages cost no encoding, so the lexical first stage would only lose recall
+        if lexical_candidates and not isinstance(corpus, IndexedCorpus) \
+                and max(corpus.num_sections, corpus.num_subsections) > lexical_candidates:
+            with instrumentation.span("lexical_prefilter", candidates=lexical_candidates):
+                section_ids, subsection_ids = self._lexical_prefilter(query, corpus, lexical_candidates)
+
+        query_embedding = self.embedding_model.get_embeddings(query)
+        hierarchical_sections = self.hierarchical_sections if hierarchical_sections is None else hierarchical_sections
+        # Indexed subsections are already embedded, so there is nothing to save by skipping them
+        if hierarchical_sections and not isinstance(corpus, IndexedCorpus):
+            with instrumentation.span("hierarchical_scoring", sections=hierarchical_sections):
+                section_ids, section_scores, content_embeddings, subsection_ids, subsection_scores, subsection_embeddings = \
+                    self._score_hierarchically(query_embedding, corpus, hierarchical_sections, section_ids, subsection_ids)
         else:
-            diversified_subsections = []
+            section_ids, section_scores, content_embeddings, subsection_ids, subsection_scores, subsection_embeddings = \
+                self._score_corpus(query_embedding, corpus, section_ids, subsection_ids)
+        return self._diversify(
+            query_embedding, corpus, section_ids, section_scores, content_embeddings,
+            subsection_ids, subsection_scores, subsection_embeddings, top_k, pool_size, lambda_val,
+        )
+
+    def rank_many(self, queries, extracted_data, top_k: int = TOP_K, pool_size: int = CANDIDATE_POOL_SIZE,
+                  lambda_val: float = MMR_LAMBDA, near_duplicate_threshold: float = None):
+        """
+        Ranks the same corpus against several queries, e.g. many persona/task pairs over
+        one document set.
+
+        The passages are embedded once and all queries in one encode call; the similarities
+        of every passage to every query come from a single matrix product per column kind.
+        Only the candidate pools and MMR run per query. The whole corpus is scored: neither
+        the lexical first stage, IVF probing nor hierarchical ranking is applied, as they
+        all select per query. Near-duplicate removal is applied once for all queries.
+
+        Args:
+            queries: The query strings.
+            extracted_data: A `Corpus`, or the sections produced by `extract_all_documents`.
+            top_k, pool_size, lambda_val, near_duplicate_threshold: Ranking parameters, see `rank`.
+
+        Returns:
+            One (ranked sections, ranked subsections) tuple per query, as returned by `rank`.
+        """
+        corpus = extracted_data if isinstance(extracted_data, Corpus) else Corpus.from_sections(extracted_data)
+        if not corpus.num_sections or not queries:
+            return [([], []) for _ in queries]
+        corpus = self._remove_near_duplicates(corpus, near_duplicate_threshold)
+
+        query_embeddings = np.asarray(self.embedding_model.get_embeddings(list(queries)), dtype=np.float32)
+        query_embeddings = query_embeddings.reshape(len(queries), -1)
+        section_ids, subsection_ids = corpus.sections_with_text(), np.arange(corpus.num_subsections)
+        with instrumentation.span("multi_query_scoring", queries=len(queries)):
+            if isinstance(corpus, IndexedCorpus):
+                title_sims, content_sims, content_embeddings, subsection_sims, subsection_embeddings = \
+                    corpus.similarities(query_embeddings, section_ids, subsection_ids, many_queries=True)
+            else:
+                title_embeddings, content_embeddings, subsection_embeddings = self._embed_groups(
+                    corpus.section_titles(section_ids),
+                    [corpus.section_text[i] for i in section_ids],
+                    [corpus.subsection_text[j] for j in subsection_ids],
+                )
+                empty = np.empty((0, len(queries)), dtype=np.float32)
+                title_sims = _similarity_matrix(query_embeddings, title_embeddings) if len(section_ids) else empty
+                content_sims = _similarity_matrix(query_embeddings, content_embeddings) if len(section_ids) else empty
+                subsection_sims = _similarity_matrix(query_embeddings, subsection_embeddings) if len(subsection_ids) else empty
+            section_sims = (title_sims * TITLE_WEIGHT) + (content_sims * CONTENT_WEIGHT)
+
+        return [
+            self._diversify(
+                query_embeddings[q], corpus, section_ids, section_sims[:, q], content_embeddings,
+                subsection_ids, subsection_sims[:, q], subsection_embeddings, top_k, pool_size, lambda_val,
+            ) for q in range(len(queries))
+        ]
+
+    def _remove_near_duplicates(self, corpus, threshold=None):
+        """Collapses near-duplicate passages of the corpus when a threshold is set (by default the engine's)."""
+        threshold = parse_near_duplicate_threshold(self.near_duplicate_threshold if threshold is None else threshold)
+        if not threshold:
+            return corpus
+        with instrumentation.span("near_duplicate_removal", threshold=threshold):
+            return remove_near_duplicates(corpus, threshold)
+
+    def _diversify(self, query_embedding, corpus, section_ids, section_scores, content_embeddings,
+                   subsection_ids, subsection_scores, subsection_embeddings, top_k, pool_size, lambda_val):
+        """Picks the candidate pools from the scores of one query, re-ranks them with MMR and formats the results."""
+        # --- Candidate pools: the best-scoring rows, ties kept in corpus order ---
+        section_pool = np.argsort(-section_scores, kind="stable")[:pool_size]
+        subsection_pool = np.argsort(-subsection_scores, kind="stable")[:pool_size]
+
+        # --- Re-rank the candidates with MMR for diversity ---
+        with instrumentation.span("mmr", candidates=len(section_pool) + len(subsection_pool)):
+            diversified_sections = [
+                corpus.section(section_ids[i]) for i in self._apply_mmr(
+                    query_embedding, content_embeddings[section_pool], section_pool, top_k, lambda_val
+                )
+            ] if len(section_pool) else []
+            diversified_subsections = [
+                corpus.subsection(subsection_ids[j]) for j in self._apply_mmr(
+                    query_embedding, subsection_embeddings[subsection_pool], subsection_pool, top_k, lambda_val
+                )
+            ] if len(subsection_pool) else []
+
+        return self._format_results(diversified_sections, diversified_subsections)
 
-        # Format final output with the diversified lists
+    @staticmethod
+    def _format_results(diversified_sections, diversified_subsections):
+        """Formats the diversified section and subsection records into the output records."""
         final_ranked_sections = [
             {
-                "document": s['filename'],
-                "page_number": s['page_number'],
-                "section_title": s['section_title'],
+                "document": s.document,
+                "page_number": s.page_number,
+                "section_title": s.section_title,
                 "importance_rank": i + 1,
+                **_duplicate_sources(s),
             } for i, s in enumerate(diversified_sections)
         ]
 
         final_ranked_subsections = [
             {
-                "document": sub.get('filename'),
-                "refined_text": sub['text'],
-                "page_number_constraints": [sub['page_number']],
+                "document": sub.document,
+                "refined_text": sub.text,
+                "page_number_constraints": [sub.page_number],
+                **_duplicate_sources(sub),
             } for i, sub in enumerate(diversified_subsections)
         ]
         
-        return final_ranked_sections, final_ranked_subsections
\ No newline at end of file
+        return final_ranked_sections, final_ranked_subsections
@@ -0,0 +1,467 @@
+import os
+import json
+import pickle
+import zlib
+import logging
+import tempfile
+import numpy as np
+
+from app import instrumentation
+from app.processing.cache import file_content_hash, parser_settings_fingerprint
+from app.processing.corpus import Corpus
+from app.ranking.cache import model_identity
+from app.config import (
+    CORPUS_INDEX_DIR, INDEX_MAX_DEAD_FRACTION, IVF_PROBE, IVF_ITERATIONS, EXTRACTION_WORKERS,
+)
+
+INDEX_VERSION = 1
+INDEX_FILENAME = "index.json"
+VECTORS_FILENAME = "vectors.bin"
+CENTROIDS_FILENAME = "ivf_centroids.npy"
+CLUSTERS_FILENAME = "ivf_clusters.npy"
+DOCUMENTS_DIRNAME = "documents"
+
+def _unit_rows(matrix):
+    """Scales every row of a float32 matrix to unit length, leaving all-zero rows untouched."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+class IndexedRows:
+    """Rows of the index matrix that are only gathered when they are indexed, e.g. for the MMR pool."""
+    def __init__(self, vectors, rows):
+        self.vectors = vectors
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, items):
+        return np.asarray(self.vectors[self.rows[items]], dtype=np.float32)
+
+class IndexedCorpus(Corpus):
+    """
+    A `Corpus` whose embeddings live in a `CorpusIndex`.
+
+    Next to the usual columns it maps every section to the index rows of its title and
+    content embedding (-1 for sections without text, which are not ranked) and every
+    subsection to its row, so `RankingEngine` scores it without encoding any passage.
+    """
+    def attach(self, vectors, title_rows, content_rows, subsection_rows, centroids=None, clusters=None, ivf_probe=0):
+        self.vectors = vectors
+        self.title_rows = title_rows
+        self.content_rows = content_rows
+        self.subsection_rows = subsection_rows
+        self.centroids = centroids
+        self.clusters = clusters
+        self.ivf_probe = ivf_probe
+        return self
+
+    def subset(self, section_ids, subsection_ids):
+        return super().subset(section_ids, subsection_ids).attach(
+            self.vectors, self.title_rows[section_ids], self.content_rows[section_ids], self.subsection_rows[subsection_ids],
+            self.centroids, self.clusters, self.ivf_probe,
+        )
+
+    def probe(self, query_embedding):
+        """
+        Selects the sections and subsections in the `ivf_probe` partitions closest to the
+        query. Without a trained partitioning every rankable item is returned.
+        """
+        section_ids = self.sections_with_text()
+        subsection_ids = np.arange(self.num_subsections)
+        if self.centroids is None or not self.ivf_probe or self.ivf_probe >= len(self.centroids):
+            return section_ids, subsection_ids
+
+        query_unit = _unit_rows(np.reshape(query_embedding, (1, -1)))[0]
+        probed = np.zeros(len(self.centroids), dtype=bool)
+        probed[np.argsort(-(self.centroids @ query_unit), kind="stable")[:self.ivf_probe]] = True
+        section_ids = section_ids[probed[self.clusters[self.content_rows[section_ids]]]]
+        subsection_ids = subsection_ids[probed[self.clusters[self.subsection_rows]]]
+        instrumentation.increment("ivf_items_skipped", self.num_subsections - len(subsection_ids))
+        return section_ids, subsection_ids
+
+    def similarities(self, query_embedding, section_ids, subsection_ids, many_queries=False):
+        """
+        Scores sections and subsections with one matrix-vector product over the index. With
+        `many_queries`, `query_embedding` holds one query per row and a single matrix product
+        returns one score column per query.
+
+        When the requested rows cover most of the index, the product runs over the whole
+        memory-mapped matrix and the scores are picked afterwards; otherwise only the
+        requested rows are gathered first.
+
+        Returns:
+            A tuple of the title similarities, content similarities and content embeddings
+            of the sections, and the similarities and embeddings of the subsections.
+        """
+        if many_queries:
+            query_unit = _unit_rows(query_embedding).T
+        else:
+            query_unit = _unit_rows(np.reshape(query_embedding, (1, -1)))[0]
+        rows = np.concatenate([
+            self.title_rows[section_ids], self.content_rows[section_ids], self.subsection_rows[subsection_ids],
+        ])
+        with instrumentation.span("index_scan", rows=len(rows)):
+            if len(rows) * 2 >= len(self.vectors):
+                sims = (self.vectors @ query_unit)[rows]
+            else:
+                sims = np.asarray(self.vectors[rows], dtype=np.float32) @ query_unit
+        n = len(section_ids)
+        return (
+            sims[:n], sims[n:2 * n], IndexedRows(self.vectors, self.content_rows[section_ids]),
+            sims[2 * n:], IndexedRows(self.vectors, self.subsection_rows[subsection_ids]),
+        )
+
+class CorpusIndex:
+    """
+    A persistent index of the section and subsection embeddings of a document set.
+
+    Every document occupies a contiguous run of rows in one memory-mapped float32
+    matrix: the title and content vectors of its rankable sections followed by its
+    subsection vectors, all normalized to unit length. The parsed columns of each document
+    are stored next to it, so a query against indexed documents needs neither extraction
+    nor passage encoding. Documents are keyed by absolute path and validated by size and
+    modification time, falling back to the content hash, so only new or changed PDFs are
+    parsed and embedded again. Removing or replacing a document leaves its rows dead
+    until more than `INDEX_MAX_DEAD_FRACTION` of the matrix is dead, then the matrix is
+    compacted.
+
+    `train_ivf` optionally partitions the vectors with spherical k-means; queries then only
+    score the items in the `ivf_probe` partitions nearest to the query. The index is
+    bound to one embedding model and one set of parser settings and is rebuilt if either
+    changes. It is meant to be used by a single process at a time.
+    """
+    def __init__(self, ranking_engine, index_dir: str = CORPUS_INDEX_DIR, workers: int = EXTRACTION_WORKERS,
+                 cache=None, ocr_cache=None, ivf_probe: int = IVF_PROBE):
+        """
+        Initializes the CorpusIndex.
+
+        Args:
+            ranking_engine: The `RankingEngine` whose embedding model fills the index.
+            index_dir: Directory of the index. Created if missing.
+            workers, cache, ocr_cache: Extraction settings for new documents, see `extract_all_documents`.
+            ivf_probe: Number of IVF partitions searched per query once `train_ivf` has run.
+        """
+        self.engine = ranking_engine
+        self.directory = index_dir
+        self.workers = workers
+        self.cache = cache
+        self.ocr_cache = ocr_cache
+        self.ivf_probe = ivf_probe
+        model = ranking_engine.embedding_model
+        self.long_text_mode = model.long_text_mode
+        self.model_identity = model_identity(model.model_path, model.backend, model.onnx_model_path, model.long_text_mode)
+        self.parser_fingerprint = parser_settings_fingerprint()
+        self.dim = None
+        self.rows = 0
+        self.documents = {}  # absolute path -> document entry
+        self.vectors = None
+        self.centroids = None
+        self.clusters = np.empty(0, dtype=np.int32)
+        self._corpora = {}
+        os.makedirs(os.path.join(index_dir, DOCUMENTS_DIRNAME), exist_ok=True)
+        self._load()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def __len__(self):
+        return len(self.documents)
+
+    def _load(self):
+        """Opens an existing index, starting over if it belongs to another model or parser configuration."""
+        if not os.path.exists(self._path(INDEX_FILENAME)):
+            return
+        try:
+            with open(self._path(INDEX_FILENAME), 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if (index["version"], index["model"], index["parser"]) != (INDEX_VERSION, self.model_identity, self.parser_fingerprint):
+                built_mode = index.get("long_text_mode", self.long_text_mode)
+                if built_mode != self.long_text_mode:
+                    logging.warning(f"Corpus index was built with long text mode '{built_mode}', not "
+                                    f"'{self.long_text_mode}'. Rebuilding it; pass the same mode to every tool using it.")
+                else:
+                    logging.info("Corpus index was built with another model or parser configuration. Rebuilding it.")
+                self._reset()
+                return
+            self.dim, self.rows, self.documents = index["dim"], index["rows"], index["documents"]
+            if self.dim:
+                self._map_vectors()
+            # Indexes written before the flag existed are trained if their IVF files exist
+            if index.get("ivf", os.path.exists(self._path(CENTROIDS_FILENAME))):
+                self._load_ivf()
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Ignoring unreadable corpus index at {self.directory}: {e}")
+            self._reset()
+
+    def _load_ivf(self):
+        """Loads the IVF partitioning, dropping it if its assignments do not cover exactly the index rows."""
+        centroids = np.load(self._path(CENTROIDS_FILENAME))
+        clusters = np.load(self._path(CLUSTERS_FILENAME))
+        if len(clusters) != self.rows or (self.dim and centroids.shape[1] != self.dim):
+            logging.warning("Corpus index IVF partitioning does not match the indexed vectors. Ignoring it; train it again.")
+            return
+        self.centroids, self.clusters = centroids, clusters
+
+    def _reset(self):
+        """Starts over with an empty index, deleting the files of the previous one."""
+        self.dim, self.rows, self.documents, self.vectors = None, 0, {}, None
+        self.centroids, self.clusters = None, np.empty(0, dtype=np.int32)
+        self._corpora = {}
+        documents_dir = self._path(DOCUMENTS_DIRNAME)
+        leftovers = [os.path.join(DOCUMENTS_DIRNAME, name) for name in os.listdir(documents_dir)]
+        for name in [INDEX_FILENAME, VECTORS_FILENAME, CENTROIDS_FILENAME, CLUSTERS_FILENAME] + leftovers:
+            try:
+                os.remove(self._path(name))
+            except FileNotFoundError:
+                pass
+
+    def _map_vectors(self):
+        """Memory-maps the vector file using its current size as capacity."""
+        path = self._path(VECTORS_FILENAME)
+        capacity = os.path.getsize(path) // (self.dim * 4) if os.path.exists(path) else 0
+        self.vectors = np.memmap(path, dtype=np.float32, mode='r+', shape=(capacity, self.dim)) if capacity else None
+
+    def _reserve(self, rows_needed):
+        """Grows the vector file geometrically so appends stay amortized O(1)."""
+        capacity = 0 if self.vectors is None else self.vectors.shape[0]
+        if rows_needed <= capacity:
+            return
+        if self.vectors is not None:
+            self.vectors.flush()
+        with open(self._path(VECTORS_FILENAME), 'ab') as f:
+            f.truncate(max(rows_needed, 2 * capacity, 1024) * self.dim * 4)
+        self._map_vectors()
+
+    def save(self):
+        """Writes pending vectors, the IVF assignments and the document table to disk."""
+        if self.vectors is not None:
+            self.vectors.flush()
+        if self.centroids is not None:
+            np.save(self._path(CENTROIDS_FILENAME), self.centroids)
+            np.save(self._path(CLUSTERS_FILENAME), self.clusters)
+        index = {
+            "version": INDEX_VERSION, "model": self.model_identity, "parser": self.parser_fingerprint,
+            "dim": self.dim, "rows": self.rows, "documents": self.documents, "ivf": self.centroids is not None,
+            "long_text_mode": self.long_text_mode,
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self._path(INDEX_FILENAME))
+
+    def _is_current(self, key, pdf_path):
+        """Checks whether the indexed version of a document matches the file on disk."""
+        entry = self.documents.get(key)
+        if entry is None:
+            return False
+        stat = os.stat(pdf_path)
+        if (entry["size"], entry["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+            return True
+        if file_content_hash(pdf_path) != entry["sha256"]:
+            return False
+        entry["size"], entry["mtime_ns"] = stat.st_size, stat.st_mtime_ns  # Touched but unchanged
+        return True
+
+    def update(self, pdf_paths):
+        """
+        Indexes the given PDFs that are new or changed since they were indexed, parsing and
+        embedding only those. Missing files are reported and skipped.
+
+        Returns:
+            The paths that were (re-)indexed.
+        """
+        # Extraction (and PyMuPDF) is only needed when documents have to be indexed
+        from app.processing.pdf_parser import extract_documents
+
+        stale = []
+        for pdf_path in dict.fromkeys(pdf_paths):
+            if not os.path.exists(pdf_path):
+                print(f"Warning: File not found at {pdf_path}. Skipping.")
+            elif not self._is_current(os.path.abspath(pdf_path), pdf_path):
+                stale.append(pdf_path)
+        if stale:
+            print(f" -> Indexing {len(stale)} new or changed document(s)...")
+            for pdf_path, sections in extract_documents(stale, workers=self.workers, cache=self.cache, ocr_cache=self.ocr_cache):
+                self._add(pdf_path, Corpus.from_sections(sections))
+            self._compact_if_needed()
+        self.save()
+        return stale
+
+    def _add(self, pdf_path, corpus):
+        """Embeds one parsed document and appends it, replacing an older version of it."""
+        key = os.path.abspath(pdf_path)
+        self._drop(key)
+        section_ids = corpus.sections_with_text()
+        title_embeddings, content_embeddings, subsection_embeddings = self.engine._embed_groups(
+            corpus.section_titles(section_ids),
+            [corpus.section_text[i] for i in section_ids],
+            corpus.subsection_text,
+        )
+        vectors = [_unit_rows(e) for e in (title_embeddings, content_embeddings, subsection_embeddings) if len(e)]
+        vectors = np.vstack(vectors) if vectors else np.empty((0, self.dim or 0), dtype=np.float32)
+
+        if len(vectors):
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            self._reserve(self.rows + len(vectors))
+            self.vectors[self.rows:self.rows + len(vectors)] = vectors
+            if self.centroids is not None:
+                self.clusters = np.concatenate([self.clusters, self._assign(vectors)])
+
+        stat = os.stat(pdf_path)
+        entry = {
+            "sha256": file_content_hash(pdf_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+            "start": self.rows, "sections": len(section_ids), "subsections": corpus.num_subsections,
+        }
+        entry["file"] = os.path.join(DOCUMENTS_DIRNAME, f"{entry['sha256'][:32]}.corpus")
+        with open(self._path(entry["file"]), 'wb') as f:
+            f.write(zlib.compress(pickle.dumps(corpus, protocol=pickle.HIGHEST_PROTOCOL)))
+        self.rows += len(vectors)
+        self.documents[key] = entry
+        self._corpora[key] = corpus
+        instrumentation.increment("documents_indexed")
+
+    def _drop(self, key):
+        """Forgets a document; its rows stay in the matrix as dead rows until compaction."""
+        entry = self.documents.pop(key, None)
+        self._corpora.pop(key, None)
+        if entry is not None and not any(e["file"] == entry["file"] for e in self.documents.values()):
+            try:
+                os.remove(self._path(entry["file"]))
+            except OSError:
+                pass
+
+    def remove(self, pdf_paths):
+        """Removes documents from the index. Returns the paths that were indexed."""
+        removed = [path for path in pdf_paths if os.path.abspath(path) in self.documents]
+        for path in removed:
+            self._drop(os.path.abspath(path))
+        self._compact_if_needed()
+        self.save()
+        return removed
+
+    @staticmethod
+    def _entry_rows(entry):
+        return 2 * entry["sections"] + entry["subsections"]
+
+    def _compact_if_needed(self):
+        """Compacts the matrix once too many of its rows belong to removed or replaced documents."""
+        live = sum(self._entry_rows(entry) for entry in self.documents.values())
+        if self.rows and self.rows - live > INDEX_MAX_DEAD_FRACTION * self.rows:
+            self.compact()
+
+    def compact(self):
+        """Rewrites the vector file with only the rows of indexed documents, in document order."""
+        keys = sorted(self.documents, key=lambda key: self.documents[key]["start"])
+        old_rows = np.concatenate(
+            [np.arange(self.documents[key]["start"], self.documents[key]["start"] + self._entry_rows(self.documents[key]))
+             for key in keys]
+        ) if keys else np.empty(0, dtype=np.int64)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        if len(old_rows):
+            compacted = np.memmap(tmp_path, dtype=np.float32, mode='w+', shape=(len(old_rows), self.dim))
+            compacted[:] = self.vectors[old_rows]
+            compacted.flush()
+            del compacted
+        self.vectors = None
+        os.replace(tmp_path, self._path(VECTORS_FILENAME))
+
+        start = 0
+        for key in keys:
+            self.documents[key]["start"] = start
+            start += self._entry_rows(self.documents[key])
+        if self.centroids is not None:
+            self.clusters = self.clusters[old_rows]
+        self.rows = len(old_rows)
+        if self.dim:
+            self._map_vectors()
+        self.save()
+
+    def _assign(self, vectors):
+        """Returns the nearest IVF centroid of every vector."""
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def train_ivf(self, lists: int, iterations: int = IVF_ITERATIONS, seed: int = 0):
+        """
+        Partitions the indexed vectors into `lists` clusters with spherical k-means on the
+        content and subsection vectors. A section's title row joins its content's cluster,
+        so a section is always scored as a whole. Documents added later are assigned to
+        the nearest existing centroid; train again after large changes.
+
+        Raises:
+            ValueError: If `lists` is less than 1.
+        """
+        if lists < 1:
+            raise ValueError(f"The number of IVF lists must be at least 1, got {lists}")
+        self.compact()
+        if not self.rows:
+            return
+        item_rows = np.concatenate([
+            np.arange(entry["start"] + entry["sections"], entry["start"] + self._entry_rows(entry))
+            for entry in self.documents.values()
+        ])
+        items = np.asarray(self.vectors[item_rows], dtype=np.float32)
+        lists = min(lists, len(items))
+        rng = np.random.default_rng(seed)
+        centroids = items[rng.choice(len(items), size=lists, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(items @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, items)
+            filled = np.bincount(assignment, minlength=lists) > 0
+            centroids[filled] = _unit_rows(sums[filled])
+        self.centroids = centroids
+
+        self.clusters = np.full(self.rows, -1, dtype=np.int32)
+        self.clusters[item_rows] = self._assign(items)
+        for entry in self.documents.values():
+            titles = np.arange(entry["start"], entry["start"] + entry["sections"])
+            self.clusters[titles] = self.clusters[titles + entry["sections"]]
+        self.save()
+
+    def _load_corpus(self, key):
+        corpus = self._corpora.get(key)
+        if corpus is None:
+            with open(self._path(self.documents[key]["file"]), 'rb') as f:
+                corpus = pickle.loads(zlib.decompress(f.read()))
+            # Files are named by content, so the stored corpus may come from another path
+            # with the same bytes; its sections belong to the document requested here
+            corpus.documents = [os.path.basename(key)] * len(corpus.documents)
+            self._corpora[key] = corpus
+        return corpus
+
+    def get_corpus(self, pdf_paths):
+        """
+        Returns an `IndexedCorpus` of the given PDFs in order, indexing new or changed
+        documents first. Provides the interface of `DocumentStore`, so `process_request`
+        can run on the index directly.
+        """
+        self.update(pdf_paths)
+        keys = [key for key in (os.path.abspath(path) for path in pdf_paths) if key in self.documents]
+
+        title_rows, content_rows, subsection_rows = [], [], []
+        for key in keys:
+            entry, corpus = self.documents[key], self._load_corpus(key)
+            section_ids = corpus.sections_with_text()
+            start, count = entry["start"], entry["sections"]
+            titles = np.full(corpus.num_sections, -1, dtype=np.int64)
+            contents = np.full(corpus.num_sections, -1, dtype=np.int64)
+            titles[section_ids] = start + np.arange(count)
+            contents[section_ids] = start + count + np.arange(count)
+            title_rows.append(titles)
+            content_rows.append(contents)
+            subsection_rows.append(start + 2 * count + np.arange(entry["subsections"]))
+
+        corpus = IndexedCorpus.concatenate(self._load_corpus(key) for key in keys)
+        concat = lambda parts: np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+        vectors = self.vectors[:self.rows] if self.vectors is not None else np.empty((0, self.dim or 0), dtype=np.float32)
+        return corpus.attach(
+            vectors, concat(title_rows), concat(content_rows), concat(subsection_rows),
+            centroids=self.centroids, clusters=self.clusters if self.centroids is not None else None,
+            ivf_probe=self.ivf_probe,
+        )
@@ -0,0 +1,120 @@
+import re
+from collections import Counter
+
+import numpy as np
+
+from app.config import BM25_K1, BM25_B
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def tokenize(text):
+    """Splits a text into lowercase word tokens."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+class BM25Index:
+    """
+    An in-memory inverted index scoring a fixed list of texts with Okapi BM25.
+
+    Every term maps to a posting list of (text offsets, term frequencies) arrays. Term
+    statistics are only evaluated at query time, so indexes built per document can be
+    concatenated into the index of a larger corpus without re-tokenizing anything.
+    """
+    def __init__(self, postings=None, lengths=None, k1: float = BM25_K1, b: float = BM25_B):
+        self.postings = postings or {}
+        self.lengths = np.asarray(lengths if lengths is not None else [], dtype=np.int32)
+        self.k1 = k1
+        self.b = b
+
+    @classmethod
+    def build(cls, texts):
+        """Tokenizes and indexes a list of texts."""
+        postings, lengths = {}, []
+        for offset, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            for term, frequency in Counter(tokens).items():
+                offsets, frequencies = postings.setdefault(term, ([], []))
+                offsets.append(offset)
+                frequencies.append(frequency)
+        return cls(
+            {term: (np.array(offsets, dtype=np.int32), np.array(frequencies, dtype=np.int32))
+             for term, (offsets, frequencies) in postings.items()},
+            lengths,
+        )
+
+    @classmethod
+    def concatenate(cls, indexes):
+        """Joins several indexes into one whose texts follow each other in the given order."""
+        indexes = list(indexes)
+        parts, offset = {}, 0
+        for index in indexes:
+            for term, (offsets, frequencies) in index.postings.items():
+                parts.setdefault(term, []).append((offsets + offset, frequencies))
+            offset += len(index)
+        postings = {
+            term: (np.concatenate([o for o, _ in chunks]), np.concatenate([f for _, f in chunks]))
+            for term, chunks in parts.items()
+        }
+        lengths = np.concatenate([index.lengths for index in indexes]) if indexes else None
+        return cls(postings, lengths)
+
+    def subset(self, offsets):
+        """Returns the index of the given texts (ascending offsets), renumbered in that order."""
+        offsets = np.asarray(offsets, dtype=np.int64)
+        positions = np.full(len(self), -1, dtype=np.int32)
+        positions[offsets] = np.arange(len(offsets), dtype=np.int32)
+        postings = {}
+        for term, (term_offsets, frequencies) in self.postings.items():
+            kept = positions[term_offsets] >= 0
+            if kept.any():
+                postings[term] = (positions[term_offsets[kept]], frequencies[kept])
+        return type(self)(postings, self.lengths[offsets], self.k1, self.b)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def scores(self, query):
+        """Returns the BM25 score of every indexed text for a query."""
+        scores = np.zeros(len(self), dtype=np.float32)
+        if not len(self):
+            return scores
+        length_norm = self.k1 * (1 - self.b + self.b * self.lengths / max(self.lengths.mean(), 1.0))
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            offsets, frequencies = self.postings[term]
+            idf = np.log(1 + (len(self) - len(offsets) + 0.5) / (len(offsets) + 0.5))
+            scores[offsets] += idf * frequencies * (self.k1 + 1) / (frequencies + length_norm[offsets])
+        return scores
+
+    def top(self, query, n):
+        """Returns the offsets of the `n` best-scoring texts, ties kept in index order."""
+        return np.argsort(-self.scores(query), kind="stable")[:n]
+
+class LexicalIndex:
+    """
+    The BM25 indexes of a `Corpus`: one over the sections (title and body text) and one
+    over the subsections, with offsets matching the corpus columns.
+    """
+    def __init__(self, sections: BM25Index, subsections: BM25Index):
+        self.sections = sections
+        self.subsections = subsections
+
+    @classmethod
+    def from_corpus(cls, corpus):
+        titles = corpus.section_titles(np.arange(corpus.num_sections))
+        return cls(
+            BM25Index.build(f"{title} {text}" for title, text in zip(titles, corpus.section_text)),
+            BM25Index.build(corpus.subsection_text),
+        )
+
+    @classmethod
+    def concatenate(cls, indexes):
+        indexes = list(indexes)
+        return cls(
+            BM25Index.concatenate(index.sections for index in indexes),
+            BM25Index.concatenate(index.subsections for index in indexes),
+        )
+
+    def subset(self, section_ids, subsection_ids):
+        return type(self)(self.sections.subset(section_ids), self.subsections.subset(subsection_ids))
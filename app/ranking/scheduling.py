@@ -0,0 +1,148 @@
+import re
+import numpy as np
+from typing import List
+
+from app import instrumentation
+from app.config import ENCODE_TOKEN_BUDGET, ENCODE_MAX_ITEMS_PER_BATCH, LONG_TEXT_MODE
+
+LONG_TEXT_MODES = ("truncate", "chunk")
+
+# WordPiece averages about 4 characters and 1.5 tokens per word of English prose. The
+# length estimate only orders texts and sizes batches, so it does not have to be exact
+CHARS_PER_TOKEN = 4
+TOKENS_PER_WORD = 1.5
+# [CLS] and [SEP]
+SPECIAL_TOKENS = 2
+
+_WORD = re.compile(r"\S+")
+
+def word_spans(text: str, max_words: int):
+    """Returns the end offsets of the first `max_words` whitespace-separated words of a text."""
+    ends = []
+    for match in _WORD.finditer(text):
+        ends.append(match.end())
+        if len(ends) == max_words:
+            break
+    return ends
+
+class EncodeScheduler:
+    """
+    Plans how a list of texts is fed to the encoder.
+
+    * Texts longer than the model's token window are cut before they are tokenized.
+      Every word yields at least one token and WordPiece tokenizes words independently,
+      so keeping the first `max_seq_length` words keeps every token the model would
+      have seen, while the tokenizer no longer processes text that is thrown away. In
+      "chunk" mode every text of more than `chunk_words` words, the number of words of
+      average prose that fill the window, is instead split into chunks of that size
+      whose embeddings are averaged (weighted by their word count) and re-normalized.
+    * The inputs are sorted by estimated token length, longest first, and grouped into
+      batches of at most `token_budget` padded tokens (and `max_batch_items` texts), so
+      short titles are not padded to the length of long sections and batches of short
+      texts get large.
+    """
+    def __init__(self, max_seq_length: int, token_budget: int = ENCODE_TOKEN_BUDGET,
+                 max_batch_items: int = ENCODE_MAX_ITEMS_PER_BATCH, long_text_mode: str = LONG_TEXT_MODE):
+        """
+        Initializes the EncodeScheduler.
+
+        Args:
+            max_seq_length: Token window of the model, including special tokens.
+            token_budget: Maximum number of (padded) tokens per encode batch.
+            max_batch_items: Maximum number of texts per encode batch.
+            long_text_mode: "truncate" or "chunk", see above.
+        """
+        if long_text_mode not in LONG_TEXT_MODES:
+            raise ValueError(f"Unknown long text mode '{long_text_mode}'. Expected one of: {', '.join(LONG_TEXT_MODES)}")
+        self.max_seq_length = max_seq_length
+        self.token_budget = token_budget
+        self.max_batch_items = max_batch_items
+        self.long_text_mode = long_text_mode
+        # Words per chunk such that a chunk of average prose fills the window
+        self.chunk_words = max(1, int((max_seq_length - SPECIAL_TOKENS) / TOKENS_PER_WORD))
+
+    def plan(self, texts: List[str]):
+        """
+        Cuts or chunks the texts that exceed the token window.
+
+        Returns:
+            A tuple of the model inputs, the index of the text each input belongs to, the
+            pooling weight of each input and its estimated token length.
+        """
+        inputs, owners, weights = [], [], []
+        truncated = chunked = 0
+        # Chunking starts below the window: texts of more words than a chunk would otherwise
+        # reach the model whole and lose their last tokens to its truncation
+        max_words = self.chunk_words if self.long_text_mode == "chunk" else self.max_seq_length
+        for i, text in enumerate(texts):
+            ends = word_spans(text, max_words + 1)
+            if len(ends) <= max_words:
+                inputs.append(text)
+                owners.append(i)
+                weights.append(1.0)
+            elif self.long_text_mode == "truncate":
+                inputs.append(text[:ends[self.max_seq_length - 1]])
+                owners.append(i)
+                weights.append(1.0)
+                truncated += 1
+            else:
+                starts = [match.start() for match in _WORD.finditer(text)]
+                for first in range(0, len(starts), self.chunk_words):
+                    last = min(first + self.chunk_words, len(starts))
+                    end = starts[last] if last < len(starts) else len(text)
+                    inputs.append(text[starts[first]:end])
+                    owners.append(i)
+                    weights.append(float(last - first))
+                chunked += 1
+
+        instrumentation.increment("texts_truncated_before_tokenizing", truncated)
+        instrumentation.increment("texts_chunked", chunked)
+        estimated = np.minimum(
+            np.fromiter((len(text) for text in inputs), dtype=np.int64, count=len(inputs)) // CHARS_PER_TOKEN + SPECIAL_TOKENS,
+            self.max_seq_length,
+        )
+        return inputs, np.asarray(owners, dtype=np.int64), np.asarray(weights, dtype=np.float32), estimated
+
+    def batches(self, estimated_lengths):
+        """
+        Groups input positions into batches, longest first, so that every batch holds at
+        most `token_budget` tokens once padded to its longest input.
+
+        Returns:
+            A list of index arrays into the inputs, each in input order.
+        """
+        order = np.argsort(-estimated_lengths, kind="stable")
+        batches, start = [], 0
+        while start < len(order):
+            # The first input of a batch is its longest, so it fixes the padded length
+            longest = max(int(estimated_lengths[order[start]]), 1)
+            size = min(max(self.token_budget // longest, 1), self.max_batch_items)
+            batches.append(np.sort(order[start:start + size]))
+            start += size
+        return batches
+
+    def encode(self, model, texts: List[str]) -> np.ndarray:
+        """Encodes the texts with a `SentenceTransformer.encode`-compatible model, returning unit vectors."""
+        inputs, owners, weights, estimated = self.plan(texts)
+        embeddings = None
+        for batch in self.batches(estimated):
+            instrumentation.observe("encode_batch_size", len(batch))
+            instrumentation.observe("encode_batch_tokens", int(estimated[batch].max()) * len(batch))
+            batch_embeddings = model.encode(
+                [inputs[i] for i in batch],
+                batch_size=len(batch),
+                convert_to_numpy=True,
+                show_progress_bar=False,
+                normalize_embeddings=True,
+            )
+            if embeddings is None:
+                embeddings = np.empty((len(inputs), batch_embeddings.shape[1]), dtype=np.float32)
+            embeddings[batch] = batch_embeddings
+
+        if len(inputs) == len(texts):
+            return embeddings
+        # Average the chunks of every text, weighted by their length, and re-normalize
+        pooled = np.zeros((len(texts), embeddings.shape[1]), dtype=np.float32)
+        np.add.at(pooled, owners, embeddings * weights[:, None])
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled / np.clip(norms, 1e-12, None)
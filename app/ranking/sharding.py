@@ -0,0 +1,117 @@
+import os
+import logging
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+from app import instrumentation
+from app.config import ENCODER_MIN_TEXTS_PER_SHARD, LONG_TEXT_MODE
+from .backends import load_backend, model_max_seq_length, set_torch_threads
+from .scheduling import EncodeScheduler
+
+# Encoder and scheduler of a worker process. The parent sets the encoder before the
+# workers are forked, so they inherit the loaded weights (copy-on-write) instead of
+# loading their own copy; workers that start without it load it themselves.
+_worker_encoder = None
+_worker_scheduler = None
+
+def _init_worker(backend, model_path, onnx_model_path, threads, long_text_mode):
+    """Worker initializer: pins the thread count and prepares the encoder and its scheduler."""
+    global _worker_encoder, _worker_scheduler
+    if _worker_encoder is None:
+        _worker_encoder = load_backend(backend, model_path, onnx_model_path, threads=threads)
+    else:
+        set_torch_threads(threads)
+    _worker_scheduler = EncodeScheduler(model_max_seq_length(_worker_encoder, model_path), long_text_mode=long_text_mode)
+
+def _worker_ready():
+    return os.getpid()
+
+def _encode_shard(texts):
+    """Worker entry point: encodes a shard of texts, returning them with the counters it recorded."""
+    recorder = instrumentation.Instrumentation()
+    with instrumentation.recording(recorder):
+        embeddings = _worker_scheduler.encode(_worker_encoder, texts)
+    return embeddings, recorder.export()
+
+class ShardedEncoder:
+    """
+    Encodes texts on a pool of worker processes, each running the model with a fixed
+    number of intra-op threads.
+
+    Small-batch MiniLM inference does not scale to many cores within one process, while
+    several independent copies of the model on a few cores each do. For the PyTorch
+    backend the model is loaded once in this process and the workers are forked right
+    after, before this process runs any inference, so they share its (read-only) weights.
+    (The process must not have run multi-threaded PyTorch work before, as OpenMP thread
+    pools do not survive a fork.)
+    ONNX Runtime sessions cannot be shared across a fork, so every worker creates its own
+    session with the requested thread count.
+
+    An encode request is split into at most one shard per worker, dealt by length so that
+    every shard holds a similar number of tokens; each worker schedules its shard with its
+    own `EncodeScheduler`, and the results are put back in input order.
+    """
+    def __init__(self, backend: str, model_path: str, onnx_model_path: str = None, workers: int = 2, threads: int = 0,
+                 long_text_mode: str = LONG_TEXT_MODE, min_texts_per_shard: int = ENCODER_MIN_TEXTS_PER_SHARD):
+        """
+        Initializes the ShardedEncoder and starts its workers.
+
+        Args:
+            backend, model_path, onnx_model_path: The model, see `load_backend`.
+            workers: Number of worker processes.
+            threads: Intra-op threads per worker (0 divides the CPU cores evenly).
+            long_text_mode: "truncate" or "chunk", see `EncodeScheduler`.
+            min_texts_per_shard: Smallest shard worth sending to a separate worker.
+        """
+        global _worker_encoder
+        self.workers = workers
+        self.threads = threads or max(1, (os.cpu_count() or 1) // workers)
+        self.min_texts_per_shard = min_texts_per_shard
+
+        start_methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in start_methods else "spawn")
+        _worker_encoder = None
+        if backend == "torch" and context.get_start_method() == "fork":
+            # A single-threaded load starts no OpenMP thread pool, which would not survive
+            # the fork (workers would deadlock in their first parallel region). This
+            # process does not encode, so it keeps the single thread
+            _worker_encoder = load_backend(backend, model_path, onnx_model_path, threads=1)
+
+        logging.info(f"Starting {workers} encoder worker(s) with {self.threads} thread(s) each...")
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=context, initializer=_init_worker,
+            initargs=(backend, model_path, onnx_model_path, self.threads, long_text_mode),
+        )
+        try:
+            # Start every worker now, so they fork from the freshly loaded model and load errors surface here
+            for future in [self.executor.submit(_worker_ready) for _ in range(workers)]:
+                future.result()
+        except Exception:
+            self.executor.shutdown(cancel_futures=True)
+            raise
+        finally:
+            # The workers hold their own reference; this process never encodes with it
+            _worker_encoder = None
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Encodes the texts across the workers and returns their unit vectors in input order."""
+        shards = min(self.workers, max(1, len(texts) // self.min_texts_per_shard))
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        parts = [order[i::shards] for i in range(shards)]
+        instrumentation.observe("encode_shards", shards)
+        futures = [self.executor.submit(_encode_shard, [texts[i] for i in part]) for part in parts]
+
+        embeddings = None
+        for part, future in zip(parts, futures):
+            shard_embeddings, stats = future.result()
+            instrumentation.merge(stats)
+            if embeddings is None:
+                embeddings = np.empty((len(texts), shard_embeddings.shape[1]), dtype=np.float32)
+            embeddings[part] = shard_embeddings
+        return embeddings
+
+    def close(self):
+        """Stops the worker processes."""
+        self.executor.shutdown()
@@ -0,0 +1,121 @@
+import heapq
+import itertools
+import numpy as np
+
+from app.config import TOP_K, CANDIDATE_POOL_SIZE, MMR_LAMBDA, STREAM_BATCH_SIZE
+from app import instrumentation
+from app.processing.corpus import Corpus
+
+class _TopCandidates:
+    """
+    A bounded min-heap keeping the `capacity` best-scoring items seen so far.
+
+    Ties are broken in favour of the earlier item, which reproduces the stable sort
+    of `RankingEngine.rank`.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._heap = []
+        self._counter = itertools.count()
+
+    def push(self, score, item, embedding):
+        entry = (float(score), -next(self._counter), item, embedding)
+        if len(self._heap) < self.capacity:
+            heapq.heappush(self._heap, entry)
+        elif entry[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, entry)
+
+    def ranked(self):
+        """Returns the kept items and their embeddings, best first."""
+        entries = sorted(self._heap, key=lambda entry: entry[:2], reverse=True)
+        items = [entry[2] for entry in entries]
+        embeddings = np.array([entry[3] for entry in entries])
+        return items, embeddings
+
+class StreamingRanker:
+    """
+    Scores sections incrementally as documents are parsed.
+
+    Sections are buffered until their texts fill an encode batch of about `batch_size`
+    texts; the batch is then turned into a small `Corpus`, encoded and scored against the
+    query, and only the `pool_size` best section and subsection records (with their
+    embeddings) are kept. The rest of the batch is dropped as soon as it is scored, so
+    memory stays bounded by the batch and pool sizes. `finish` applies MMR to the kept candidates, producing the same
+    result as `RankingEngine.rank` over the whole corpus.
+    """
+    def __init__(self, ranking_engine, query: str, pool_size: int = CANDIDATE_POOL_SIZE, batch_size: int = STREAM_BATCH_SIZE):
+        """
+        Initializes the StreamingRanker.
+
+        Args:
+            ranking_engine: The `RankingEngine` providing the embedding model and MMR.
+            query: The persona and task description.
+            pool_size: Number of top-scoring candidates kept for MMR.
+            batch_size: Number of texts collected before an encode call.
+        """
+        self.engine = ranking_engine
+        self.embedding_model = ranking_engine.embedding_model
+        self.batch_size = batch_size
+        self.query_embedding = self.embedding_model.get_embeddings(query)
+
+        self._sections = _TopCandidates(pool_size)
+        self._subsections = _TopCandidates(pool_size)
+        self._pending = []
+        self._pending_texts = 0
+        self.sections_seen = 0
+        self.subsections_seen = 0
+        self.encode_batches = 0
+        self.texts_seen = 0
+        self.texts_encoded = 0
+
+    def add(self, sections):
+        """Adds the sections of one document, encoding whenever a batch is full."""
+        for section in sections:
+            self._pending.append(section)
+            if section.get('text'):
+                self._pending_texts += 2
+            self._pending_texts += sum(1 for sub in section.get('subsections', []) if sub.get('text'))
+            if self._pending_texts >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        """Encodes and scores all buffered sections and subsections."""
+        corpus = Corpus.from_sections(self._pending)
+        self._pending, self._pending_texts = [], 0
+        if not corpus.num_sections:
+            return
+
+        section_ids, section_scores, content_embeddings, _, subsection_scores, subsection_embeddings = \
+            self.engine._score_corpus(self.query_embedding, corpus)
+        self.encode_batches += 1
+        self.texts_seen += self.engine.last_dedup_stats["texts"]
+        self.texts_encoded += self.engine.last_dedup_stats["unique_texts"]
+
+        for i, score in enumerate(section_scores):
+            self._sections.push(score, corpus.section(section_ids[i]), content_embeddings[i])
+        for j, score in enumerate(subsection_scores):
+            self._subsections.push(score, corpus.subsection(j), subsection_embeddings[j])
+
+        self.sections_seen += len(section_ids)
+        self.subsections_seen += corpus.num_subsections
+
+    def finish(self, top_k: int = TOP_K, lambda_val: float = MMR_LAMBDA):
+        """
+        Scores the remaining buffer and re-ranks the kept candidates with MMR.
+
+        Returns:
+            A tuple of the ranked sections and the ranked subsections, formatted like
+            the result of `RankingEngine.rank`.
+        """
+        self.flush()
+
+        candidate_sections, section_embeddings = self._sections.ranked()
+        candidate_subsections, subsection_embeddings = self._subsections.ranked()
+        with instrumentation.span("mmr", candidates=len(candidate_sections) + len(candidate_subsections)):
+            diversified_sections = self.engine._apply_mmr(
+                self.query_embedding, section_embeddings, candidate_sections, top_k, lambda_val
+            ) if candidate_sections else []
+            diversified_subsections = self.engine._apply_mmr(
+                self.query_embedding, subsection_embeddings, candidate_subsections, top_k, lambda_val
+            ) if candidate_subsections else []
+        return self.engine._format_results(diversified_sections, diversified_subsections)
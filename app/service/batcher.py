@@ -0,0 +1,173 @@
+import queue
+import threading
+import time
+import logging
+import numpy as np
+from concurrent.futures import Future
+from typing import List, Union
+
+from app.config import ENCODE_MAX_BATCH_SIZE, ENCODE_MAX_WAIT_MS, ENCODE_MAX_QUEUE_SIZE
+from .metrics import ServiceMetrics
+
+class QueueFullError(Exception):
+    """Raised when the encode queue is full and a request has to be rejected."""
+
+class _WorkItem:
+    __slots__ = ("texts", "future", "enqueued_at")
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+class MicroBatcher:
+    """
+    Collects encode work from concurrent requests into shared micro-batches.
+
+    Callers submit lists of texts, which are split into chunks of at most
+    `max_batch_size` texts and queued. A single background thread takes chunks off
+    the queue and packs them into one batch until it holds `max_batch_size` texts or
+    `max_wait_ms` have passed since the first chunk arrived, then encodes the batch with
+    one `get_embeddings` call. Only that thread encodes, so the model needs no locking;
+    `cached_mask` lookups from request threads wait for the batch being encoded, since
+    they read (and touch) the same cache.
+
+    The queue is bounded: when it is full, `submit` raises `QueueFullError` so that the
+    service can shed load instead of building up unbounded latency.
+    """
+    def __init__(self, embedding_model, max_batch_size: int = ENCODE_MAX_BATCH_SIZE,
+                 max_wait_ms: float = ENCODE_MAX_WAIT_MS, max_queue_size: int = ENCODE_MAX_QUEUE_SIZE,
+                 metrics: ServiceMetrics = None):
+        """
+        Initializes the MicroBatcher and starts its worker thread.
+
+        Args:
+            embedding_model: The shared, warm `EmbeddingModel`.
+            max_batch_size: Maximum number of texts per encode call.
+            max_wait_ms: Maximum time a batch waits for more work after its first chunk.
+            max_queue_size: Maximum number of queued chunks before requests are rejected.
+            metrics: Optional `ServiceMetrics` receiving batch sizes and queue latencies.
+        """
+        self.embedding_model = embedding_model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.metrics = metrics or ServiceMetrics()
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._carry = None  # A chunk that did not fit into the previous batch
+        self._model_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def submit(self, texts: List[str]) -> List[Future]:
+        """
+        Queues texts for encoding without blocking.
+
+        Returns:
+            One future per chunk, each resolving to the embeddings of its chunk.
+
+        Raises:
+            QueueFullError: If the queue cannot take all chunks of the request.
+        """
+        items = [_WorkItem(texts[i:i + self.max_batch_size]) for i in range(0, len(texts), self.max_batch_size)]
+        for n, item in enumerate(items):
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                # Cancel the chunks already queued so the worker skips them
+                for queued in items[:n]:
+                    queued.future.cancel()
+                self.metrics.increment("encode_requests_rejected")
+                raise QueueFullError("Encode queue is full")
+        return [item.future for item in items]
+
+    def get_embeddings(self, texts: Union[str, List[str]]) -> np.ndarray:
+        """
+        Encodes texts through the shared micro-batches, blocking until they are done.
+        Mirrors `EmbeddingModel.get_embeddings` so it can stand in for the model.
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        if not texts:
+            return np.array([])
+        futures = self.submit(list(texts))
+        return np.concatenate([future.result() for future in futures])
+
+    def cached_mask(self, texts: List[str]) -> np.ndarray:
+        """Mirrors `EmbeddingModel.cached_mask`: which texts have a cached embedding, without encoding anything."""
+        cached_mask = getattr(self.embedding_model, "cached_mask", None)
+        if cached_mask is None:
+            return np.zeros(len(texts), dtype=bool)
+        with self._model_lock:
+            return cached_mask(texts)
+
+    def _next_item(self, timeout=None):
+        if self._carry is not None:
+            item, self._carry = self._carry, None
+            return item
+        return self._queue.get(timeout=timeout)
+
+    def _collect_batch(self):
+        """Blocks for the first chunk, then packs further chunks until the batch is full or the wait expires."""
+        while not self._stopped.is_set():
+            try:
+                first = self._next_item(timeout=0.1)
+            except queue.Empty:
+                continue
+            if first.future.set_running_or_notify_cancel():
+                break
+        else:
+            return []
+
+        batch, size = [first], len(first.texts)
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._next_item(timeout=remaining)
+            except queue.Empty:
+                break
+            if size + len(item.texts) > self.max_batch_size:
+                self._carry = item
+                break
+            if item.future.set_running_or_notify_cancel():
+                batch.append(item)
+                size += len(item.texts)
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            for item in batch:
+                self.metrics.observe("encode_queue_wait", started - item.enqueued_at)
+            texts = [text for item in batch for text in item.texts]
+            try:
+                with self._model_lock:
+                    embeddings = self.embedding_model.get_embeddings(texts)
+            except Exception as e:
+                logging.error(f"Micro-batch encode failed: {e}")
+                for item in batch:
+                    item.future.set_exception(e)
+                continue
+            self.metrics.observe("encode_batch", time.perf_counter() - started)
+            self.metrics.increment("encode_batches")
+            self.metrics.increment("encoded_texts", len(texts))
+
+            offset = 0
+            for item in batch:
+                item.future.set_result(np.asarray(embeddings[offset:offset + len(item.texts)]))
+                offset += len(item.texts)
+
+    def close(self):
+        """Stops the worker thread after the batch in progress."""
+        self._stopped.set()
+        self._thread.join()
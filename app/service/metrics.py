@@ -0,0 +1,54 @@
+import threading
+from collections import deque
+
+class LatencyTracker:
+    """Keeps a bounded window of recent latency samples and summarizes them as percentiles."""
+    def __init__(self, window: int = 1000):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def summary(self):
+        """Returns count, mean and p50/p95/p99 in milliseconds over the recent window."""
+        ordered = sorted(self.samples)
+
+        def percentile(p):
+            if not ordered:
+                return 0.0
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 3)
+
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+        }
+
+class ServiceMetrics:
+    """Thread-safe counters and latency trackers of the ranking service."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.latencies = {}
+
+    def increment(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            self.latencies.setdefault(name, LatencyTracker()).record(seconds)
+
+    def snapshot(self):
+        """Returns a JSON-serializable view of all metrics."""
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "latencies": {name: tracker.summary() for name, tracker in self.latencies.items()},
+            }
@@ -0,0 +1,194 @@
+import copy
+import json
+import time
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.pipeline import DocumentStore, process_request
+from app.validators import mmr_lambda, near_duplicate_threshold, positive_int
+from app.config import TOP_K, CANDIDATE_POOL_SIZE, MMR_LAMBDA
+from .batcher import MicroBatcher, QueueFullError
+from .metrics import ServiceMetrics
+
+class RankingService:
+    """
+    A long-running ranking service that keeps the embedding model warm.
+
+    Every request runs the regular pipeline, but its `RankingEngine` encodes through a
+    shared `MicroBatcher`, so encode work from concurrent requests is merged into
+    common batches. Parsed documents are shared between requests.
+    """
+    def __init__(self, ranking_engine, documents_dir: str, document_store: DocumentStore = None,
+                 batcher_options: dict = None, max_in_flight: int = None):
+        """
+        Initializes the RankingService.
+
+        Args:
+            ranking_engine: The `RankingEngine` whose embedding model serves all requests.
+            documents_dir: Directory that the document file names of payloads are relative to.
+            document_store: Optional `DocumentStore`; a new one is created by default.
+            batcher_options: Keyword arguments for the `MicroBatcher`.
+            max_in_flight: Maximum number of requests processed at once. Further requests
+                are rejected. Unlimited by default.
+        """
+        self.metrics = ServiceMetrics()
+        self.ranking_engine = ranking_engine
+        self.batcher = MicroBatcher(ranking_engine.embedding_model, metrics=self.metrics, **(batcher_options or {}))
+        self.documents_dir = documents_dir
+        self.document_store = document_store or DocumentStore()
+        self._in_flight = threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+
+    def _request_engine(self):
+        """Returns a shallow copy of the engine whose encode calls go through the micro-batcher."""
+        engine = copy.copy(self.ranking_engine)
+        engine.embedding_model = self.batcher
+        return engine
+
+    def get_corpus(self, pdf_paths):
+        """Returns the corpus of the given PDFs from the shared store."""
+        # The store is thread-safe, and ranking only reads the corpus, so concurrent
+        # requests can share its columns
+        return self.document_store.get_corpus(pdf_paths)
+
+    @staticmethod
+    def _parse_overrides(payload):
+        """
+        Parses the optional ranking fields of a payload.
+
+        Returns:
+            A tuple of the engine attributes to override and the keyword arguments of the ranking.
+
+        Raises:
+            ValueError: If a field does not have the expected type or range.
+        """
+        def field(name, kind, default=None):
+            try:
+                return kind(payload[name]) if name in payload else default
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid {name}: {payload[name]!r}")
+
+        engine_overrides = {
+            name: field(name, kind)
+            for name, kind in (('lexical_candidates', int), ('hierarchical_sections', int), ('near_duplicate_threshold', near_duplicate_threshold))
+            if name in payload
+        }
+        ranking_options = {
+            'top_k': field('top_k', positive_int, TOP_K),
+            'pool_size': field('pool_size', positive_int, CANDIDATE_POOL_SIZE),
+            'lambda_val': field('mmr_lambda', mmr_lambda, MMR_LAMBDA),
+        }
+        return engine_overrides, ranking_options
+
+    def handle_rank(self, payload):
+        """
+        Ranks one payload with the same structure as `data/input/input.json`.
+
+        Optional `top_k`, `pool_size`, `mmr_lambda`, `lexical_candidates`,
+        `hierarchical_sections` and `near_duplicate_threshold` fields override the ranking defaults.
+
+        Raises:
+            QueueFullError: If the service is saturated.
+            ValueError: If `documents` is not a list of objects with string file names,
+                a document lies outside the documents directory or an override is malformed.
+        """
+        # Malformed fields are rejected before a permit is taken, so they cannot leak one
+        engine_overrides, ranking_options = self._parse_overrides(payload)
+        documents = payload.get('documents', [])
+        if not isinstance(documents, list) or not all(isinstance(doc, dict) and isinstance(doc.get('filename'), str) for doc in documents):
+            raise ValueError("documents must be a list of objects with a string filename.")
+        documents_root = os.path.realpath(self.documents_dir)
+        for doc in documents:
+            doc_path = os.path.realpath(os.path.join(documents_root, doc['filename']))
+            if os.path.commonpath([documents_root, doc_path]) != documents_root:
+                raise ValueError(f"Document outside the documents directory: {doc['filename']}")
+
+        if self._in_flight is not None and not self._in_flight.acquire(blocking=False):
+            self.metrics.increment("requests_rejected")
+            raise QueueFullError("Too many requests in flight")
+        start = time.perf_counter()
+        try:
+            engine = self._request_engine()
+            for name, value in engine_overrides.items():
+                setattr(engine, name, value)
+            final_output, timings = process_request(payload, self.documents_dir, engine, self, **ranking_options)
+        finally:
+            if self._in_flight is not None:
+                self._in_flight.release()
+        self.metrics.observe("request", time.perf_counter() - start)
+        for name, seconds in timings.items():
+            self.metrics.observe(name.replace("_seconds", ""), seconds)
+        self.metrics.increment("requests_completed")
+        return final_output
+
+    def metrics_snapshot(self):
+        snapshot = self.metrics.snapshot()
+        snapshot["queue_depth"] = self.batcher.queue_depth()
+        counters = snapshot["counters"]
+        if counters.get("encode_batches"):
+            snapshot["mean_encode_batch_size"] = round(counters["encoded_texts"] / counters["encode_batches"], 2)
+        return snapshot
+
+    def close(self):
+        self.batcher.close()
+
+def _make_handler(service: RankingService):
+    class RankingRequestHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, data, headers=None):
+            body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, {"status": "ok"})
+            elif self.path == "/metrics":
+                self._send_json(200, service.metrics_snapshot())
+            else:
+                self._send_json(404, {"error": "Not found"})
+
+        def do_POST(self):
+            if self.path != "/rank":
+                self._send_json(404, {"error": "Not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"null")
+                if not isinstance(payload, dict):
+                    raise ValueError("Payload must be a JSON object.")
+                output = service.handle_rank(payload)
+            except QueueFullError as e:
+                self._send_json(503, {"error": str(e)}, headers={"Retry-After": "1"})
+                return
+            except KeyError as e:
+                self._send_json(400, {"error": f"Missing required field {e}"})
+                return
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            except Exception as e:
+                logging.exception("Ranking request failed")
+                self._send_json(500, {"error": str(e)})
+                return
+
+            if output is None:
+                self._send_json(422, {"error": "No content could be extracted from the documents."})
+            else:
+                self._send_json(200, output)
+
+        def log_message(self, format, *args):
+            logging.info("%s - %s", self.address_string(), format % args)
+
+    return RankingRequestHandler
+
+def create_server(service: RankingService, host: str, port: int) -> ThreadingHTTPServer:
+    """Creates a threaded HTTP server exposing POST /rank, GET /metrics and GET /health."""
+    server = ThreadingHTTPServer((host, port), _make_handler(service))
+    server.daemon_threads = True
+    return server
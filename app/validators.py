@@ -0,0 +1,39 @@
+# Parsers of numeric options shared by the command line and the service. They are
+# plain functions without NumPy, so `run.py` can use them as argparse types and still
+# answer `--help` and argument errors without importing the pipeline.
+
+def near_duplicate_threshold(value) -> float:
+    """
+    Parses a near-duplicate threshold: 0 disables the removal, otherwise it must lie in (0, 1].
+
+    Raises:
+        ValueError: If the value is not a number in that range.
+    """
+    threshold = float(value)
+    if not 0.0 <= threshold <= 1.0:
+        raise ValueError(f"Near-duplicate threshold must be 0 (off) or in (0, 1], got {value!r}")
+    return threshold
+
+def positive_int(value) -> int:
+    """
+    Parses a count that must be at least 1, such as `top_k` or the MMR pool size.
+
+    Raises:
+        ValueError: If the value is not an integer of at least 1.
+    """
+    number = int(value)
+    if number < 1:
+        raise ValueError(f"Expected a positive integer, got {value!r}")
+    return number
+
+def mmr_lambda(value) -> float:
+    """
+    Parses the MMR trade-off, which must lie in [0, 1].
+
+    Raises:
+        ValueError: If the value is not a number in that range.
+    """
+    lambda_val = float(value)
+    if not 0.0 <= lambda_val <= 1.0:
+        raise ValueError(f"MMR lambda must lie in [0, 1], got {value!r}")
+    return lambda_val
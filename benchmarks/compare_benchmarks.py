@@ -0,0 +1,49 @@
+import argparse
+import json
+import sys
+
+def load_results(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def compare(baseline, current, threshold):
+    """
+    Compares the median time of every stage present in both result files.
+
+    Returns:
+        A list of (stage, baseline_seconds, current_seconds, change, regressed) tuples,
+        where `change` is the relative change of the median and `regressed` flags a
+        slowdown beyond `threshold`.
+    """
+    rows = []
+    for stage, result in current["results"].items():
+        if stage not in baseline["results"]:
+            continue
+        before = baseline["results"][stage]["median_seconds"]
+        after = result["median_seconds"]
+        change = (after - before) / before if before else 0.0
+        rows.append((stage, before, after, change, change > threshold))
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flag benchmark regressions against a stored baseline.")
+    parser.add_argument("baseline", help="Baseline results written by run_benchmarks.py.")
+    parser.add_argument("current", help="Results to check.")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown of a median that counts as a regression.")
+    args = parser.parse_args()
+
+    baseline, current = load_results(args.baseline), load_results(args.current)
+    if baseline.get("config") != current.get("config"):
+        print("⚠️  The benchmark configurations differ; timings may not be comparable.")
+
+    rows = compare(baseline, current, args.threshold)
+    print(f"{'stage':<8}{'baseline':>12}{'current':>12}{'change':>10}")
+    for stage, before, after, change, regressed in rows:
+        flag = "  ❌ REGRESSION" if regressed else ""
+        print(f"{stage:<8}{before:>11.4f}s{after:>11.4f}s{change:>+10.1%}{flag}")
+
+    regressions = [row[0] for row in rows if row[4]]
+    if regressions:
+        print(f"❌ {len(regressions)} stage(s) slower than the baseline by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    print("✅ No regressions.")
@@ -0,0 +1,69 @@
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+from app.config import EMBEDDING_BACKEND, ENCODE_TOKEN_BUDGET
+from app.pipeline import DocumentStore, parse_request, write_json
+from app.ranking.backends import BACKENDS
+from app.ranking.scheduling import EncodeScheduler
+from run_benchmarks import build_engine, summarize, timed
+
+def corpus_texts(input_json):
+    """Returns the distinct titles, section bodies and subsections of a request's documents."""
+    with open(input_json, 'r', encoding='utf-8') as f:
+        input_data = json.load(f)
+    _, _, _, pdf_paths = parse_request(input_data, os.path.dirname(input_json))
+    corpus = DocumentStore().get_corpus(pdf_paths)
+    texts = corpus.section_titles(corpus.sections_with_text()) + corpus.section_text + corpus.subsection_text
+    return list(dict.fromkeys(text for text in texts if text))
+
+def unscheduled_encode(model, texts):
+    """The previous encode path: one `encode` call over the texts in their original order."""
+    return model.encode(texts, convert_to_numpy=True, show_progress_bar=False, normalize_embeddings=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare encode throughput of the unscheduled path with length-bucketed, token-budgeted scheduling."
+    )
+    parser.add_argument("--input_json", default=os.path.join("data", "input", "input.json"), help="Request whose documents are encoded.")
+    parser.add_argument("--backend", choices=BACKENDS, default=EMBEDDING_BACKEND, help="Embedding backend.")
+    parser.add_argument("--token_budgets", type=int, nargs="+", default=[ENCODE_TOKEN_BUDGET // 2, ENCODE_TOKEN_BUDGET, ENCODE_TOKEN_BUDGET * 2],
+                        help="Padded-token budgets per batch to compare.")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed repetitions per variant.")
+    parser.add_argument("--output", default=os.path.join("benchmarks", "results", "encode_scheduling.json"), help="Path of the JSON report.")
+    args = parser.parse_args()
+
+    engine = build_engine(args.backend)
+    model = engine.embedding_model
+    model.get_embeddings("warm-up")  # Loads the model outside the timings
+    texts = corpus_texts(args.input_json)
+    max_seq_length = model.scheduler.max_seq_length
+    print(f"📄 {len(texts)} distinct texts, token window {max_seq_length}")
+
+    reference = unscheduled_encode(model.model, texts)
+    variants = {"unscheduled": lambda: unscheduled_encode(model.model, texts)}
+    schedulers = {}
+    for budget in args.token_budgets:
+        schedulers[f"truncate@{budget}"] = EncodeScheduler(max_seq_length, token_budget=budget)
+    schedulers[f"chunk@{ENCODE_TOKEN_BUDGET}"] = EncodeScheduler(max_seq_length, long_text_mode="chunk")
+    for name, scheduler in schedulers.items():
+        variants[name] = lambda scheduler=scheduler: scheduler.encode(model.model, texts)
+
+    results = {}
+    print(f"   {'variant':<16}{'median s':>10}{'texts/s':>10}{'speedup':>9}{'min cos':>9}")
+    for name, encode in variants.items():
+        stats = summarize(timed(encode, args.repeats), len(texts), "texts")
+        # Agreement with the unscheduled vectors; chunk pooling deliberately differs on long texts
+        stats["min_cosine_to_unscheduled"] = round(float(np.min(np.sum(encode() * reference, axis=1))), 6)
+        results[name] = stats
+        speedup = results["unscheduled"]["median_seconds"] / stats["median_seconds"]
+        print(f"   {name:<16}{stats['median_seconds']:>10.3f}{stats['texts_per_second']:>10.1f}{speedup:>9.2f}"
+              f"{stats['min_cosine_to_unscheduled']:>9.4f}")
+
+    write_json({"input_json": args.input_json, "backend": args.backend, "texts": len(texts), "variants": results}, args.output)
+    print(f"✅ Report written to {args.output}")
@@ -0,0 +1,81 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.config import EMBEDDING_BACKEND, TOP_K, CANDIDATE_POOL_SIZE, MMR_LAMBDA
+from app.pipeline import DocumentStore, parse_request, write_json
+from app.ranking.backends import BACKENDS
+from run_benchmarks import build_engine
+from lexical_recall import recall, result_keys
+
+def timed_rank(engine, query, corpus, args, hierarchical_sections):
+    start = time.perf_counter()
+    ranked = engine.rank(
+        query, corpus, top_k=args.top_k, pool_size=args.pool_size, lambda_val=args.mmr_lambda,
+        hierarchical_sections=hierarchical_sections,
+    )
+    return result_keys(*ranked), time.perf_counter() - start, engine.last_dedup_stats["unique_texts"]
+
+def evaluate_request(engine, input_json, args):
+    """Compares the hierarchical rankings of one request with its flat ranking."""
+    with open(input_json, 'r', encoding='utf-8') as f:
+        input_data = json.load(f)
+    persona_role, job_task, _, pdf_paths = parse_request(input_data, os.path.dirname(input_json))
+    query = f"{persona_role}. {job_task}"
+    corpus = DocumentStore().get_corpus(pdf_paths)
+
+    (full_sections, full_subsections), full_seconds, full_encoded = timed_rank(engine, query, corpus, args, 0)
+    rows = [{"sections": 0, "seconds": round(full_seconds, 4), "texts_encoded": full_encoded, "encodes_saved": 0,
+             "section_recall": 1.0, "subsection_recall": 1.0}]
+    for m in args.sections:
+        (sections, subsections), seconds, encoded = timed_rank(engine, query, corpus, args, m)
+        rows.append({
+            "sections": m,
+            "seconds": round(seconds, 4),
+            "texts_encoded": encoded,
+            "encodes_saved": engine.last_hierarchical_stats["encodes_saved"],
+            "section_recall": round(recall(full_sections, sections), 4),
+            "subsection_recall": round(recall(full_subsections, subsections), 4),
+        })
+    return {
+        "input_json": input_json,
+        "sections": corpus.num_sections,
+        "subsections": corpus.num_subsections,
+        "rows": rows,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Report recall@k and encode savings of hierarchical ranking against the flat ranking for each section count."
+    )
+    parser.add_argument("input_json", nargs="*", default=[os.path.join("data", "input", "input.json")], help="Request files to evaluate.")
+    parser.add_argument("--sections", type=int, nargs="+", default=[5, 10, 20, 40], help="Numbers of expanded sections (M) to compare.")
+    parser.add_argument("--backend", choices=list(BACKENDS) + ["stub"], default=EMBEDDING_BACKEND,
+                        help="Embedding backend; 'stub' uses hash-based vectors and needs no model files.")
+    parser.add_argument("--top_k", type=int, default=TOP_K, help="Number of results compared (the k of recall@k).")
+    parser.add_argument("--pool_size", type=int, default=CANDIDATE_POOL_SIZE, help="MMR candidate pool size.")
+    parser.add_argument("--mmr_lambda", type=float, default=MMR_LAMBDA, help="MMR trade-off.")
+    parser.add_argument("--output", default=os.path.join("benchmarks", "results", "hierarchical_recall.json"), help="Path of the JSON report.")
+    args = parser.parse_args()
+
+    engine = build_engine(args.backend)
+    engine.embedding_model.get_embeddings("warm-up")  # Loads the model outside the timings
+
+    reports = []
+    for input_json in args.input_json:
+        print(f"📄 Evaluating {input_json}...")
+        report = evaluate_request(engine, input_json, args)
+        print(f"   {report['sections']} sections, {report['subsections']} subsections")
+        print(f"   {'M':>6}{'encoded':>9}{'saved':>8}{'seconds':>10}{'sec@k':>8}{'sub@k':>8}")
+        for row in report["rows"]:
+            label = "flat" if not row["sections"] else row["sections"]
+            print(f"   {label:>6}{row['texts_encoded']:>9}{row['encodes_saved']:>8}{row['seconds']:>10.4f}"
+                  f"{row['section_recall']:>8.2f}{row['subsection_recall']:>8.2f}")
+        reports.append(report)
+
+    write_json({"top_k": args.top_k, "pool_size": args.pool_size, "backend": args.backend, "requests": reports}, args.output)
+    print(f"✅ Report written to {args.output}")
@@ -0,0 +1,194 @@
+import argparse
+import hashlib
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+from app.config import SENTENCE_TRANSFORMER_MODEL_PATH, EMBEDDING_BACKEND, TOP_K, CANDIDATE_POOL_SIZE, MMR_LAMBDA
+from app.pipeline import DocumentStore, process_request, write_json
+from app.processing.pdf_parser import extract_sections_from_file
+from app.ranking.backends import BACKENDS
+from app.ranking.engine import RankingEngine
+from synthetic_pdfs import FONT_FAMILIES, generate_corpus
+
+STAGES = ("parse", "embed", "mmr", "full")
+
+class StubEncoder:
+    """
+    Stands in for the sentence-transformer so the benchmarks run without model files.
+    Every text maps to a fixed pseudo-random unit vector derived from its hash.
+    """
+    def __init__(self, dimension=384):
+        self.dimension = dimension
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, show_progress_bar=False, normalize_embeddings=False):
+        if isinstance(texts, str):
+            texts = [texts]
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for i, text in enumerate(texts):
+            seed = int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), "little")
+            embeddings[i] = np.random.default_rng(seed).standard_normal(self.dimension)
+        if normalize_embeddings:
+            embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings
+
+def build_engine(backend):
+    """Creates a RankingEngine without an embedding cache, using the stub encoder for backend "stub"."""
+    if backend != "stub":
+        return RankingEngine(model_path=SENTENCE_TRANSFORMER_MODEL_PATH, backend=backend)
+    # The model directory only has to exist: the stub is installed before the model is ever loaded
+    engine = RankingEngine(model_path=os.path.dirname(os.path.abspath(__file__)), warm_up=False)
+    engine.embedding_model.model = StubEncoder()
+    return engine
+
+def summarize(samples, units, unit_name):
+    """Reduces the timings of one stage to the statistics stored in the results file."""
+    median = statistics.median(samples)
+    return {
+        "samples_seconds": [round(s, 6) for s in samples],
+        "median_seconds": round(median, 6),
+        "min_seconds": round(min(samples), 6),
+        "units": units,
+        "unit": unit_name,
+        f"{unit_name}_per_second": round(units / median, 2) if median else None,
+    }
+
+def timed(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def bench_parse(pdf_paths, pages, repeats):
+    """Times `extract_sections_from_file` over the whole corpus, serially and uncached."""
+    def parse():
+        for path in pdf_paths:
+            extract_sections_from_file(path)
+    return summarize(timed(parse, repeats), len(pdf_paths) * pages, "pages")
+
+def bench_embed(backend, texts, repeats):
+    """Times `EmbeddingModel.get_embeddings` on the corpus texts with a loaded model."""
+    engine = build_engine(backend)
+    engine.embedding_model.get_embeddings(texts[:8])  # Loads the model outside the timing
+    samples = timed(lambda: engine.embedding_model.get_embeddings(texts), repeats)
+    return summarize(samples, len(texts), "texts")
+
+def bench_mmr(pool_size, top_k, lambda_val, dimension, repeats, seed=0):
+    """Times `RankingEngine._apply_mmr` on a pool of random unit vectors."""
+    rng = np.random.default_rng(seed)
+    doc_embeddings = rng.standard_normal((pool_size, dimension)).astype(np.float32)
+    query_embedding = rng.standard_normal((1, dimension)).astype(np.float32)
+    engine = build_engine("stub")
+    docs = list(range(pool_size))
+    samples = timed(lambda: engine._apply_mmr(query_embedding, doc_embeddings, docs, top_k, lambda_val), repeats)
+    return summarize(samples, pool_size, "candidates")
+
+def bench_full(backend, pdf_paths, repeats):
+    """
+    Times the `run.py` flow for one request over the corpus: engine creation and model
+    load, uncached extraction, ranking, formatting and writing the output file.
+    """
+    input_dir = os.path.dirname(pdf_paths[0])
+    request = {
+        "persona": {"role": "Travel Planner"},
+        "job_to_be_done": {"task": "Plan a trip of 4 days for a group of 10 college friends."},
+        "documents": [{"filename": os.path.basename(path)} for path in pdf_paths],
+    }
+
+    def run():
+        engine = build_engine(backend)
+        output, _ = process_request(request, input_dir, engine, DocumentStore())
+        write_json(output, os.path.join(input_dir, "output.json"))
+    return summarize(timed(run, repeats), len(pdf_paths), "documents")
+
+def run_stages(args, pdf_paths):
+    """Runs the selected benchmark stages on a generated corpus."""
+    results = {}
+    stages = args.stages or list(STAGES)
+    if "parse" in stages:
+        print("⏱️  Benchmarking PDF parsing...")
+        results["parse"] = bench_parse(pdf_paths, args.pages, args.repeats)
+    if "embed" in stages:
+        print("⏱️  Benchmarking embedding...")
+        texts = []
+        for path in pdf_paths:
+            for section in extract_sections_from_file(path):
+                texts.extend([section["section_title"], section["text"]])
+                texts.extend(sub["text"] for sub in section["subsections"])
+        results["embed"] = bench_embed(args.backend, texts, args.repeats)
+    if "mmr" in stages:
+        print("⏱️  Benchmarking MMR...")
+        results["mmr"] = bench_mmr(args.pool_size, args.top_k, args.mmr_lambda, 384, args.repeats * 10)
+    if "full" in stages:
+        print("⏱️  Benchmarking the full pipeline...")
+        results["full"] = bench_full(args.backend, pdf_paths, args.repeats)
+    return results
+
+def run_benchmarks(args):
+    corpus_dir = args.corpus_dir or tempfile.mkdtemp(prefix="benchmark_corpus_")
+    print(f"📄 Generating {args.documents} synthetic PDF(s) of {args.pages} page(s) in {corpus_dir}...")
+    pdf_paths = generate_corpus(
+        corpus_dir, documents=args.documents, pages=args.pages, headings_per_page=args.headings_per_page,
+        font_family=args.font_family, text_layer=not args.no_text_layer, seed=args.seed,
+    )
+
+    try:
+        results = run_stages(args, pdf_paths)
+    finally:
+        if not args.corpus_dir:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "config": {
+            "backend": args.backend,
+            "documents": args.documents,
+            "pages": args.pages,
+            "headings_per_page": args.headings_per_page,
+            "font_family": args.font_family,
+            "text_layer": not args.no_text_layer,
+            "repeats": args.repeats,
+            "top_k": args.top_k,
+            "pool_size": args.pool_size,
+        },
+        "results": results,
+    }
+    write_json(report, args.output)
+    for stage, result in results.items():
+        print(f"   {stage:<6} median {result['median_seconds']:.4f}s  ({result[result['unit'] + '_per_second']} {result['unit']}/s)")
+    print(f"✅ Results written to {args.output}")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark parsing, embedding, MMR and the full pipeline on synthetic PDFs.")
+    parser.add_argument("--output", default=os.path.join("benchmarks", "results", "latest.json"), help="Path of the JSON results file.")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, help="Stages to run. All by default.")
+    parser.add_argument("--backend", choices=list(BACKENDS) + ["stub"], default=EMBEDDING_BACKEND,
+                        help="Embedding backend; 'stub' uses hash-based vectors and needs no model files.")
+    parser.add_argument("--corpus_dir", help="Directory for the generated PDFs. A temporary directory by default.")
+    parser.add_argument("--documents", type=int, default=5, help="Number of synthetic PDFs.")
+    parser.add_argument("--pages", type=int, default=10, help="Pages per PDF.")
+    parser.add_argument("--headings_per_page", type=int, default=2, help="Headings (sections) per page.")
+    parser.add_argument("--font_family", choices=sorted(FONT_FAMILIES), default="helvetica", help="Font family of the text.")
+    parser.add_argument("--no_text_layer", action="store_true", help="Rasterize the pages so that parsing needs OCR.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the synthetic corpus.")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per stage (MMR runs 10x as many).")
+    parser.add_argument("--top_k", type=int, default=TOP_K, help="MMR selections.")
+    parser.add_argument("--pool_size", type=int, default=CANDIDATE_POOL_SIZE, help="MMR candidate pool size.")
+    parser.add_argument("--mmr_lambda", type=float, default=MMR_LAMBDA, help="MMR trade-off.")
+    run_benchmarks(parser.parse_args())
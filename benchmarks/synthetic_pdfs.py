@@ -0,0 +1,103 @@
+import argparse
+import os
+import random
+
+import fitz  # PyMuPDF
+
+# Body and heading fonts of the PDF base-14 families
+FONT_FAMILIES = {
+    "helvetica": ("helv", "hebo"),
+    "times": ("tiro", "tibo"),
+    "courier": ("cour", "cobo"),
+}
+
+WORDS = (
+    "travel city coast village market museum festival harbour castle garden beach wine cheese bread "
+    "history culture tradition recipe restaurant hotel budget itinerary train ferry hike trail view "
+    "sunset morning evening local guide group friends family day week season summer winter spring "
+    "autumn river mountain valley church square street cafe bakery dinner lunch breakfast tour ticket"
+).split()
+
+PAGE_WIDTH, PAGE_HEIGHT, MARGIN = 595, 842, 56
+
+def _sentence(rng, min_words=6, max_words=14):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+    return " ".join(words).capitalize() + "."
+
+def _paragraph(rng, sentences=3):
+    return " ".join(_sentence(rng) for _ in range(sentences))
+
+def _rasterize(doc, dpi):
+    """Returns a copy of a document whose pages are images only, without a text layer."""
+    scanned = fitz.open()
+    for page in doc:
+        pix = page.get_pixmap(dpi=dpi)
+        scanned.new_page(width=page.rect.width, height=page.rect.height).insert_image(page.rect, pixmap=pix)
+    return scanned
+
+def write_synthetic_pdf(path, pages=10, headings_per_page=2, paragraphs_per_section=2,
+                        font_family="helvetica", text_layer=True, seed=0, scan_dpi=150):
+    """
+    Writes a PDF whose pages hold `headings_per_page` bold headings, each followed by
+    `paragraphs_per_section` body paragraphs of random travel vocabulary.
+
+    With `text_layer=False` every page is rasterized at `scan_dpi`, so the parser has to
+    fall back to OCR. The same seed always produces the same document.
+    """
+    rng = random.Random(seed)
+    body_font, heading_font = FONT_FAMILIES[font_family]
+    slot_height = (PAGE_HEIGHT - 2 * MARGIN) / max(headings_per_page, 1)
+    paragraph_height = (slot_height - 32) / max(paragraphs_per_section, 1)
+
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        for h in range(headings_per_page):
+            top = MARGIN + h * slot_height
+            title = f"{_sentence(rng, 2, 5)[:-1].title()} {page_num + 1}.{h + 1}"
+            page.insert_text((MARGIN, top + 18), title, fontname=heading_font, fontsize=16)
+            for p in range(paragraphs_per_section):
+                y = top + 32 + p * paragraph_height
+                rect = fitz.Rect(MARGIN, y, PAGE_WIDTH - MARGIN, y + paragraph_height - 6)
+                page.insert_textbox(rect, _paragraph(rng), fontname=body_font, fontsize=10)
+
+    if not text_layer:
+        scanned = _rasterize(doc, scan_dpi)
+        doc.close()
+        doc = scanned
+    doc.save(path)
+    doc.close()
+    return path
+
+def generate_corpus(output_dir, documents=5, pages=10, headings_per_page=2, paragraphs_per_section=2,
+                    font_family="helvetica", text_layer=True, seed=0):
+    """Writes `documents` synthetic PDFs into a directory and returns their paths."""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for i in range(documents):
+        path = os.path.join(output_dir, f"synthetic_{i:03d}.pdf")
+        write_synthetic_pdf(
+            path, pages=pages, headings_per_page=headings_per_page, paragraphs_per_section=paragraphs_per_section,
+            font_family=font_family, text_layer=text_layer, seed=seed + i,
+        )
+        paths.append(path)
+    return paths
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a corpus of synthetic PDFs for benchmarking.")
+    parser.add_argument("output_dir", help="Directory to write the PDFs to.")
+    parser.add_argument("--documents", type=int, default=5, help="Number of PDFs.")
+    parser.add_argument("--pages", type=int, default=10, help="Pages per PDF.")
+    parser.add_argument("--headings_per_page", type=int, default=2, help="Headings (sections) per page.")
+    parser.add_argument("--paragraphs_per_section", type=int, default=2, help="Body paragraphs under each heading.")
+    parser.add_argument("--font_family", choices=sorted(FONT_FAMILIES), default="helvetica", help="Font family of the text.")
+    parser.add_argument("--no_text_layer", action="store_true", help="Rasterize the pages so that parsing needs OCR.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the first document.")
+    args = parser.parse_args()
+
+    paths = generate_corpus(
+        args.output_dir, documents=args.documents, pages=args.pages, headings_per_page=args.headings_per_page,
+        paragraphs_per_section=args.paragraphs_per_section, font_family=args.font_family,
+        text_layer=not args.no_text_layer, seed=args.seed,
+    )
+    print(f"✅ Wrote {len(paths)} PDF(s) to {args.output_dir}")
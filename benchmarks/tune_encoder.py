@@ -0,0 +1,86 @@
+import argparse
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+from app.config import SENTENCE_TRANSFORMER_MODEL_PATH, EMBEDDING_BACKEND
+from app.pipeline import write_json
+from app.ranking.backends import BACKENDS
+from app.ranking.embedding import EmbeddingModel
+from encode_scheduling import corpus_texts
+from run_benchmarks import summarize, timed
+
+def candidate_splits(cores):
+    """Returns the (workers, threads) splits that use all cores, plus the in-process default (0, 0)."""
+    return [(0, 0)] + [(workers, cores // workers) for workers in range(1, cores + 1) if cores % workers == 0]
+
+def run_trial(model_path, backend, workers, threads, texts, repeats):
+    """Encodes the texts with one split, returning the timings and the vectors of the last run."""
+    model = EmbeddingModel(model_path, backend=backend, encoder_workers=workers, encoder_threads=threads)
+    try:
+        model.get_embeddings(texts[:64])  # Loads the model and starts the workers outside the timings
+        samples = timed(lambda: model.get_embeddings(texts), repeats)
+        return samples, model.get_embeddings(texts)
+    finally:
+        model.close()
+
+def split_name(workers, threads):
+    return "in-process default" if not workers else f"{workers} x {threads}"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Find the encoder workers x threads split with the highest encode throughput on this machine."
+    )
+    parser.add_argument("--input_json", default=os.path.join("data", "input", "input.json"), help="Request whose documents are encoded.")
+    parser.add_argument("--model_path", default=SENTENCE_TRANSFORMER_MODEL_PATH, help="Sentence-transformer model directory.")
+    parser.add_argument("--backend", choices=BACKENDS, default=EMBEDDING_BACKEND, help="Embedding backend.")
+    parser.add_argument("--cores", type=int, default=os.cpu_count() or 1, help="CPU cores to divide between workers and threads.")
+    parser.add_argument("--splits", nargs="+", help="Splits to try as WORKERSxTHREADS (e.g. 4x8). Every split using all cores by default.")
+    parser.add_argument("--copies", type=int, default=1, help="Encode the corpus texts this many times per run, for a larger workload.")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per split.")
+    parser.add_argument("--output", default=os.path.join("benchmarks", "results", "tune_encoder.json"), help="Path of the JSON report.")
+    args = parser.parse_args()
+
+    if args.splits:
+        splits = [(0, 0)] + [tuple(int(n) for n in split.lower().split("x")) for split in args.splits]
+    else:
+        splits = candidate_splits(args.cores)
+    texts = corpus_texts(args.input_json) * args.copies
+    print(f"📄 {len(texts)} texts, {args.cores} core(s), {len(splits)} split(s)")
+
+    results, reference = {}, None
+    print(f"   {'workers x threads':<20}{'median s':>10}{'texts/s':>10}{'speedup':>9}{'min cos':>9}")
+    for workers, threads in splits:
+        # Every split runs in a fresh process, so thread settings and OpenMP pools do not carry over
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as trial:
+            samples, embeddings = trial.submit(run_trial, args.model_path, args.backend, workers, threads, texts, args.repeats).result()
+        if reference is None:
+            reference = embeddings
+        name = split_name(workers, threads)
+        stats = summarize(samples, len(texts), "texts")
+        stats.update(workers=workers, threads=threads)
+        stats["min_cosine_to_in_process"] = round(float(np.min(np.sum(embeddings * reference, axis=1))), 6)
+        results[name] = stats
+        speedup = results[split_name(0, 0)]["median_seconds"] / stats["median_seconds"]
+        print(f"   {name:<20}{stats['median_seconds']:>10.3f}{stats['texts_per_second']:>10.1f}{speedup:>9.2f}"
+              f"{stats['min_cosine_to_in_process']:>9.4f}")
+
+    best = max(results.values(), key=lambda stats: stats["texts_per_second"])
+    if best["workers"] > 1:
+        flags = f"--encoder_workers {best['workers']} --encoder_threads {best['threads']}"
+    elif best["workers"] == 1:
+        flags = f"--encoder_threads {best['threads']}"
+    else:
+        flags = "(defaults)"
+    print(f"🏁 Best: {split_name(best['workers'], best['threads'])} at {best['texts_per_second']} texts/s -> {flags}")
+
+    write_json({
+        "input_json": args.input_json, "backend": args.backend, "cores": args.cores, "texts": len(texts),
+        "splits": results, "best": {"workers": best["workers"], "threads": best["threads"], "flags": flags},
+    }, args.output)
+    print(f"✅ Report written to {args.output}")
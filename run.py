@@ -1,86 +1,303 @@
-
-
 import argparse
+import cProfile
 import os
 import json
+import pstats
 import time
 
-from app.processing.pdf_parser import extract_all_documents
-from app.ranking.engine import RankingEngine
-from app.io.formatter import format_output
-from app.config import SENTENCE_TRANSFORMER_MODEL_PATH
+from app import instrumentation
+from app.validators import mmr_lambda, near_duplicate_threshold, positive_int
+from app.config import (
+    SENTENCE_TRANSFORMER_MODEL_PATH, EXTRACTION_WORKERS, TOP_K, CANDIDATE_POOL_SIZE, MMR_LAMBDA, EMBEDDING_BACKEND,
+    LEXICAL_CANDIDATES, IVF_PROBE, HIERARCHICAL_SECTIONS, LONG_TEXT_MODE, ENCODER_WORKERS, ENCODER_THREADS,
+    NEAR_DUPLICATE_THRESHOLD,
+)
 
-def main():
-    # --- CHANGED: Argument parsing now takes a single JSON input file ---
-    parser = argparse.ArgumentParser(description="Persona-Driven Document Intelligence System")
-    parser.add_argument("--input_json", required=True, help="Path to the input JSON file.")
-    parser.add_argument("--output_file", default=None, help="Path to the output JSON file. A default name will be generated if not provided.")
-    args = parser.parse_args()
+def default_output_file(input_data, output_dir="./data/output"):
+    """Generates the default output path for a request from its challenge id."""
+    challenge_id = input_data.get('challenge_info', {}).get('challenge_id', 'default')
+    output_filename = f"{challenge_id}_output.json"
+    return os.path.join(output_dir, output_filename)
+
+# The pipeline, parser and ranking modules (and through them PyMuPDF and NumPy) are
+# imported inside the functions below, so that `--help` and argument errors return at once.
+
+def build_ranking_engine(args):
+    """
+    Creates the Ranking Engine, returning None if the model files are missing. The model
+    starts loading in the background right away.
+    """
+    from app.ranking.engine import RankingEngine
+    from app.ranking.cache import EmbeddingCache
+
+    print("🚀 Initializing Ranking Engine...")
+    try:
+        embedding_cache = None if args.no_cache else EmbeddingCache(
+            SENTENCE_TRANSFORMER_MODEL_PATH, backend=args.backend, long_text_mode=args.long_text_mode,
+        )
+        return RankingEngine(
+            model_path=SENTENCE_TRANSFORMER_MODEL_PATH, embedding_cache=embedding_cache, backend=args.backend,
+            lexical_candidates=args.lexical_candidates, hierarchical_sections=args.hierarchical_sections,
+            long_text_mode=args.long_text_mode, encoder_workers=args.encoder_workers, encoder_threads=args.encoder_threads,
+            near_duplicate_threshold=args.near_duplicate_threshold,
+        )
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        print("Please run 'python scripts/download_models.py' (and 'python scripts/export_onnx.py' for the ONNX backend) to create the required model files.")
+        return None
+
+def build_document_store(args, ranking_engine):
+    """
+    Creates the source of parsed documents: a persistent `CorpusIndex` with `--index_dir`,
+    otherwise an in-memory `DocumentStore`.
+    """
+    from app.processing.cache import ExtractionCache, OcrCache
+    from app.pipeline import DocumentStore
+
+    extraction_cache = None if args.no_cache else ExtractionCache()
+    ocr_cache = None if args.no_cache else OcrCache()
+    if args.index_dir:
+        from app.ranking.index import CorpusIndex
+        return CorpusIndex(
+            ranking_engine, args.index_dir, workers=args.workers, cache=extraction_cache, ocr_cache=ocr_cache,
+            ivf_probe=args.ivf_probe,
+        )
+    return DocumentStore(
+        workers=args.workers, cache=extraction_cache, ocr_cache=ocr_cache, lexical_index=args.lexical_candidates > 0,
+    )
+
+def run_single(args):
+    """Processes one input JSON file."""
+    from app.processing.cache import ExtractionCache, OcrCache
+    from app.pipeline import process_request, process_request_streaming, write_json
 
     # 1. Read and parse the input JSON
     print(f"📄 Loading input from {args.input_json}...")
     with open(args.input_json, 'r', encoding='utf-8') as f:
         input_data = json.load(f)
 
-    # Extracting details from the JSON structure
-    persona_role = input_data['persona']['role']
-    job_task = input_data['job_to_be_done']['task']
-    documents_metadata = input_data['documents']
-
     # Construct full paths for the PDF documents (assumes they are in the same directory as the JSON)
     input_dir = os.path.dirname(args.input_json)
-    pdf_paths = [os.path.join(input_dir, doc['filename']) for doc in documents_metadata]
 
     # Determine the output file path, generating a default if not provided
-    output_file = args.output_file
-    if not output_file:
-        challenge_id = input_data.get('challenge_info', {}).get('challenge_id', 'default')
-        output_filename = f"{challenge_id}_output.json"
-        output_file = f"./data/output/{output_filename}"
+    output_file = args.output_file or default_output_file(input_data)
 
     start_time = time.time()
 
     # 2. Initialize the Ranking Engine
-    print("🚀 Initializing Ranking Engine...")
-    try:
-        ranking_engine = RankingEngine(model_path=SENTENCE_TRANSFORMER_MODEL_PATH)
-    except FileNotFoundError as e:
-        print(f"Error: {e}")
-        print("Please run 'python scripts/download_models.py' to download the required model files.")
+    ranking_engine = build_ranking_engine(args)
+    if ranking_engine is None:
         return
 
-    # 3. Extract content from the specified list of documents
-    # NOTE: This requires a change in `pdf_parser.py` to accept a list of file paths.
-    print(f"📄 Extracting content from {len(pdf_paths)} PDF(s)...")
-    extracted_data = extract_all_documents(pdf_paths)
-    if not extracted_data:
+    # 3. Extract content and rank it
+    if args.stream:
+        final_output, timings = process_request_streaming(
+            input_data, input_dir, ranking_engine, workers=args.workers,
+            cache=None if args.no_cache else ExtractionCache(), ocr_cache=None if args.no_cache else OcrCache(),
+            top_k=args.top_k, pool_size=args.pool_size, lambda_val=args.mmr_lambda, start_time=start_time,
+            performance=args.performance,
+        )
+    else:
+        final_output, timings = process_request(
+            input_data, input_dir, ranking_engine, build_document_store(args, ranking_engine),
+            top_k=args.top_k, pool_size=args.pool_size, lambda_val=args.mmr_lambda, start_time=start_time,
+            performance=args.performance,
+        )
+    if final_output is None:
         print("No content could be extracted from the documents. Exiting.")
         return
 
-    # 4. Perform the ranking
-    print("🧠 Ranking sections and subsections...")
-    query = f"{persona_role}. {job_task}"
-    ranked_sections, ranked_subsections = ranking_engine.rank(query, extracted_data)
-
-    # 5. Format and save the output
+    # 4. Save the output
     print("💾 Formatting and saving output...")
-    processing_time = time.time() - start_time
-    final_output = format_output(
-        documents_metadata, persona_role, job_task,
-        processing_time, ranked_sections, ranked_subsections
-    )
-
-    output_dir = os.path.dirname(output_file)
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(final_output, f, ensure_ascii=False, indent=4)
+    write_json(final_output, output_file)
 
+    processing_time = timings['total_seconds']
     print(f"\n✅ Success! Processing complete.")
     print(f"   Output written to: {output_file}")
     print(f"   Total processing time: {processing_time:.2f} seconds")
 
+def process_request_recorded(*args, process=None, **kwargs):
+    """
+    Runs `process_request` (or `process`) with a recorder of its own when instrumentation
+    is active, so that the performance block of every batch request covers only that
+    request. The request's spans and counters are then added to the batch-wide recorder.
+    """
+    from app.pipeline import process_request
+
+    process = process or process_request
+    batch_recorder = instrumentation.active()
+    if batch_recorder is None:
+        return process(*args, **kwargs)
+    request_recorder = instrumentation.Instrumentation()
+    try:
+        with instrumentation.recording(request_recorder):
+            return process(*args, **kwargs)
+    finally:
+        batch_recorder.merge(request_recorder.export(), request_recorder.events)
+
+def group_requests(requests):
+    """
+    Groups the positions of batch requests that reference the same PDFs, in order of first
+    occurrence. Requests that cannot be parsed form groups of their own, so that their
+    error is reported as usual.
+    """
+    from app.pipeline import parse_request
+
+    groups = {}
+    for i, (_, input_data, input_dir) in enumerate(requests):
+        try:
+            key = tuple(os.path.abspath(path) for path in parse_request(input_data, input_dir)[3])
+        except Exception:
+            key = ("unparsable", i)
+        groups.setdefault(key, []).append(i)
+    return list(groups.values())
+
+def batch_result(request_id, final_output, timings, output_dir):
+    """Writes the output of a batch request and returns its summary entry."""
+    from app.pipeline import write_json
+
+    result = {"request_id": request_id, "timings": {name: round(seconds, 3) for name, seconds in timings.items()}}
+    if final_output is None:
+        result["status"] = "no_content"
+    else:
+        output_file = os.path.join(output_dir, f"{request_id}_output.json")
+        write_json(final_output, output_file)
+        result["status"] = "ok"
+        result["output_file"] = output_file
+    return result
+
+def error_result(request_id, e):
+    """Reports a failed batch request and returns its summary entry."""
+    error = f"Missing required field {e}" if isinstance(e, KeyError) else str(e)
+    print(f"Error processing request {request_id}: {error}")
+    return {"request_id": request_id, "status": "error", "error": error}
+
+def run_batch(args):
+    """
+    Processes every request of a batch in one process. The model is loaded once and
+    documents referenced by several requests are parsed once. With `--group_queries`,
+    requests over the same documents are also ranked together.
+    """
+    from app.pipeline import load_requests, process_request_group, write_json
+
+    print(f"📄 Loading batch from {args.batch}...")
+    requests = load_requests(args.batch)
+    output_dir = args.output_dir
+
+    batch_start = time.time()
+    ranking_engine = build_ranking_engine(args)
+    if ranking_engine is None:
+        return
+
+    document_store = build_document_store(args, ranking_engine)
+
+    groups = group_requests(requests) if args.group_queries else [[i] for i in range(len(requests))]
+    results = [None] * len(requests)
+    for group in groups:
+        request_ids = [requests[i][0] for i in group]
+        if len(group) == 1:
+            (i,) = group
+            print(f"\n[{i + 1}/{len(requests)}] Request {request_ids[0]}")
+            _, input_data, input_dir = requests[i]
+            try:
+                if not isinstance(input_data, dict):
+                    raise ValueError("Request is not a JSON object.")
+                final_output, timings = process_request_recorded(
+                    input_data, input_dir, ranking_engine, document_store,
+                    top_k=args.top_k, pool_size=args.pool_size, lambda_val=args.mmr_lambda,
+                    performance=args.performance,
+                )
+                results[i] = batch_result(request_ids[0], final_output, timings, output_dir)
+            except Exception as e:
+                results[i] = error_result(request_ids[0], e)
+            continue
+
+        print(f"\n[{group[0] + 1}/{len(requests)}] Requests {', '.join(request_ids)} (shared documents)")
+        try:
+            outputs = process_request_recorded(
+                [requests[i][1:] for i in group], ranking_engine, document_store, process=process_request_group,
+                top_k=args.top_k, pool_size=args.pool_size, lambda_val=args.mmr_lambda,
+                performance=args.performance,
+            )
+            for i, request_id, (final_output, timings) in zip(group, request_ids, outputs):
+                results[i] = dict(batch_result(request_id, final_output, timings, output_dir), group_size=len(group))
+        except Exception as e:
+            for i, request_id in zip(group, request_ids):
+                results[i] = error_result(request_id, e)
+
+    summary = {
+        "batch": args.batch,
+        "request_count": len(results),
+        "succeeded": sum(1 for r in results if r["status"] == "ok"),
+        "documents_parsed": len(document_store.documents),
+        "total_seconds": round(time.time() - batch_start, 3),
+        "requests": results,
+    }
+    summary_file = os.path.join(output_dir, "batch_summary.json")
+    write_json(summary, summary_file)
+
+    print(f"\n✅ Batch complete: {summary['succeeded']}/{len(results)} request(s) succeeded.")
+    print(f"   Summary written to: {summary_file}")
+    print(f"   Total processing time: {summary['total_seconds']:.2f} seconds")
+
+def main():
+    # --- CHANGED: Argument parsing now takes a single JSON input file or a batch ---
+    parser = argparse.ArgumentParser(description="Persona-Driven Document Intelligence System")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input_json", help="Path to the input JSON file.")
+    source.add_argument("--batch", help="Path to a directory of input JSON files or a JSONL file with one request per line.")
+    parser.add_argument("--output_file", default=None, help="Path to the output JSON file. A default name will be generated if not provided.")
+    parser.add_argument("--output_dir", default="./data/output", help="Directory for the outputs and the summary of a batch run.")
+    parser.add_argument("--group_queries", action="store_true",
+                        help="Rank batch requests over the same documents together, scoring all their queries in one pass.")
+    parser.add_argument("--stream", action="store_true", help="Overlap PDF parsing with embedding and keep only the top candidates in memory (single input only).")
+    parser.add_argument("--workers", type=int, default=EXTRACTION_WORKERS, help="Number of worker processes used for PDF extraction (0 or 1 extracts serially).")
+    parser.add_argument("--backend", choices=["torch", "onnx"], default=EMBEDDING_BACKEND, help="Embedding backend: the reference PyTorch model or the quantized ONNX Runtime export.")
+    parser.add_argument("--long_text_mode", choices=["truncate", "chunk"], default=LONG_TEXT_MODE,
+                        help="Texts beyond the model's token window are truncated or embedded as mean-pooled chunks.")
+    parser.add_argument("--encoder_workers", type=int, default=ENCODER_WORKERS, help="Number of encoder worker processes sharing the model (0 or 1 encodes in-process).")
+    parser.add_argument("--encoder_threads", type=int, default=ENCODER_THREADS,
+                        help="Intra-op threads of the model, per encoder worker (0: library default in-process, cores divided between workers).")
+    parser.add_argument("--no_cache", action="store_true", help="Disable the persistent caches of parsed PDF sections, OCR results and text embeddings.")
+    parser.add_argument("--top_k", type=positive_int, default=TOP_K, help="Number of sections and subsections in the output.")
+    parser.add_argument("--pool_size", type=positive_int, default=CANDIDATE_POOL_SIZE, help="Number of top-scoring candidates re-ranked with MMR.")
+    parser.add_argument("--mmr_lambda", type=mmr_lambda, default=MMR_LAMBDA, help="MMR trade-off between diversity (0.0) and relevance (1.0).")
+    parser.add_argument("--lexical_candidates", type=int, default=LEXICAL_CANDIDATES,
+                        help="Densely score only the top N sections and subsections by BM25 (0 scores everything; ignored with --stream).")
+    parser.add_argument("--hierarchical_sections", type=int, default=HIERARCHICAL_SECTIONS,
+                        help="Embed and rank only the subsections of the top M sections (0 ranks every subsection; ignored with --stream and --group_queries).")
+    parser.add_argument("--near_duplicate_threshold", type=near_duplicate_threshold, default=NEAR_DUPLICATE_THRESHOLD,
+                        help="Collapse passages whose word shingles overlap at least this much (MinHash Jaccard estimate) before ranking (0 keeps all; ignored with --stream).")
+    parser.add_argument("--index_dir", default=None,
+                        help="Rank against a persistent corpus index in this directory; only new or changed PDFs are parsed and embedded.")
+    parser.add_argument("--ivf_probe", type=int, default=IVF_PROBE, help="IVF partitions searched per query once the index has been partitioned (0 searches all).")
+    parser.add_argument("--performance", action="store_true", help="Add per-stage timers and counters to the output metadata.")
+    parser.add_argument("--trace_file", default=None, help="Write the recorded spans as a Chrome trace (.json) or JSON lines (.jsonl).")
+    parser.add_argument("--profile", nargs="?", const="run.prof", default=None, help="Run under cProfile, print the top functions and save the stats (default: run.prof).")
+    args = parser.parse_args()
+    if args.stream and args.batch:
+        parser.error("--stream cannot be combined with --batch, which shares parsed documents between requests.")
+    if args.group_queries and not args.batch:
+        parser.error("--group_queries requires --batch.")
+    if args.stream and args.index_dir:
+        parser.error("--stream cannot be combined with --index_dir, which already skips extraction for indexed documents.")
+
+    run = run_batch if args.batch else run_single
+    recorder = instrumentation.Instrumentation() if args.performance or args.trace_file else None
+    with instrumentation.recording(recorder):
+        if args.profile:
+            profiler = cProfile.Profile()
+            profiler.runcall(run, args)
+            profiler.dump_stats(args.profile)
+            print(f"\n📊 Profile saved to {args.profile}. Top functions by cumulative time:")
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+        else:
+            run(args)
+
+    if args.trace_file:
+        recorder.write_trace(args.trace_file)
+        print(f"   Trace written to: {args.trace_file}")
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
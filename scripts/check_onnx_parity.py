@@ -0,0 +1,74 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+from app.config import SENTENCE_TRANSFORMER_MODEL_PATH, ONNX_MODEL_PATH
+from app.processing.pdf_parser import extract_all_documents
+from app.ranking.backends import load_backend
+
+def sample_texts(pdf_dir, limit):
+    """Collects section titles, section texts and subsection texts from the PDFs in a directory."""
+    sections = extract_all_documents(sorted(glob.glob(os.path.join(pdf_dir, "*.pdf"))))
+    texts = []
+    for section in sections:
+        texts.append(section["section_title"])
+        texts.append(section["text"])
+        texts.extend(sub["text"] for sub in section["subsections"])
+    texts = [text for text in dict.fromkeys(texts) if text]
+    return texts[:limit]
+
+def timed_encode(encoder, texts, batch_size, repeats):
+    """Returns the embeddings and the best-of-`repeats` throughput in texts per second."""
+    encoder.encode(texts[:batch_size], batch_size=batch_size, normalize_embeddings=True)  # Warm-up
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        embeddings = encoder.encode(texts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True)
+        best = min(best, time.perf_counter() - start)
+    return np.asarray(embeddings, dtype=np.float32), len(texts) / best
+
+def check_parity(model_path, onnx_model_path, pdf_dir, limit, batch_size, repeats):
+    texts = sample_texts(pdf_dir, limit)
+    print(f"Comparing backends on {len(texts)} texts from {pdf_dir}...")
+
+    reference, torch_throughput = timed_encode(load_backend("torch", model_path), texts, batch_size, repeats)
+    candidate, onnx_throughput = timed_encode(load_backend("onnx", model_path, onnx_model_path), texts, batch_size, repeats)
+
+    # Both are unit vectors, so the row-wise dot product is the cosine similarity
+    cosines = np.sum(reference * candidate, axis=1)
+    query = reference.mean(axis=0)
+    top_reference = np.argsort(-(reference @ query))[:10]
+    top_candidate = np.argsort(-(candidate @ query))[:10]
+
+    report = {
+        "texts": len(texts),
+        "cosine_to_reference": {
+            "mean": float(cosines.mean()),
+            "min": float(cosines.min()),
+            "p01": float(np.percentile(cosines, 1)),
+        },
+        "top10_overlap": len(set(top_reference) & set(top_candidate)) / 10,
+        "throughput_texts_per_second": {"torch": round(torch_throughput, 1), "onnx": round(onnx_throughput, 1)},
+        "speedup": round(onnx_throughput / torch_throughput, 2),
+        "onnx_model_mb": round(os.path.getsize(onnx_model_path) / 2 ** 20, 1),
+    }
+    print(json.dumps(report, indent=4))
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report cosine drift and throughput of the ONNX backend against the PyTorch reference.")
+    parser.add_argument("--model_path", default=SENTENCE_TRANSFORMER_MODEL_PATH, help="Sentence-transformer model directory.")
+    parser.add_argument("--onnx_model_path", default=ONNX_MODEL_PATH, help="Quantized ONNX model.")
+    parser.add_argument("--pdf_dir", default=os.path.join("data", "input"), help="Directory of PDFs used as sample texts.")
+    parser.add_argument("--limit", type=int, default=512, help="Maximum number of sample texts.")
+    parser.add_argument("--batch_size", type=int, default=32, help="Encode batch size for both backends.")
+    parser.add_argument("--repeats", type=int, default=3, help="Number of timed runs per backend.")
+    args = parser.parse_args()
+    check_parity(args.model_path, args.onnx_model_path, args.pdf_dir, args.limit, args.batch_size, args.repeats)
@@ -0,0 +1,76 @@
+import argparse
+import glob
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.validators import positive_int
+from app.config import (
+    SENTENCE_TRANSFORMER_MODEL_PATH, EMBEDDING_BACKEND, EXTRACTION_WORKERS, CORPUS_INDEX_DIR, IVF_ITERATIONS, LONG_TEXT_MODE,
+)
+
+def expand(paths):
+    """Expands directories to the PDFs they contain."""
+    pdf_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            pdf_paths.extend(sorted(glob.glob(os.path.join(path, "*.pdf"))))
+        else:
+            pdf_paths.append(path)
+    return pdf_paths
+
+def open_index(args):
+    from app.processing.cache import ExtractionCache, OcrCache
+    from app.ranking.cache import EmbeddingCache
+    from app.ranking.engine import RankingEngine
+    from app.ranking.index import CorpusIndex
+
+    embedding_cache = None if args.no_cache else EmbeddingCache(
+        SENTENCE_TRANSFORMER_MODEL_PATH, backend=args.backend, long_text_mode=args.long_text_mode,
+    )
+    # The model is only loaded if documents have to be embedded
+    engine = RankingEngine(model_path=SENTENCE_TRANSFORMER_MODEL_PATH, embedding_cache=embedding_cache,
+                           backend=args.backend, long_text_mode=args.long_text_mode, warm_up=False)
+    return CorpusIndex(
+        engine, args.index_dir, workers=args.workers,
+        cache=None if args.no_cache else ExtractionCache(), ocr_cache=None if args.no_cache else OcrCache(),
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the persistent corpus index used by 'run.py --index_dir'.")
+    parser.add_argument("--index_dir", default=CORPUS_INDEX_DIR, help="Directory of the index.")
+    parser.add_argument("--backend", choices=["torch", "onnx"], default=EMBEDDING_BACKEND, help="Embedding backend of the index.")
+    parser.add_argument("--long_text_mode", choices=["truncate", "chunk"], default=LONG_TEXT_MODE,
+                        help="How texts beyond the model's token window are embedded; must match the run.py --long_text_mode the index serves.")
+    parser.add_argument("--workers", type=int, default=EXTRACTION_WORKERS, help="Number of worker processes used for PDF extraction.")
+    parser.add_argument("--no_cache", action="store_true", help="Do not use the extraction, OCR and embedding caches.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="Index new or changed PDFs (files or directories).")
+    add.add_argument("paths", nargs="+")
+    remove = commands.add_parser("remove", help="Remove PDFs from the index.")
+    remove.add_argument("paths", nargs="+")
+    commands.add_parser("list", help="List the indexed documents.")
+    commands.add_parser("compact", help="Reclaim the rows of removed and replaced documents.")
+    train = commands.add_parser("train", help="Partition the index into IVF lists for faster queries on large corpora.")
+    train.add_argument("--lists", type=positive_int, required=True, help="Number of IVF lists (partitions).")
+    train.add_argument("--iterations", type=int, default=IVF_ITERATIONS, help="k-means iterations.")
+    args = parser.parse_args()
+
+    index = open_index(args)
+    if args.command == "add":
+        indexed = index.update(expand(args.paths))
+        print(f"✅ Indexed {len(indexed)} new or changed document(s); {len(index)} document(s), {index.rows} row(s) in total.")
+    elif args.command == "remove":
+        removed = index.remove(expand(args.paths))
+        print(f"✅ Removed {len(removed)} document(s); {len(index)} document(s) left.")
+    elif args.command == "list":
+        for path, entry in sorted(index.documents.items()):
+            print(f"{path}  ({entry['sections']} sections, {entry['subsections']} subsections)")
+        print(f"{len(index)} document(s), {index.rows} row(s).")
+    elif args.command == "compact":
+        index.compact()
+        print(f"✅ Compacted the index to {index.rows} row(s).")
+    elif args.command == "train":
+        index.train_ivf(args.lists, iterations=args.iterations)
+        print(f"✅ Partitioned {index.rows} row(s) into {0 if index.centroids is None else len(index.centroids)} IVF list(s).")
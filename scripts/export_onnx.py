@@ -0,0 +1,94 @@
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.config import SENTENCE_TRANSFORMER_MODEL_PATH, ONNX_MODEL_DIR, ONNX_MODEL_PATH
+
+# Intermediate full-precision export, quantized into ONNX_MODEL_PATH
+FP32_MODEL_PATH = os.path.join(ONNX_MODEL_DIR, "model.onnx")
+
+def export_fp32(model_path, output_path):
+    """
+    Exports the transformer of a sentence-transformer model to ONNX. The graph maps
+    input_ids, attention_mask and token_type_ids to the token embeddings; pooling and
+    normalization are done by the ONNX backend.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    class TokenEmbeddings(torch.nn.Module):
+        """Wraps the transformer so the exported graph has positional inputs and one output."""
+        def __init__(self, transformer):
+            super().__init__()
+            self.transformer = transformer
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.transformer(
+                input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids
+            ).last_hidden_state
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = TokenEmbeddings(AutoModel.from_pretrained(model_path))
+    model.eval()
+
+    sample = tokenizer(["A sample sentence for tracing.", "Another one."], padding=True, return_tensors="pt")
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["token_embeddings"] = {0: "batch", 1: "sequence"}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            output_path,
+            input_names=input_names,
+            output_names=["token_embeddings"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+            dynamo=False,
+        )
+
+def quantize_int8(input_path, output_path):
+    """Applies dynamic int8 quantization to the weights of an ONNX model."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(input_path, output_path, weight_type=QuantType.QInt8)
+
+def export_onnx(model_path=SENTENCE_TRANSFORMER_MODEL_PATH, output_path=ONNX_MODEL_PATH, force=False):
+    """
+    One-time offline export of the embedding model to a dynamically quantized ONNX model.
+    """
+    print(f"Exporting model: {model_path}")
+    print(f"Destination: {output_path}")
+
+    if os.path.exists(output_path) and not force:
+        print("ONNX model already exists. Skipping export (use --force to overwrite).")
+        return
+
+    if not os.path.exists(model_path):
+        print("❌ Model directory not found. Run 'python scripts/download_models.py' first.")
+        return
+
+    try:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        fp32_path = os.path.join(os.path.dirname(output_path), os.path.basename(FP32_MODEL_PATH))
+        export_fp32(model_path, fp32_path)
+        quantize_int8(fp32_path, output_path)
+
+        fp32_size = os.path.getsize(fp32_path) / 2 ** 20
+        int8_size = os.path.getsize(output_path) / 2 ** 20
+        print(f"✅ Model exported: {fp32_size:.1f} MB (fp32) -> {int8_size:.1f} MB (int8).")
+        print("   Verify it with 'python scripts/check_onnx_parity.py'.")
+
+    except Exception as e:
+        print(f"❌ Error exporting model: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the embedding model to a quantized ONNX model.")
+    parser.add_argument("--model_path", default=SENTENCE_TRANSFORMER_MODEL_PATH, help="Sentence-transformer model directory.")
+    parser.add_argument("--output_path", default=ONNX_MODEL_PATH, help="Path of the quantized ONNX model.")
+    parser.add_argument("--force", action="store_true", help="Overwrite an existing export.")
+    args = parser.parse_args()
+    export_onnx(args.model_path, args.output_path, args.force)
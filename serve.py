@@ -0,0 +1,85 @@
+import argparse
+import logging
+
+from app.processing.cache import ExtractionCache, OcrCache
+from app.ranking.engine import RankingEngine
+from app.ranking.cache import EmbeddingCache
+from app.pipeline import DocumentStore
+from app.validators import near_duplicate_threshold
+from app.service.server import RankingService, create_server
+from app.config import (
+    SENTENCE_TRANSFORMER_MODEL_PATH, EMBEDDING_BACKEND, EXTRACTION_WORKERS, LEXICAL_CANDIDATES, HIERARCHICAL_SECTIONS, SERVICE_HOST, SERVICE_PORT, SERVICE_DOCUMENTS_DIR,
+    ENCODE_MAX_BATCH_SIZE, ENCODE_MAX_WAIT_MS, ENCODE_MAX_QUEUE_SIZE, ENCODER_WORKERS, ENCODER_THREADS,
+    NEAR_DUPLICATE_THRESHOLD, LONG_TEXT_MODE,
+)
+
+def main():
+    parser = argparse.ArgumentParser(description="Persona-Driven Document Intelligence System - ranking service")
+    parser.add_argument("--host", default=SERVICE_HOST, help="Address to bind the HTTP server to.")
+    parser.add_argument("--port", type=int, default=SERVICE_PORT, help="Port to listen on.")
+    parser.add_argument("--documents_dir", default=SERVICE_DOCUMENTS_DIR, help="Directory the document file names of requests are relative to.")
+    parser.add_argument("--workers", type=int, default=EXTRACTION_WORKERS, help="Number of worker processes used for PDF extraction (0 or 1 extracts serially).")
+    parser.add_argument("--backend", choices=["torch", "onnx"], default=EMBEDDING_BACKEND, help="Embedding backend: the reference PyTorch model or the quantized ONNX Runtime export.")
+    parser.add_argument("--long_text_mode", choices=["truncate", "chunk"], default=LONG_TEXT_MODE,
+                        help="Texts beyond the model's token window are truncated or embedded as mean-pooled chunks.")
+    parser.add_argument("--near_duplicate_threshold", type=near_duplicate_threshold, default=NEAR_DUPLICATE_THRESHOLD,
+                        help="Collapse passages whose word shingles overlap at least this much (MinHash Jaccard estimate) before ranking (0 keeps all).")
+    parser.add_argument("--encoder_workers", type=int, default=ENCODER_WORKERS, help="Number of encoder worker processes sharing the model (0 or 1 encodes in-process).")
+    parser.add_argument("--encoder_threads", type=int, default=ENCODER_THREADS,
+                        help="Intra-op threads of the model, per encoder worker (0: library default in-process, cores divided between workers).")
+    parser.add_argument("--no_cache", action="store_true", help="Disable the persistent caches of parsed PDF sections, OCR results and text embeddings.")
+    parser.add_argument("--lexical_candidates", type=int, default=LEXICAL_CANDIDATES, help="Densely score only the top N sections and subsections by BM25 (0 scores everything).")
+    parser.add_argument("--hierarchical_sections", type=int, default=HIERARCHICAL_SECTIONS, help="Embed and rank only the subsections of the top M sections (0 ranks every subsection).")
+    parser.add_argument("--max_batch_size", type=int, default=ENCODE_MAX_BATCH_SIZE, help="Maximum number of texts per shared encode batch.")
+    parser.add_argument("--max_wait_ms", type=float, default=ENCODE_MAX_WAIT_MS, help="Maximum time an encode batch waits to fill up.")
+    parser.add_argument("--max_queue_size", type=int, default=ENCODE_MAX_QUEUE_SIZE, help="Maximum number of queued encode chunks before requests are rejected with 503.")
+    parser.add_argument("--max_in_flight", type=int, default=None, help="Maximum number of concurrently processed requests (unlimited by default).")
+    args = parser.parse_args()
+
+    print("🚀 Initializing Ranking Engine...")
+    try:
+        embedding_cache = None if args.no_cache else EmbeddingCache(
+            SENTENCE_TRANSFORMER_MODEL_PATH, backend=args.backend, long_text_mode=args.long_text_mode,
+        )
+        ranking_engine = RankingEngine(
+            model_path=SENTENCE_TRANSFORMER_MODEL_PATH, embedding_cache=embedding_cache, backend=args.backend,
+            lexical_candidates=args.lexical_candidates, hierarchical_sections=args.hierarchical_sections,
+            encoder_workers=args.encoder_workers, encoder_threads=args.encoder_threads, long_text_mode=args.long_text_mode,
+            near_duplicate_threshold=args.near_duplicate_threshold,
+        )
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        print("Please run 'python scripts/download_models.py' (and 'python scripts/export_onnx.py' for the ONNX backend) to create the required model files.")
+        return
+
+    # Load the model up front so the first request does not pay for it. The throwaway
+    # text is kept out of the embedding cache
+    ranking_engine.embedding_model.get_embeddings("warm-up", use_cache=False)
+
+    extraction_cache = None if args.no_cache else ExtractionCache()
+    ocr_cache = None if args.no_cache else OcrCache()
+    service = RankingService(
+        ranking_engine, args.documents_dir,
+        document_store=DocumentStore(
+            workers=args.workers, cache=extraction_cache, ocr_cache=ocr_cache, lexical_index=args.lexical_candidates > 0,
+        ),
+        batcher_options={
+            "max_batch_size": args.max_batch_size,
+            "max_wait_ms": args.max_wait_ms,
+            "max_queue_size": args.max_queue_size,
+        },
+        max_in_flight=args.max_in_flight,
+    )
+    server = create_server(service, args.host, args.port)
+    print(f"✅ Listening on http://{args.host}:{args.port} (POST /rank, GET /metrics, GET /health)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Shutting down.")
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
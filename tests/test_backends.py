@@ -0,0 +1,61 @@
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.ranking.backends import OnnxSentenceEncoder
+
+PADDING_VALUE = 1000.0
+
+class WordTokenizer:
+    """Tokenizes on whitespace, one id per word (its length), padding every batch to its longest text."""
+    def encode_batch(self, texts):
+        ids = [[len(word) for word in text.split()] for text in texts]
+        width = max(len(row) for row in ids)
+        return [
+            SimpleNamespace(ids=row + [0] * (width - len(row)), attention_mask=[1] * len(row) + [0] * (width - len(row)),
+                            type_ids=[0] * width)
+            for row in ids
+        ]
+
+class TokenSession:
+    """Embeds every token as [id, 1], and padding as a large vector that pooling must ignore."""
+    def __init__(self):
+        self.batches = []
+
+    def run(self, output_names, feeds):
+        self.batches.append(feeds["input_ids"].shape[0])
+        ids = feeds["input_ids"].astype(np.float32)
+        token_embeddings = np.stack([ids, np.ones_like(ids)], axis=-1)
+        token_embeddings[feeds["attention_mask"] == 0] = PADDING_VALUE
+        return [token_embeddings]
+
+def make_encoder():
+    encoder = OnnxSentenceEncoder.__new__(OnnxSentenceEncoder)
+    encoder.session = TokenSession()
+    encoder.tokenizer = WordTokenizer()
+    encoder.input_names = {"input_ids", "attention_mask"}
+    encoder.max_seq_length = 256
+    return encoder
+
+class TestOnnxSentenceEncoder(unittest.TestCase):
+
+    def test_mean_pooling_ignores_padding_and_keeps_input_order(self):
+        texts = ["a bb", "cccc", "a bb ccc dddd eeeee", "bb bb bb", "dddd a"]
+        encoder = make_encoder()
+        embeddings = encoder.encode(texts, batch_size=2)
+
+        expected = np.array([[np.mean([len(w) for w in text.split()]), 1.0] for text in texts], dtype=np.float32)
+        np.testing.assert_allclose(embeddings, expected, rtol=1e-6)
+        self.assertEqual(embeddings.dtype, np.float32)
+        self.assertEqual(encoder.session.batches, [2, 2, 1])
+
+    def test_normalized_embeddings_are_unit_vectors(self):
+        texts = ["a bb", "cccc dddd eeeee"]
+        embeddings = make_encoder().encode(texts, normalize_embeddings=True)
+        np.testing.assert_allclose(np.linalg.norm(embeddings, axis=1), [1.0, 1.0], rtol=1e-6)
+        pooled = make_encoder().encode(texts)
+        np.testing.assert_allclose(embeddings, pooled / np.linalg.norm(pooled, axis=1, keepdims=True), rtol=1e-6)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+
+import numpy as np
+
+from app.processing.corpus import Corpus
+from app.ranking.lexical import LexicalIndex
+
+def make_sections(filename, count):
+    return [
+        {
+            'filename': filename, 'page_number': i + 1, 'section_title': 'Overview' if i % 2 else f'Part {i}',
+            'text': f'Body {i}' if i else '',
+            'subsections': [{'text': f'Paragraph {i}', 'page_number': i + 1, 'filename': filename}, {'text': ''}],
+        }
+        for i in range(count)
+    ]
+
+class TestCorpus(unittest.TestCase):
+
+    def test_from_sections_interns_tables_and_links_subsections(self):
+        corpus = Corpus.from_sections(make_sections('a.pdf', 4))
+
+        self.assertEqual(corpus.documents, ['a.pdf'])
+        self.assertEqual(corpus.titles, ['Part 0', 'Overview', 'Part 2'])
+        self.assertEqual(corpus.num_sections, 4)
+        self.assertEqual(corpus.num_subsections, 4)
+        self.assertEqual(corpus.subsection_section.tolist(), [0, 1, 2, 3])
+        self.assertEqual(corpus.sections_with_text().tolist(), [1, 2, 3])
+
+        section = corpus.section(3)
+        self.assertEqual((section.document, section.page_number, section.section_title), ('a.pdf', 4, 'Overview'))
+        subsection = corpus.subsection(2)
+        self.assertEqual((subsection.document, subsection.text, subsection.section), ('a.pdf', 'Paragraph 2', 2))
+        with self.assertRaises(AttributeError):
+            subsection.score = 1.0
+
+    def test_concatenate_remaps_ids_and_offsets(self):
+        first = Corpus.from_sections(make_sections('a.pdf', 2))
+        second = Corpus.from_sections(make_sections('b.pdf', 3))
+        corpus = Corpus.concatenate([first, second, Corpus()])
+
+        self.assertEqual(corpus.documents, ['a.pdf', 'b.pdf'])
+        self.assertEqual(corpus.titles, ['Part 0', 'Overview', 'Part 2'])
+        self.assertEqual(corpus.num_sections, 5)
+        self.assertEqual(corpus.subsection_section.tolist(), [0, 1, 2, 3, 4])
+        self.assertEqual(corpus.section(4).document, 'b.pdf')
+        self.assertEqual(corpus.section(4).section_title, 'Part 2')
+        self.assertEqual(corpus.subsection(3).document, 'b.pdf')
+        self.assertEqual(corpus.section_title.dtype, np.int32)
+
+    def test_lexical_indexes_are_merged_on_concatenation(self):
+        first = Corpus.from_sections(make_sections('a.pdf', 2))
+        second = Corpus.from_sections(make_sections('b.pdf', 3))
+        first.ensure_lexical_index()
+        second.ensure_lexical_index()
+        merged = Corpus.concatenate([first, second]).lexical_index
+        rebuilt = LexicalIndex.from_corpus(Corpus.concatenate([first, second]))
+
+        for query in ("Body 2", "overview paragraph 1", "missing"):
+            np.testing.assert_allclose(merged.sections.scores(query), rebuilt.sections.scores(query), rtol=1e-6)
+            np.testing.assert_allclose(merged.subsections.scores(query), rebuilt.subsections.scores(query), rtol=1e-6)
+        self.assertEqual(merged.sections.top("part 2 body 2", 1).tolist(), [4])
+        self.assertIsNone(Corpus.concatenate([first, Corpus()]).lexical_index)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from app.pipeline import DocumentStore
+from app.processing.corpus import Corpus
+from app.processing.dedup import MinHasher, lsh_bands, near_duplicate_owners, remove_near_duplicates
+from app.ranking.engine import RankingEngine
+from app.ranking.index import CorpusIndex
+from app.ranking.lexical import LexicalIndex
+from app.validators import near_duplicate_threshold
+
+from tests.test_index import HashEncoder, write_varied_pdf
+
+DISCLAIMER = ("All prices and opening hours in this guide were checked at the time of writing "
+              "and may have changed since, so please confirm them before you travel.")
+
+def make_sections(filename, topics):
+    """One section per topic, each with a topical paragraph followed by the shared disclaimer."""
+    return [
+        {
+            'filename': filename, 'page_number': i + 1, 'section_title': topic.title(),
+            'text': f'A guide to {topic} written for {filename} with many details.',
+            'subsections': [
+                {'text': f'The best {topic} of the region are described here in {filename}.', 'page_number': i + 1},
+                {'text': DISCLAIMER, 'page_number': i + 1},
+            ],
+        }
+        for i, topic in enumerate(topics)
+    ]
+
+class TestNearDuplicates(unittest.TestCase):
+
+    def test_owners_point_at_first_similar_text(self):
+        texts = [DISCLAIMER, "Something else entirely about trains and buses.", DISCLAIMER.replace("guide", "book"), DISCLAIMER]
+        owners = near_duplicate_owners(texts, 0.5, MinHasher())
+        self.assertEqual(owners.tolist(), [-1, -1, 0, 0])
+        self.assertEqual(near_duplicate_owners(texts, 0.95, MinHasher()).tolist(), [-1, -1, -1, 0])
+
+    def test_texts_without_words_are_never_duplicates(self):
+        texts = ["---", DISCLAIMER, "* * *", "", DISCLAIMER, "..."]
+        self.assertEqual(near_duplicate_owners(texts, 0.8, MinHasher()).tolist(), [-1, -1, -1, -1, 1, -1])
+
+    def test_threshold_must_be_off_or_a_fraction(self):
+        self.assertEqual(near_duplicate_threshold("0.8"), 0.8)
+        self.assertEqual(near_duplicate_threshold(0), 0.0)
+        for value in (-0.5, 1.5, "high"):
+            with self.assertRaises(ValueError):
+                near_duplicate_threshold(value)
+        with self.assertRaises(ValueError):
+            remove_near_duplicates(Corpus.from_sections(make_sections('a.pdf', ['beaches'])), -1)
+
+    def test_band_layout_starts_to_rise_below_threshold(self):
+        for threshold in (0.3, 0.5, 0.8, 0.95):
+            bands, rows = lsh_bands(threshold, 128)
+            self.assertEqual(bands * rows, 128)
+            self.assertLessEqual((1 / bands) ** (1 / rows), threshold)
+
+    def test_repeated_passages_are_collapsed_with_references(self):
+        sections = make_sections('a.pdf', ['beaches', 'castles']) + make_sections('b.pdf', ['museums'])
+        sections.append(dict(sections[0], filename='b.pdf', page_number=9))
+        corpus = Corpus.from_sections(sections)
+        corpus.ensure_lexical_index()
+
+        deduplicated = remove_near_duplicates(corpus, 0.8)
+        self.assertEqual(deduplicated.num_sections, 3)
+        # The copied section left with its subsections; one disclaimer remains
+        self.assertEqual(deduplicated.num_subsections, 4)
+        self.assertEqual(deduplicated.section(0).duplicates, [('b.pdf', 9)])
+        self.assertEqual(deduplicated.subsection(1).duplicates, [('a.pdf', 2), ('b.pdf', 1)])
+        self.assertEqual(deduplicated.subsection_section.tolist(), [0, 0, 1, 2])
+
+        # The subsetted lexical index scores like one built for the smaller corpus
+        rebuilt = LexicalIndex.from_corpus(deduplicated)
+        for query in ("castles guide", "prices opening hours", "museums"):
+            np.testing.assert_allclose(deduplicated.lexical_index.sections.scores(query), rebuilt.sections.scores(query), rtol=1e-6)
+            np.testing.assert_allclose(deduplicated.lexical_index.subsections.scores(query), rebuilt.subsections.scores(query), rtol=1e-6)
+        self.assertIs(remove_near_duplicates(deduplicated, 0.8), deduplicated)
+
+class TestRankingWithoutDuplicates(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.engine = RankingEngine(model_path=self.tmp_dir, warm_up=False)
+        self.engine.embedding_model.model = HashEncoder()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_ranked_passages_list_their_duplicate_sources(self):
+        sections = make_sections('a.pdf', ['beaches', 'castles']) + make_sections('b.pdf', ['museums'])
+        _, subsections = self.engine.rank("travel disclaimer", sections, top_k=5, pool_size=10, near_duplicate_threshold=0.8)
+        self.assertEqual(len(subsections), 4)
+        disclaimers = [s for s in subsections if s['refined_text'] == DISCLAIMER]
+        self.assertEqual(len(disclaimers), 1)
+        self.assertEqual(disclaimers[0]['duplicate_sources'], [
+            {'document': 'a.pdf', 'page_number': 2}, {'document': 'b.pdf', 'page_number': 1},
+        ])
+        # Off by default: every copy is ranked and no result carries sources
+        _, subsections = self.engine.rank("travel disclaimer", sections, top_k=10, pool_size=10)
+        self.assertEqual(len(subsections), 6)
+        self.assertFalse(any('duplicate_sources' in s for s in subsections))
+
+    def test_indexed_corpus_keeps_embeddings_of_kept_rows(self):
+        pdf_paths = [os.path.join(self.tmp_dir, f"varied{i}.pdf") for i in range(2)]
+        for i, path in enumerate(pdf_paths):
+            write_varied_pdf(path, i)
+        shutil.copy(pdf_paths[0], os.path.join(self.tmp_dir, "copy.pdf"))
+        pdf_paths.append(os.path.join(self.tmp_dir, "copy.pdf"))
+
+        self.engine.near_duplicate_threshold = 0.8
+        expected = self.engine.rank("museums", DocumentStore().get_corpus(pdf_paths), top_k=4, pool_size=10)
+        index = CorpusIndex(self.engine, os.path.join(self.tmp_dir, "index"))
+        self.assertEqual(self.engine.rank("museums", index.get_corpus(pdf_paths), top_k=4, pool_size=10), expected)
+        for subsection in expected[1]:
+            self.assertNotEqual(subsection['document'], 'copy.pdf')
+            if subsection['document'] == 'varied0.pdf':
+                self.assertEqual(subsection['duplicate_sources'], [{'document': 'copy.pdf', 'page_number': subsection['page_number_constraints'][0]}])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from app.ranking.cache import EmbeddingCache, model_identity, text_key
+from app.ranking.embedding import EmbeddingModel
+
+def fake_encode(texts, **kwargs):
+    """Deterministic stand-in for SentenceTransformer.encode: one unit vector per text length."""
+    vectors = np.zeros((len(texts), 8), dtype=np.float32)
+    for i, text in enumerate(texts):
+        vectors[i, len(text) % 8] = 1.0
+    return vectors
+
+class TestEmbeddingCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        patcher = patch('sentence_transformers.SentenceTransformer')
+        self.MockSentenceTransformer = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.MockSentenceTransformer.return_value.encode.side_effect = fake_encode
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def make_model(self, **cache_kwargs):
+        cache = EmbeddingCache(self.tmp_dir, cache_dir=self.tmp_dir, **cache_kwargs)
+        return EmbeddingModel(self.tmp_dir, cache=cache)
+
+    def test_only_misses_are_encoded(self):
+        model = self.make_model()
+        first = np.array(model.get_embeddings(["a", "bb", "a"]))
+        encode = self.MockSentenceTransformer.return_value.encode
+        self.assertEqual(encode.call_args[0][0], ["a", "bb"])
+
+        second = model.get_embeddings(["bb", "ccc"])
+        self.assertEqual(encode.call_args[0][0], ["ccc"])
+        np.testing.assert_array_equal(second[0], first[1])
+
+    def test_hits_persist_and_are_views(self):
+        self.make_model().get_embeddings(["a", "bb", "ccc"])
+        self.MockSentenceTransformer.reset_mock()
+
+        model = self.make_model()
+        embeddings = model.get_embeddings(["a", "bb", "ccc"])
+        self.MockSentenceTransformer.assert_not_called()
+        self.assertIsInstance(embeddings, np.memmap)
+        np.testing.assert_array_equal(embeddings, fake_encode(["a", "bb", "ccc"]))
+
+    def test_uncached_calls_leave_the_cache_untouched(self):
+        model = self.make_model()
+        model.get_embeddings("warm-up", use_cache=False)
+        self.MockSentenceTransformer.return_value.encode.assert_called_once()
+        self.assertFalse(model.cached_mask(["warm-up"])[0])
+        self.assertEqual(len(model.cache), 0)
+
+    def test_eviction_keeps_cache_bounded(self):
+        model = self.make_model(max_entries=2)
+        model.get_embeddings(["a"])
+        model.get_embeddings(["bb"])
+        model.get_embeddings(["a"])  # "a" is now more recent than "bb"
+        embeddings = model.get_embeddings(["ccc"])
+
+        self.assertEqual(len(model.cache), 2)
+        self.assertEqual(model.cache.rows, 2)
+        np.testing.assert_array_equal(embeddings, fake_encode(["ccc"]))
+        rows = model.cache.lookup([text_key(t) for t in ["a", "bb", "ccc"]])
+        self.assertEqual((rows >= 0).tolist(), [True, False, True])
+
+    def test_float16_storage(self):
+        model = self.make_model(dtype="float16")
+        model.get_embeddings(["a", "bb"])
+        embeddings = model.get_embeddings(["bb", "a"])
+        self.assertEqual(embeddings.dtype, np.float32)
+        np.testing.assert_array_equal(embeddings, fake_encode(["bb", "a"]))
+
+    def test_index_changes_are_journaled_and_replayed(self):
+        model = self.make_model()
+        for text in ["a", "bb", "ccc"]:
+            model.get_embeddings([text])
+        model.get_embeddings(["a"])  # A hit: "a" becomes the most recently used entry
+        with open(model.cache.index_path, encoding='utf-8') as f:
+            self.assertEqual(len(json.load(f)["entries"]), 1)  # Only the first add wrote a snapshot
+        with open(model.cache.journal_path, encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), 3)
+
+        reopened = EmbeddingCache(self.tmp_dir, cache_dir=self.tmp_dir, max_entries=2)
+        self.assertEqual(reopened.entries, model.cache.entries)
+        self.assertEqual(reopened.rows, 3)
+        reopened.evict()
+        self.assertEqual(sorted(reopened.entries), sorted(text_key(t) for t in ["a", "ccc"]))
+        self.assertEqual(EmbeddingCache(self.tmp_dir, cache_dir=self.tmp_dir).entries, reopened.entries)
+
+    def test_model_identity_follows_weights(self):
+        weights = os.path.join(self.tmp_dir, "model.safetensors")
+        with open(weights, 'wb') as f:
+            f.write(b"weights")
+        before = model_identity(self.tmp_dir)
+        os.utime(weights, ns=(0, 0))
+        self.assertNotEqual(model_identity(self.tmp_dir), before)
+
+    def test_onnx_identity_follows_export(self):
+        onnx_path = os.path.join(self.tmp_dir, "model.onnx")
+        with open(onnx_path, 'wb') as f:
+            f.write(b"export")
+        before = model_identity(self.tmp_dir, "onnx", onnx_path)
+        self.assertNotEqual(before, model_identity(self.tmp_dir))
+        os.utime(onnx_path, ns=(0, 0))  # A re-export of the same size
+        self.assertNotEqual(model_identity(self.tmp_dir, "onnx", onnx_path), before)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import fitz
+import numpy as np
+
+from app.pipeline import DocumentStore
+from app.ranking.engine import RankingEngine
+from app.ranking.index import CorpusIndex
+
+from tests.test_pdf_parser import write_sample_pdf
+
+TOPICS = ["beaches and coastal walks", "wine tasting in old cellars", "museums of modern art", "mountain hiking trails",
+          "night markets and street food", "medieval castles and ruins", "cooking classes with local chefs", "river cruises"]
+
+def write_varied_pdf(path, seed, sections=8):
+    """Writes a PDF with one heading per page and a body paragraph on a varying topic."""
+    doc = fitz.open()
+    for i in range(sections):
+        topic = TOPICS[(seed + i * 3) % len(TOPICS)]
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Chapter {seed}.{i}", fontname="hebo", fontsize=16)
+        page.insert_text((72, 102), f"This paragraph describes {topic} in enough words for a subsection {seed} {i}.",
+                         fontname="helv", fontsize=10)
+    doc.save(path)
+    doc.close()
+
+class HashEncoder:
+    """Maps every text to a fixed pseudo-random unit vector, standing in for the model."""
+    def encode(self, texts, **kwargs):
+        vectors = np.array([
+            np.random.default_rng(int(hashlib.md5(text.encode('utf-8')).hexdigest()[:8], 16)).standard_normal(16)
+            for text in texts
+        ], dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+class TestCorpusIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.index_dir = os.path.join(self.tmp_dir, "index")
+        self.pdf_paths = []
+        for i, pages in enumerate([3, 2, 4]):
+            path = os.path.join(self.tmp_dir, f"doc{i}.pdf")
+            write_sample_pdf(path, pages)
+            self.pdf_paths.append(path)
+        self.engine = RankingEngine(model_path=self.tmp_dir, warm_up=False)
+        self.engine.embedding_model.model = HashEncoder()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def rank(self, corpus):
+        return self.engine.rank("query about headings", corpus, top_k=4, pool_size=10)
+
+    def test_indexed_ranking_matches_in_memory_ranking(self):
+        expected = self.rank(DocumentStore().get_corpus(self.pdf_paths))
+        self.assertEqual(self.rank(CorpusIndex(self.engine, self.index_dir).get_corpus(self.pdf_paths)), expected)
+
+        # A reopened index serves the documents without parsing or embedding them again
+        with patch('app.processing.pdf_parser.extract_documents') as mock_extract:
+            reopened = CorpusIndex(self.engine, self.index_dir)
+            self.assertEqual(self.rank(reopened.get_corpus(self.pdf_paths)), expected)
+            mock_extract.assert_not_called()
+
+        queries = ["query about headings", "another persona and task"]
+        self.assertEqual(
+            self.engine.rank_many(queries, reopened.get_corpus(self.pdf_paths), top_k=4, pool_size=10),
+            [self.engine.rank(query, DocumentStore().get_corpus(self.pdf_paths), top_k=4, pool_size=10) for query in queries],
+        )
+
+    def test_only_changed_documents_are_reindexed(self):
+        index = CorpusIndex(self.engine, self.index_dir)
+        self.assertEqual(index.update(self.pdf_paths), self.pdf_paths)
+        self.assertEqual(index.update(self.pdf_paths), [])
+
+        write_sample_pdf(self.pdf_paths[1], 5)
+        self.assertEqual(index.update(self.pdf_paths), [self.pdf_paths[1]])
+        self.assertEqual(index.documents[os.path.abspath(self.pdf_paths[1])]["sections"], 10)
+        expected = self.rank(DocumentStore().get_corpus(self.pdf_paths))
+        self.assertEqual(self.rank(index.get_corpus(self.pdf_paths)), expected)
+
+    def test_remove_and_compact(self):
+        index = CorpusIndex(self.engine, self.index_dir)
+        index.update(self.pdf_paths)
+        rows = index.rows
+        index.remove(self.pdf_paths[:1])
+        self.assertEqual(len(index), 2)
+
+        index.compact()
+        self.assertEqual(index.rows, rows - 3 * 6)  # Title, content and subsection row of each of the 6 sections
+        expected = self.rank(DocumentStore().get_corpus(self.pdf_paths[1:]))
+        self.assertEqual(self.rank(CorpusIndex(self.engine, self.index_dir).get_corpus(self.pdf_paths[1:])), expected)
+
+    def test_ivf_probes_a_subset_of_partitions(self):
+        pdf_paths = [os.path.join(self.tmp_dir, f"varied{i}.pdf") for i in range(3)]
+        for i, path in enumerate(pdf_paths):
+            write_varied_pdf(path, i)
+        index = CorpusIndex(self.engine, self.index_dir, ivf_probe=1)
+        index.update(pdf_paths)
+        exhaustive = self.rank(index.get_corpus(pdf_paths))
+        index.train_ivf(4)
+
+        corpus = index.get_corpus(pdf_paths)
+        section_ids, subsection_ids = corpus.probe(self.engine.embedding_model.get_embeddings("query about headings"))
+        self.assertLess(len(subsection_ids), corpus.num_subsections)
+        self.assertEqual(len(self.rank(corpus)[0]), 4 if len(section_ids) >= 4 else len(section_ids))
+
+        # Probing every partition is an exhaustive search
+        index.ivf_probe = 4
+        self.assertEqual(self.rank(index.get_corpus(pdf_paths)), exhaustive)
+
+    def test_identical_documents_keep_their_own_names(self):
+        os.makedirs(os.path.join(self.tmp_dir, "copies"))
+        copy_path = os.path.join(self.tmp_dir, "copies", "copy.pdf")
+        shutil.copy(self.pdf_paths[0], copy_path)
+        CorpusIndex(self.engine, self.index_dir).update([self.pdf_paths[0], copy_path])
+
+        reopened = CorpusIndex(self.engine, self.index_dir)
+        for path in (self.pdf_paths[0], copy_path):
+            self.assertEqual(reopened.get_corpus([path]).documents, [os.path.basename(path)])
+        with self.assertRaises(ValueError):
+            reopened.train_ivf(0)
+
+    def test_rebuild_discards_files_of_previous_index(self):
+        pdf_paths = [os.path.join(self.tmp_dir, f"varied{i}.pdf") for i in range(3)]
+        for i, path in enumerate(pdf_paths):
+            write_varied_pdf(path, i)
+        index = CorpusIndex(self.engine, self.index_dir)
+        index.update(pdf_paths)
+        index.train_ivf(4)
+
+        # Another model identity starts the index over, without its partitioning or documents
+        with open(os.path.join(self.index_dir, "index.json"), encoding='utf-8') as f:
+            manifest = json.load(f)
+        manifest["model"] = "another-model"
+        with open(os.path.join(self.index_dir, "index.json"), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        rebuilt = CorpusIndex(self.engine, self.index_dir)
+        self.assertEqual((len(rebuilt), rebuilt.rows), (0, 0))
+        self.assertEqual(os.listdir(os.path.join(self.index_dir, "documents")), [])
+        rebuilt.update(pdf_paths[:1])
+
+        reopened = CorpusIndex(self.engine, self.index_dir)
+        self.assertIsNone(reopened.centroids)
+        self.assertEqual(reopened.rows, 24)
+        self.assertEqual(len(os.listdir(os.path.join(self.index_dir, "documents"))), 1)
+        self.assertEqual(self.rank(reopened.get_corpus(pdf_paths[:1])), self.rank(DocumentStore().get_corpus(pdf_paths[:1])))
+
+    def test_partitioning_of_other_rows_is_ignored(self):
+        index = CorpusIndex(self.engine, self.index_dir)
+        index.update(self.pdf_paths)
+        index.train_ivf(2)
+        np.save(os.path.join(self.index_dir, "ivf_clusters.npy"), index.clusters[:-1])
+        self.assertIsNone(CorpusIndex(self.engine, self.index_dir).centroids)
+
+if __name__ == '__main__':
+    unittest.main()
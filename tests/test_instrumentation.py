@@ -0,0 +1,90 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from app import instrumentation
+from app.instrumentation import Instrumentation
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_module_calls_record_only_while_active(self):
+        instrumentation.increment("ignored")
+        recorder = Instrumentation()
+        with instrumentation.recording(recorder):
+            with instrumentation.span("encode", texts=3):
+                instrumentation.increment("texts_encoded", 3)
+                instrumentation.observe("encode_batch_size", 3)
+            instrumentation.observe("encode_batch_size", 5)
+        instrumentation.increment("texts_encoded")
+
+        summary = recorder.summary()
+        self.assertIsNone(instrumentation.active())
+        self.assertEqual(summary["counters"], {"texts_encoded": 3})
+        self.assertEqual(summary["timers"]["encode"]["calls"], 1)
+        self.assertEqual(summary["distributions"]["encode_batch_size"]["mean"], 4.0)
+        self.assertEqual(recorder.events[0]["args"], {"texts": 3})
+
+    def test_recorders_are_per_thread_unless_passed_on(self):
+        recorder, other = Instrumentation(), Instrumentation()
+        ready, done = threading.Event(), threading.Event()
+
+        def concurrent_run():
+            with instrumentation.recording(other):
+                ready.set()
+                done.wait(5)
+                instrumentation.increment("texts_encoded", 2)
+
+        thread = threading.Thread(target=concurrent_run)
+        thread.start()
+        ready.wait(5)
+        with instrumentation.recording(recorder):
+            instrumentation.increment("texts_encoded")
+            for helper in (threading.Thread(target=instrumentation.increment, args=("ignored",)),
+                           threading.Thread(target=instrumentation.in_current_context(instrumentation.increment), args=("pages_parsed",))):
+                helper.start()
+                helper.join()
+        done.set()
+        thread.join()
+
+        self.assertEqual(recorder.counters, {"texts_encoded": 1, "pages_parsed": 1})
+        self.assertEqual(other.counters, {"texts_encoded": 2})
+
+    def test_merge_adds_exported_state(self):
+        worker, recorder = Instrumentation(), Instrumentation()
+        worker.increment("pages_parsed", 4)
+        with worker.span("parse_file"):
+            pass
+        recorder.increment("pages_parsed", 1)
+        recorder.merge(worker.export())
+
+        self.assertEqual(recorder.counters["pages_parsed"], 5)
+        self.assertEqual(recorder.timer_calls["parse_file"], 1)
+        self.assertEqual(recorder.events, [])
+
+    def test_write_trace_formats(self):
+        recorder = Instrumentation()
+        with recorder.span("ranking"):
+            recorder.increment("texts_ranked", 10)
+
+        chrome_path = os.path.join(self.tmp_dir, "trace.json")
+        recorder.write_trace(chrome_path)
+        with open(chrome_path, encoding='utf-8') as f:
+            events = json.load(f)["traceEvents"]
+        self.assertEqual([(e["name"], e["ph"]) for e in events], [("ranking", "X"), ("texts_ranked", "C")])
+
+        lines_path = os.path.join(self.tmp_dir, "trace.jsonl")
+        recorder.write_trace(lines_path)
+        with open(lines_path, encoding='utf-8') as f:
+            self.assertEqual([json.loads(line)["name"] for line in f], ["ranking", "texts_ranked"])
+
+if __name__ == '__main__':
+    unittest.main()
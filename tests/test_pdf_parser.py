@@ -0,0 +1,199 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+import zlib
+from unittest.mock import patch
+
+import fitz
+
+from app.processing.cache import ExtractionCache, OcrCache
+from app.processing.pdf_parser import extract_all_documents, extract_sections_from_file
+
+BODY_TEXT = "This paragraph has more than enough words to be kept as a subsection of its section."
+
+def write_sample_pdf(path, page_count, headings_per_page=2):
+    """Writes a PDF whose pages alternate bold headings and body paragraphs."""
+    doc = fitz.open()
+    for page_num in range(page_count):
+        page = doc.new_page()
+        y = 72
+        for h in range(headings_per_page):
+            page.insert_text((72, y), f"Heading {page_num + 1}.{h + 1}", fontname="hebo", fontsize=16)
+            page.insert_text((72, y + 30), BODY_TEXT, fontname="helv", fontsize=10)
+            y += 120
+    doc.save(path)
+    doc.close()
+
+def rasterize_page(path, page_index):
+    """Replaces one page of a PDF with an image of it, leaving that page without a text layer."""
+    doc = fitz.open(path)
+    scanned = fitz.open()
+    for i, page in enumerate(doc):
+        if i == page_index:
+            scanned.new_page(width=page.rect.width, height=page.rect.height).insert_image(page.rect, pixmap=page.get_pixmap(dpi=72))
+        else:
+            scanned.insert_pdf(doc, from_page=i, to_page=i)
+    doc.close()
+    scanned.save(path)
+    scanned.close()
+
+OCR_TEXT = "Scanned paragraph with plenty of words so that it becomes a subsection too.\n\nSecond scanned paragraph."
+
+class TestPdfParser(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.pdf_paths = []
+        for i, pages in enumerate([3, 7, 1]):
+            path = os.path.join(self.tmp_dir, f"doc{i}.pdf")
+            write_sample_pdf(path, pages)
+            self.pdf_paths.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_sections_follow_headings(self):
+        sections = extract_sections_from_file(self.pdf_paths[0])
+        self.assertEqual(len(sections), 6)
+        self.assertEqual(sections[0]['section_title'], 'Heading 1.1')
+        self.assertEqual(sections[0]['text'], BODY_TEXT)
+        self.assertEqual(sections[-1]['page_number'], 3)
+        self.assertEqual(len(sections[0]['subsections']), 1)
+
+    def test_parallel_matches_serial_order(self):
+        """Splitting files into page ranges across workers must not change the output order."""
+        serial = extract_all_documents(self.pdf_paths)
+        parallel = extract_all_documents(self.pdf_paths, workers=3, pages_per_task=2)
+        self.assertEqual(parallel, serial)
+        self.assertEqual(len(serial), 22)
+
+    def test_heading_size_follows_body_font_of_document(self):
+        """Headings below MIN_HEADING_FONT_SIZE count when they are not smaller than the body text."""
+        path = os.path.join(self.tmp_dir, "small.pdf")
+        doc = fitz.open()
+        for page_num in range(3):
+            page = doc.new_page()
+            page.insert_text((72, 72), f"Small Heading {page_num + 1}", fontname="hebo", fontsize=10)
+            page.insert_text((72, 102), BODY_TEXT, fontname="helv", fontsize=9)
+            page.insert_text((72, 132), "Bold caption", fontname="hebo", fontsize=7)
+        doc.save(path)
+        doc.close()
+
+        sections = extract_sections_from_file(path)
+        self.assertEqual([s['section_title'] for s in sections], ['Small Heading 1', 'Small Heading 2', 'Small Heading 3'])
+        self.assertEqual(sections[0]['text'], BODY_TEXT + "\n\nBold caption")
+        self.assertEqual(extract_all_documents([path], workers=2, pages_per_task=1), sections)
+
+    def test_missing_files_are_skipped(self):
+        missing = os.path.join(self.tmp_dir, "missing.pdf")
+        sections = extract_all_documents([missing, self.pdf_paths[2]], workers=2)
+        self.assertEqual([s['filename'] for s in sections], ['doc2.pdf', 'doc2.pdf'])
+
+    def test_cache_hit_skips_parsing(self):
+        cache = ExtractionCache(os.path.join(self.tmp_dir, "cache"))
+        first = extract_all_documents(self.pdf_paths, cache=cache)
+
+        with patch('app.processing.pdf_parser.extract_sections_from_file') as mock_extract:
+            second = extract_all_documents(self.pdf_paths, cache=cache)
+            mock_extract.assert_not_called()
+        self.assertEqual(second, first)
+
+    def test_cache_is_content_addressed(self):
+        cache = ExtractionCache(os.path.join(self.tmp_dir, "cache"))
+        extract_all_documents(self.pdf_paths[:1], cache=cache)
+        renamed = os.path.join(self.tmp_dir, "renamed.pdf")
+        shutil.copy(self.pdf_paths[0], renamed)
+
+        sections = cache.get(cache.key_for(renamed), "renamed.pdf")
+        self.assertEqual(len(sections), 6)
+        self.assertTrue(all(s['filename'] == 'renamed.pdf' for s in sections))
+
+    def test_unreadable_cache_entries_are_misses(self):
+        cache = ExtractionCache(os.path.join(self.tmp_dir, "cache"))
+        for payload in (b"truncated", zlib.compress(b"not a pickle"), zlib.compress(pickle.dumps("not sections")),
+                        zlib.compress(pickle.dumps([{"section_title": "no subsections list", "subsections": 3}]))):
+            with open(cache._entry_path("bad"), 'wb') as f:
+                f.write(payload)
+            self.assertIsNone(cache.get("bad", "doc0.pdf"))
+            self.assertFalse(os.path.exists(cache._entry_path("bad")))
+
+        ocr_cache = OcrCache(os.path.join(self.tmp_dir, "ocr"))
+        with open(ocr_cache._entry_path("bad"), 'wb') as f:
+            f.write(zlib.compress(b"\xff\xfe"))
+        self.assertIsNone(ocr_cache.get("bad"))
+        self.assertFalse(os.path.exists(ocr_cache._entry_path("bad")))
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = ExtractionCache(os.path.join(self.tmp_dir, "cache"), max_bytes=10 ** 9)
+        sections = extract_sections_from_file(self.pdf_paths[1])
+        cache.put("old", sections)
+        cache.put("new", sections)
+        os.utime(cache._entry_path("old"), (0, 0))
+
+        cache.max_bytes = os.path.getsize(cache._entry_path("new"))
+        cache.evict()
+        self.assertIsNone(cache.get("old", "doc1.pdf"))
+        self.assertIsNotNone(cache.get("new", "doc1.pdf"))
+
+class TestOcrFallback(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.pdf_path = os.path.join(self.tmp_dir, "mixed.pdf")
+        write_sample_pdf(self.pdf_path, 3, headings_per_page=1)
+        rasterize_page(self.pdf_path, 1)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    @patch('app.processing.pdf_parser.OCR_WORKERS', 0)
+    @patch('app.processing.ocr._ocr_image', return_value=(OCR_TEXT, 95.0))
+    def test_scanned_page_of_mixed_document_is_ocred(self, mock_ocr):
+        sections = extract_sections_from_file(self.pdf_path)
+        self.assertEqual([s['section_title'] for s in sections], ['Heading 1.1', 'Heading 3.1'])
+        # The scanned page has no heading of its own, so its paragraphs continue the section before it
+        self.assertEqual(sections[0]['text'], "\n\n".join([BODY_TEXT, *OCR_TEXT.split("\n\n")]))
+        self.assertEqual(len(sections[0]['subsections']), 2)
+        mock_ocr.assert_called_once()
+
+    @patch('app.processing.ocr._ocr_image', side_effect=[("blurry", 40.0), ("sharp", 90.0)])
+    def test_low_confidence_pages_are_ocred_again_at_higher_resolution(self, mock_ocr):
+        from app.processing.ocr import ocr_page
+        with fitz.open(self.pdf_path) as doc:
+            self.assertEqual(ocr_page(doc.load_page(1)), "sharp")
+        first_pass, second_pass = (call.args[0] for call in mock_ocr.call_args_list)
+        self.assertGreater(second_pass.width, first_pass.width)
+
+    @patch('app.processing.pdf_parser.OCR_WORKERS', 0)
+    @patch('app.processing.ocr._ocr_image', return_value=(OCR_TEXT, 95.0))
+    def test_ocr_cache_skips_recognized_pages(self, mock_ocr):
+        ocr_cache = OcrCache(os.path.join(self.tmp_dir, "ocr"))
+        first = extract_sections_from_file(self.pdf_path, ocr_cache=ocr_cache)
+        second = extract_sections_from_file(self.pdf_path, ocr_cache=ocr_cache)
+        self.assertEqual(second, first)
+        mock_ocr.assert_called_once()
+
+    def test_scanned_pages_are_submitted_in_batches(self):
+        from concurrent.futures import Future
+        from app.processing.pdf_parser import _ocr_missing_pages
+
+        class InlineExecutor:
+            def __init__(self):
+                self.batches = []
+
+            def submit(self, fn, pdf_path, page_numbers, ocr_cache):
+                self.batches.append(page_numbers)
+                future = Future()
+                future.set_result(({n: f"Page {n} text." for n in page_numbers}, None, {}))
+                return future
+
+        executor = InlineExecutor()
+        page_blocks = [(n, None, None) for n in range(1, 6)]
+        blocks, ocr_texts = _ocr_missing_pages(self.pdf_path, page_blocks, executor=executor, workers=2)
+        self.assertEqual(executor.batches, [[1, 2, 3], [4, 5]])
+        self.assertEqual(blocks, [(n, False, f"Page {n} text.") for n in range(1, 6)])
+
+if __name__ == '__main__':
+    unittest.main()
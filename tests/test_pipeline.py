@@ -0,0 +1,117 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from app.pipeline import DocumentStore, load_requests, parse_request
+
+def make_request(persona, filenames):
+    return {
+        'persona': {'role': persona},
+        'job_to_be_done': {'task': 'Plan a trip.'},
+        'documents': [{'filename': name} for name in filenames],
+    }
+
+def fake_extract_documents(pdf_paths, workers=0, cache=None, ocr_cache=None):
+    return [(path, [{'filename': os.path.basename(path), 'section_title': 'Title'}]) for path in pdf_paths]
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_load_requests_from_jsonl(self):
+        batch_path = os.path.join(self.tmp_dir, 'requests.jsonl')
+        with open(batch_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(make_request('Chef', ['a.pdf'])) + '\n\n')
+            f.write(json.dumps(dict(make_request('Guide', ['b.pdf']), request_id='guide')) + '\n')
+            f.write('not json\n')
+
+        requests = load_requests(batch_path)
+        self.assertEqual([r[0] for r in requests], ['line0001', 'guide', 'line0004'])
+        self.assertIsNone(requests[2][1])
+        _, _, _, pdf_paths = parse_request(requests[1][1], requests[1][2])
+        self.assertEqual(pdf_paths, [os.path.join(self.tmp_dir, 'b.pdf')])
+
+    def test_load_requests_from_directory(self):
+        for name in ['b.json', 'a.json', 'notes.txt']:
+            with open(os.path.join(self.tmp_dir, name), 'w', encoding='utf-8') as f:
+                json.dump(make_request('Chef', ['a.pdf']), f)
+        self.assertEqual([r[0] for r in load_requests(self.tmp_dir)], ['a', 'b'])
+
+    def test_request_ids_are_safe_unique_file_names(self):
+        batch_path = os.path.join(self.tmp_dir, 'requests.jsonl')
+        with open(batch_path, 'w', encoding='utf-8') as f:
+            for request_id in ['../../x', 'guide', 'guide', '..']:
+                f.write(json.dumps(dict(make_request('Guide', ['b.pdf']), request_id=request_id)) + '\n')
+        self.assertEqual([r[0] for r in load_requests(batch_path)], ['x', 'guide', 'guide-2', 'request'])
+
+    def test_malformed_file_in_directory_is_returned_without_data(self):
+        with open(os.path.join(self.tmp_dir, 'a.json'), 'w', encoding='utf-8') as f:
+            json.dump(make_request('Chef', ['a.pdf']), f)
+        with open(os.path.join(self.tmp_dir, 'b.json'), 'w', encoding='utf-8') as f:
+            f.write('{"persona": ')
+        requests = load_requests(self.tmp_dir)
+        self.assertEqual([r[0] for r in requests], ['a', 'b'])
+        self.assertIsNotNone(requests[0][1])
+        self.assertIsNone(requests[1][1])
+
+    @patch('app.pipeline.extract_documents', side_effect=fake_extract_documents)
+    def test_document_store_parses_each_document_once(self, mock_extract):
+        store = DocumentStore()
+        first = store.get_corpus(['docs/a.pdf', 'docs/b.pdf'])
+        second = store.get_corpus(['docs/b.pdf', 'docs/c.pdf', 'docs/c.pdf'])
+
+        self.assertEqual([first.section(i).document for i in range(len(first))], ['a.pdf', 'b.pdf'])
+        self.assertEqual([second.section(i).document for i in range(len(second))], ['b.pdf', 'c.pdf', 'c.pdf'])
+        self.assertEqual(mock_extract.call_args_list[1][0][0], ['docs/c.pdf'])
+
+    @patch('app.pipeline.extract_documents', side_effect=fake_extract_documents)
+    def test_document_store_reparses_changed_files_and_drops_least_recently_used(self, mock_extract):
+        paths = []
+        for name in ['a.pdf', 'b.pdf', 'c.pdf']:
+            paths.append(os.path.join(self.tmp_dir, name))
+            with open(paths[-1], 'wb') as f:
+                f.write(b'v1')
+        store = DocumentStore(max_documents=2)
+        store.get_corpus(paths[:2])
+        store.get_corpus(paths[:1])
+
+        with open(paths[1], 'wb') as f:
+            f.write(b'version 2')
+        store.get_corpus(paths[1:2])
+        self.assertEqual(mock_extract.call_args_list[-1][0][0], [paths[1]])
+
+        store.get_corpus(paths[2:])
+        self.assertEqual(list(store.documents), [os.path.abspath(paths[1]), os.path.abspath(paths[2])])
+        self.assertEqual(mock_extract.call_count, 3)
+
+    def test_document_store_parses_concurrently_requested_document_once(self):
+        started, release = threading.Event(), threading.Event()
+        def slow_extract(pdf_paths, **kwargs):
+            started.set()
+            release.wait(5)
+            return fake_extract_documents(pdf_paths)
+
+        store = DocumentStore()
+        results = []
+        with patch('app.pipeline.extract_documents', side_effect=slow_extract) as mock_extract:
+            first = threading.Thread(target=lambda: results.append(store.get_corpus(['docs/a.pdf'])))
+            first.start()
+            started.wait(5)
+            second = threading.Thread(target=lambda: results.append(store.get_corpus(['docs/a.pdf'])))
+            second.start()
+            release.set()
+            first.join()
+            second.join()
+        self.assertEqual(mock_extract.call_count, 1)
+        self.assertEqual([corpus.section(0).document for corpus in results], ['a.pdf', 'a.pdf'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -33,8 +33,9 @@ class TestRankingEngine(unittest.TestCase):
         section_embeddings = np.array([[0, 1, 0], [1, 0, 0]])
         subsection_embeddings = np.array([[1, 0, 0], [0, 0, 1]])
 
+        # The query is encoded first, then titles, section contents and subsections in one deduplicated call
         mock_model_instance.get_embeddings.side_effect = [
-            query_embedding, section_embeddings, subsection_embeddings
+            query_embedding, np.vstack([section_embeddings, section_embeddings, subsection_embeddings])
         ]
         
         # --- Act ---
@@ -48,11 +49,12 @@ class TestRankingEngine(unittest.TestCase):
         # Check section ranking
         self.assertEqual(ranked_sections[0]['section_title'], 'About GNN')
         self.assertEqual(ranked_sections[0]['importance_rank'], 1)
-        self.assertAlmostEqual(ranked_sections[0]['similarity'], 1.0)
+        self.assertEqual(ranked_sections[1]['section_title'], 'About Apples')
+        self.assertEqual(mock_model_instance.get_embeddings.call_count, 2)
 
-        # Check subsection ranking
+        # Check subsection ranking (output order is the rank)
         self.assertEqual(ranked_subsections[0]['refined_text'], 'GNN performance benchmarks are key.')
-        self.assertEqual(ranked_subsections[0]['importance_rank'], 1)
+        self.assertEqual(ranked_subsections[1]['refined_text'], 'Irrelevant subsection about bananas.')
 
     @patch('app.ranking.engine.EmbeddingModel')
     def test_rank_with_empty_input(self, MockEmbeddingModel):
@@ -62,5 +64,149 @@ class TestRankingEngine(unittest.TestCase):
         self.assertEqual(ranked_sections, [])
         self.assertEqual(ranked_subsections, [])
 
+    @patch('app.ranking.engine.EmbeddingModel')
+    def test_mmr_matches_reference_selection(self, MockEmbeddingModel):
+        """The vectorized MMR must select the same documents as the straightforward formulation."""
+        rng = np.random.default_rng(0)
+        doc_embeddings = rng.normal(size=(200, 16))
+        doc_embeddings /= np.linalg.norm(doc_embeddings, axis=1, keepdims=True)
+        query_embedding = doc_embeddings[:1] + 0.1
+        query_embedding /= np.linalg.norm(query_embedding)
+        docs = list(range(200))
+
+        relevance = (doc_embeddings @ query_embedding.T).ravel()
+        expected = [int(np.argmax(relevance))]
+        while len(expected) < 20:
+            best_idx, best_score = None, -np.inf
+            for idx in docs:
+                if idx in expected:
+                    continue
+                max_sim = np.max(doc_embeddings[expected] @ doc_embeddings[idx])
+                score = 0.5 * relevance[idx] - 0.5 * max_sim
+                if score > best_score:
+                    best_idx, best_score = idx, score
+            expected.append(best_idx)
+
+        ranking_engine = RankingEngine(model_path="/fake/path")
+        selected = ranking_engine._apply_mmr(query_embedding, doc_embeddings, docs, top_k=20, lambda_val=0.5)
+        self.assertEqual(selected, expected)
+
+    @patch('app.ranking.engine.EmbeddingModel')
+    def test_rank_respects_top_k_and_pool_size(self, MockEmbeddingModel):
+        rng = np.random.default_rng(1)
+        extracted_data = [
+            {'filename': 'doc.pdf', 'page_number': i + 1, 'section_title': f'Section {i}', 'text': f'Text {i}', 'subsections': []}
+            for i in range(30)
+        ]
+        embeddings = rng.normal(size=(30, 8))
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        # One call for the query, one for the 30 distinct titles and 30 distinct contents
+        MockEmbeddingModel.return_value.get_embeddings.side_effect = [embeddings[:1], np.vstack([embeddings, embeddings])]
+
+        ranking_engine = RankingEngine(model_path="/fake/path")
+        ranked_sections, _ = ranking_engine.rank("query", extracted_data, top_k=8, pool_size=12)
+        self.assertEqual(len(ranked_sections), 8)
+        self.assertEqual([s['importance_rank'] for s in ranked_sections], list(range(1, 9)))
+
+    @patch('app.ranking.engine.EmbeddingModel')
+    def test_rank_encodes_duplicate_texts_once(self, MockEmbeddingModel):
+        extracted_data = [
+            {'filename': 'a.pdf', 'page_number': 1, 'section_title': 'Intro', 'text': 'Same text',
+             'subsections': [{'filename': 'a.pdf', 'page_number': 1, 'text': 'Same text'}]},
+            {'filename': 'b.pdf', 'page_number': 1, 'section_title': 'Intro', 'text': 'Same  text\n',
+             'subsections': [{'filename': 'b.pdf', 'page_number': 1, 'text': 'Other text'}]},
+        ]
+        encoded = []
+        def fake_get_embeddings(texts):
+            texts = [texts] if isinstance(texts, str) else texts
+            encoded.extend(texts)
+            return np.array([[len(t), 1.0] for t in texts])
+        MockEmbeddingModel.return_value.get_embeddings.side_effect = fake_get_embeddings
+
+        ranking_engine = RankingEngine(model_path="/fake/path")
+        ranked_sections, ranked_subsections = ranking_engine.rank("query", extracted_data)
+        self.assertEqual(encoded, ["query", "Intro", "Same text", "Other text"])
+        self.assertEqual(ranking_engine.last_dedup_stats, {"texts": 6, "unique_texts": 3, "dedup_ratio": 0.5})
+        self.assertEqual(len(ranked_sections), 2)
+        self.assertEqual(len(ranked_subsections), 2)
+
+    @patch('app.ranking.engine.EmbeddingModel')
+    def test_lexical_prefilter_scores_only_candidates_and_cached_texts(self, MockEmbeddingModel):
+        extracted_data = [
+            {'filename': 'doc.pdf', 'page_number': i + 1, 'section_title': f'Section {i}',
+             'text': 'graph neural networks' if i == 3 else f'cooking recipe {i}',
+             'subsections': [{'page_number': i + 1, 'text': f'paragraph {i} about ' + ('graph networks' if i == 3 else 'food')}]}
+            for i in range(10)
+        ]
+        encoded = []
+        def fake_get_embeddings(texts):
+            texts = [texts] if isinstance(texts, str) else texts
+            encoded.extend(texts)
+            return np.array([[len(t), 1.0] for t in texts])
+        MockEmbeddingModel.return_value.get_embeddings.side_effect = fake_get_embeddings
+        # Section 7 was embedded before, so scoring it costs nothing
+        MockEmbeddingModel.return_value.cached_mask.side_effect = \
+            lambda texts: np.array([t in ('Section 7', 'cooking recipe 7') for t in texts], dtype=bool)
+
+        ranking_engine = RankingEngine(model_path="/fake/path", lexical_candidates=1)
+        ranked_sections, ranked_subsections = ranking_engine.rank("graph neural networks", extracted_data)
+        self.assertEqual(encoded, [
+            "graph neural networks",
+            "Section 3", "Section 7", "graph neural networks", "cooking recipe 7", "paragraph 3 about graph networks",
+        ])
+        self.assertEqual(sorted(s['page_number'] for s in ranked_sections), [4, 8])
+        self.assertEqual([s['refined_text'] for s in ranked_subsections], ["paragraph 3 about graph networks"])
+
+    @patch('app.ranking.engine.EmbeddingModel')
+    def test_rank_many_matches_ranking_each_query(self, MockEmbeddingModel):
+        extracted_data = [
+            {'filename': f'doc{i % 3}.pdf', 'page_number': i + 1, 'section_title': f'Section {i}', 'text': f'Body text {i}',
+             'subsections': [{'page_number': i + 1, 'text': f'Paragraph {i}.{j}'} for j in range(i % 3)]}
+            for i in range(20)
+        ]
+        encoded = []
+        def fake_get_embeddings(texts):
+            texts = [texts] if isinstance(texts, str) else texts
+            encoded.append(len(texts))
+            return np.array([np.random.default_rng(sum(map(ord, t)) * len(t)).normal(size=8) for t in texts])
+        MockEmbeddingModel.return_value.get_embeddings.side_effect = fake_get_embeddings
+        queries = ["travel planner", "food critic", "history student"]
+
+        ranking_engine = RankingEngine(model_path="/fake/path")
+        expected = [ranking_engine.rank(query, extracted_data, top_k=4, pool_size=8) for query in queries]
+        encoded.clear()
+        self.assertEqual(ranking_engine.rank_many(queries, extracted_data, top_k=4, pool_size=8), expected)
+        # One encode call for the queries and one for the 20 titles, 20 bodies and 19 subsections
+        self.assertEqual(encoded, [3, 20 + 20 + 19])
+
+    @patch('app.ranking.engine.EmbeddingModel')
+    def test_hierarchical_ranking_embeds_only_subsections_of_top_sections(self, MockEmbeddingModel):
+        extracted_data = [
+            {'filename': 'doc.pdf', 'page_number': i + 1, 'section_title': f'Section {i}',
+             'text': 'graph neural networks' if i in (2, 6) else f'cooking recipe {i}',
+             'subsections': [{'page_number': i + 1, 'text': f'paragraph {i}.{j} about ' + ('graphs' if i in (2, 6) else 'food')}
+                             for j in range(3)]}
+            for i in range(10)
+        ]
+        encoded = []
+        def fake_get_embeddings(texts):
+            texts = [texts] if isinstance(texts, str) else texts
+            encoded.extend(texts)
+            return np.array([[1.0, 0.1 * len(t)] if 'graph' in t else [0.0, 1.0] for t in texts])
+        MockEmbeddingModel.return_value.get_embeddings.side_effect = fake_get_embeddings
+
+        ranking_engine = RankingEngine(model_path="/fake/path", hierarchical_sections=2)
+        _, ranked_subsections = ranking_engine.rank("graph", extracted_data, top_k=3)
+        self.assertEqual(sorted(t for t in encoded if t.startswith('paragraph')),
+                         [f'paragraph {i}.{j} about graphs' for i in (2, 6) for j in range(3)])
+        self.assertTrue(all('graphs' in s['refined_text'] for s in ranked_subsections))
+        self.assertEqual(ranking_engine.last_hierarchical_stats, {
+            "sections_expanded": 2, "subsections_embedded": 6, "subsections_skipped": 24, "encodes_saved": 24,
+        })
+
+        # Expanding every section ranks like the flat mode
+        flat = RankingEngine(model_path="/fake/path").rank("graph", extracted_data, top_k=3)
+        self.assertEqual(ranking_engine.rank("graph", extracted_data, top_k=3, hierarchical_sections=10), flat)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,66 @@
+import unittest
+
+import numpy as np
+
+from app.ranking.scheduling import EncodeScheduler
+
+class RecordingEncoder:
+    """Encodes a text as a unit vector of its word count and records every batch."""
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, show_progress_bar=False, normalize_embeddings=False):
+        self.batches.append(list(texts))
+        vectors = np.array([[len(text.split()), 1.0] for text in texts], dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+class TestEncodeScheduler(unittest.TestCase):
+
+    def test_long_texts_are_cut_to_the_window_before_encoding(self):
+        long_text = " ".join(f"word{i}" for i in range(50))
+        encoder = RecordingEncoder()
+        embeddings = EncodeScheduler(max_seq_length=16).encode(encoder, ["short title", long_text])
+
+        encoded = [text for batch in encoder.batches for text in batch]
+        self.assertIn(" ".join(f"word{i}" for i in range(16)), encoded)
+        self.assertEqual(embeddings.shape, (2, 2))
+        np.testing.assert_allclose(embeddings[0], np.array([2, 1]) / np.sqrt(5), rtol=1e-6)
+
+    def test_batches_are_length_sorted_and_within_the_token_budget(self):
+        texts = ["x " * n for n in (3, 40, 1, 40, 2, 20)]
+        scheduler = EncodeScheduler(max_seq_length=64, token_budget=64, max_batch_items=3)
+        _, _, _, estimated = scheduler.plan(texts)
+        batches = scheduler.batches(estimated)
+
+        self.assertEqual(sorted(int(i) for batch in batches for i in batch), list(range(len(texts))))
+        for batch in batches:
+            self.assertLessEqual(len(batch), 3)
+            self.assertTrue(len(batch) == 1 or estimated[batch].max() * len(batch) <= 64)
+        # The two longest texts share the first batch, the shorter ones are grouped by length
+        self.assertEqual([set(int(i) for i in batch) for batch in batches], [{1, 3}, {0, 4, 5}, {2}])
+
+    def test_chunk_mode_pools_the_chunks_of_long_texts(self):
+        long_text = " ".join(f"word{i}" for i in range(50))
+        encoder = RecordingEncoder()
+        scheduler = EncodeScheduler(max_seq_length=16, long_text_mode="chunk")
+        embeddings = scheduler.encode(encoder, [long_text, "short title"])
+
+        chunks = [text for batch in encoder.batches for text in batch if text.startswith("word")]
+        self.assertEqual(" ".join(chunks).split(), long_text.split())
+        self.assertTrue(all(len(chunk.split()) <= scheduler.chunk_words for chunk in chunks))
+        np.testing.assert_allclose(np.linalg.norm(embeddings, axis=1), 1.0, rtol=1e-6)
+
+    def test_chunk_mode_splits_texts_that_fill_the_window_in_tokens(self):
+        # 200 words fit the 256 word limit but not the 256 token window
+        text = " ".join(f"word{i}" for i in range(200))
+        scheduler = EncodeScheduler(max_seq_length=256, long_text_mode="chunk")
+        inputs, owners, weights, _ = scheduler.plan([text, "short title"])
+
+        self.assertEqual(owners.tolist(), [0, 0, 1])
+        self.assertEqual(weights.tolist(), [scheduler.chunk_words, 200 - scheduler.chunk_words, 1.0])
+        self.assertEqual(" ".join(inputs[:2]).split(), text.split())
+        # Truncate mode still only cuts what cannot reach the model
+        self.assertEqual(EncodeScheduler(max_seq_length=256).plan([text])[0], [text])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.service.batcher import MicroBatcher, QueueFullError
+from app.service.server import RankingService
+
+class FakeEmbeddingModel:
+    """Records the size of every encode call and embeds each text as [len(text), 1]."""
+    def __init__(self, delay=0.0):
+        self.batch_sizes = []
+        self.delay = delay
+
+    def get_embeddings(self, texts):
+        self.batch_sizes.append(len(texts))
+        time.sleep(self.delay)
+        return np.array([[len(text), 1.0] for text in texts])
+
+    def cached_mask(self, texts):
+        return np.array(["cached" in text for text in texts])
+
+class TestMicroBatcher(unittest.TestCase):
+
+    def test_concurrent_requests_share_batches(self):
+        model = FakeEmbeddingModel()
+        batcher = MicroBatcher(model, max_batch_size=64, max_wait_ms=200)
+        self.addCleanup(batcher.close)
+
+        results = {}
+        def encode(i):
+            results[i] = batcher.get_embeddings(["x" * i] * 3)
+
+        threads = [threading.Thread(target=encode, args=(i,)) for i in range(1, 9)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLess(len(model.batch_sizes), 8)
+        self.assertEqual(sum(model.batch_sizes), 24)
+        for i in range(1, 9):
+            np.testing.assert_array_equal(results[i][:, 0], [i, i, i])
+
+    def test_large_requests_are_split_and_reassembled(self):
+        model = FakeEmbeddingModel()
+        batcher = MicroBatcher(model, max_batch_size=4, max_wait_ms=1)
+        self.addCleanup(batcher.close)
+
+        texts = ["x" * i for i in range(1, 11)]
+        embeddings = batcher.get_embeddings(texts)
+        np.testing.assert_array_equal(embeddings[:, 0], np.arange(1, 11))
+        self.assertTrue(all(size <= 4 for size in model.batch_sizes))
+
+    def test_full_queue_rejects_requests(self):
+        model = FakeEmbeddingModel(delay=0.3)
+        batcher = MicroBatcher(model, max_batch_size=1, max_wait_ms=0, max_queue_size=2)
+        self.addCleanup(batcher.close)
+
+        batcher.submit(["a"])
+        time.sleep(0.05)  # Let the worker pick up the first chunk
+        with self.assertRaises(QueueFullError):
+            batcher.submit(["b", "c", "d"])
+        self.assertEqual(batcher.metrics.snapshot()["counters"]["encode_requests_rejected"], 1)
+
+    def test_cached_mask_is_forwarded_to_the_model(self):
+        batcher = MicroBatcher(FakeEmbeddingModel(), max_wait_ms=1)
+        self.addCleanup(batcher.close)
+        self.assertEqual(batcher.cached_mask(["cached title", "new title"]).tolist(), [True, False])
+        self.assertEqual(batcher.metrics.snapshot()["counters"].get("encode_batches", 0), 0)
+
+class TestRankingService(unittest.TestCase):
+
+    def test_malformed_payloads_do_not_leak_permits(self):
+        service = RankingService(SimpleNamespace(embedding_model=FakeEmbeddingModel()), ".", max_in_flight=1)
+        self.addCleanup(service.close)
+        for payload in ({"lexical_candidates": "x"}, {"near_duplicate_threshold": None}, {"top_k": []}, {"near_duplicate_threshold": -1}, {"near_duplicate_threshold": 2},
+                        {"top_k": 0}, {"pool_size": -3}, {"mmr_lambda": 1.5}, {"mmr_lambda": -0.1},
+                        {"documents": "a.pdf"}, {"documents": ["a.pdf"]}, {"documents": [{"filename": 3}]}, {"documents": [{}]}):
+            with self.assertRaises(ValueError):
+                service.handle_rank(payload)
+        self.assertTrue(service._in_flight.acquire(blocking=False))
+
+if __name__ == '__main__':
+    unittest.main()
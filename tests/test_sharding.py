@@ -0,0 +1,51 @@
+import multiprocessing
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from app import instrumentation
+from app.ranking.embedding import EmbeddingModel
+from app.ranking.sharding import ShardedEncoder
+
+from tests.test_index import HashEncoder
+
+@unittest.skipUnless("fork" in multiprocessing.get_all_start_methods(), "workers inherit the stub encoder through fork")
+class TestShardedEncoder(unittest.TestCase):
+
+    @patch('app.ranking.sharding.set_torch_threads')
+    @patch('app.ranking.sharding.load_backend', return_value=HashEncoder())
+    def test_shards_are_reassembled_in_input_order(self, mock_load, mock_threads):
+        texts = [f"passage {i} " * (1 + i % 7) for i in range(50)]
+        encoder = ShardedEncoder("torch", "unused", workers=3, threads=2, min_texts_per_shard=8)
+        recorder = instrumentation.Instrumentation()
+        try:
+            with instrumentation.recording(recorder):
+                embeddings = encoder.encode(texts)
+                query = encoder.encode(["a single query"])
+        finally:
+            encoder.close()
+
+        np.testing.assert_allclose(embeddings, HashEncoder().encode(texts), rtol=1e-6)
+        np.testing.assert_allclose(query, HashEncoder().encode(["a single query"]), rtol=1e-6)
+        # The model was loaded once, in this process, and the forked workers shared it
+        mock_load.assert_called_once_with("torch", "unused", None, threads=1)
+        # The large request was split across all workers, the single query went to one
+        exported = recorder.export()
+        self.assertEqual(exported["observations"]["encode_shards"], [3, 1])
+        self.assertEqual(sum(exported["observations"]["encode_batch_size"]), 51)
+
+class TestShardedWarmUp(unittest.TestCase):
+
+    def test_workers_are_started_on_the_calling_thread(self):
+        started_on = []
+        with tempfile.TemporaryDirectory() as model_dir, \
+                patch('app.ranking.embedding.ShardedEncoder', side_effect=lambda *a, **k: started_on.append(threading.current_thread())):
+            model = EmbeddingModel(model_dir, encoder_workers=2)
+            self.assertIsNone(model.warm_up())
+        self.assertEqual(started_on, [threading.current_thread()])
+
+if __name__ == '__main__':
+    unittest.main()
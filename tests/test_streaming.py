@@ -0,0 +1,80 @@
+import copy
+import threading
+import unittest
+import zlib
+from unittest.mock import patch
+
+import numpy as np
+
+from app.pipeline import iter_in_background
+from app.ranking.engine import RankingEngine
+from app.ranking.streaming import StreamingRanker
+
+def fake_get_embeddings(texts):
+    """Embeds every text as a fixed pseudo-random unit vector derived from its contents."""
+    if isinstance(texts, str):
+        texts = [texts]
+    vectors = np.array([np.random.default_rng(zlib.crc32(t.encode())).normal(size=16) for t in texts])
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def make_corpus(section_count):
+    corpus = []
+    for i in range(section_count):
+        subsections = [
+            {'text': f'Paragraph {i}.{j} about topic {(i * j) % 7}', 'page_number': i + 1, 'filename': f'doc{i % 3}.pdf'}
+            for j in range(i % 4)
+        ]
+        corpus.append({
+            'filename': f'doc{i % 3}.pdf', 'page_number': i + 1, 'section_title': f'Section {i % 9}',
+            'text': f'Body of section {i}', 'subsections': subsections,
+        })
+    return corpus
+
+class TestStreamingRanker(unittest.TestCase):
+
+    @patch('app.ranking.engine.EmbeddingModel')
+    def test_streaming_matches_full_ranking(self, MockEmbeddingModel):
+        MockEmbeddingModel.return_value.get_embeddings.side_effect = fake_get_embeddings
+        ranking_engine = RankingEngine(model_path="/fake/path")
+        corpus = make_corpus(60)
+
+        expected = ranking_engine.rank("a query", copy.deepcopy(corpus), top_k=7, pool_size=15)
+
+        ranker = StreamingRanker(ranking_engine, "a query", pool_size=15, batch_size=10)
+        for start in range(0, len(corpus), 4):
+            ranker.add(copy.deepcopy(corpus[start:start + 4]))
+        self.assertEqual(ranker.finish(top_k=7), expected)
+        self.assertGreater(ranker.encode_batches, 5)
+        self.assertEqual(ranker.sections_seen, 60)
+
+    def test_background_iteration_preserves_order_and_errors(self):
+        self.assertEqual(list(iter_in_background(range(10), max_queued=2)), list(range(10)))
+
+        def failing():
+            yield 1
+            raise RuntimeError("parse failed")
+
+        stream = iter_in_background(failing(), max_queued=2)
+        self.assertEqual(next(stream), 1)
+        with self.assertRaises(RuntimeError):
+            next(stream)
+
+    def test_producer_stops_when_consumer_stops_early(self):
+        produced, closed = [], threading.Event()
+
+        def documents():
+            try:
+                for i in range(100):
+                    produced.append(i)
+                    yield i
+            finally:
+                closed.set()
+
+        stream = iter_in_background(documents(), max_queued=2)
+        self.assertEqual(next(stream), 0)
+        stream.close()
+        self.assertTrue(closed.wait(2))
+        self.assertLess(len(produced), 10)
+
+if __name__ == '__main__':
+    unittest.main()